@@ -1,15 +1,121 @@
 import urllib.parse
 import json
+import math
+import os
+import re
 from pathlib import Path
 
+BASE_URL = "https://www.carousell.sg/"
+# Parameters Carousell adds to track how a search was made; they don't change the results
+VOLATILE_PARAMS = {'searchId', 'addRecent', 't-search_query_source', 't-id', 't-referrer_request_id',
+                   't-referrer_page_type', 't-referrer_source', 'fbclid', 'gclid'}
+VOLATILE_PREFIXES = ('utm_',)
+# The ID at the end of a category path segment: "wardrobes-1285" or "1285"
+CATEGORY_ID_PATTERN = re.compile(r'(?:^|-)(\d+)$')
+
+
+def canonical_url(url):
+    """The search URL with tracking parameters dropped, the rest sorted and the category reduced to its ID.
+
+    URLs that return the same results map to the same string, e.g.
+    /categories/furniture-home-living-13/furniture-1283/wardrobes-1285/?searchId=aVphtg&search=wardrobe
+    and /categories/1285/?search=wardrobe&addRecent=true both become
+    /categories/1285/?search=wardrobe.
+    """
+    parsed_url = urllib.parse.urlsplit(url.strip())
+    path = parsed_url.path
+    path_parts = [part for part in path.split('/') if part]
+    if len(path_parts) > 1 and path_parts[0] == 'categories':
+        match = CATEGORY_ID_PATTERN.search(path_parts[-1])
+        if match:
+            path = f"/categories/{match.group(1)}/"
+    params = sorted((key, value) for key, value in urllib.parse.parse_qsl(parsed_url.query, keep_blank_values=True)
+                    if key not in VOLATILE_PARAMS and not key.startswith(VOLATILE_PREFIXES))
+    query = urllib.parse.urlencode(params, quote_via=urllib.parse.quote)
+    return urllib.parse.urlunsplit((parsed_url.scheme.lower(), parsed_url.netloc.lower(), path, query, ''))
+
+
+def search_item_url(search_item, base_url=BASE_URL):
+    """The canonical URL of the results page a search item loads."""
+    if 'full_url' in search_item:
+        return canonical_url(search_item['full_url'])
+
+    params = {
+        "search": search_item['query'],
+        "price_start": search_item.get('price_start'),
+        "price_end": search_item.get('price_end'),
+        "sort_by": search_item.get('sort_by'),
+    }
+
+    if search_item.get('tab') not in (None, 'all'):
+        params['tab'] = search_item['tab']
+
+    url = f"{base_url}categories/{search_item['category']}/"
+
+    # Encode the query parameters
+    encoded_params = urllib.parse.urlencode(
+        {k: v for k, v in params.items() if v is not None},
+        quote_via=urllib.parse.quote
+    )
+
+    if encoded_params:
+        url += f"?{encoded_params}"
+
+    return canonical_url(url)
+
 
 def parse_carousell_url(url):
     special_params = ["&t-search_query_source=ss_dropdown",
                       "&t-search_query_source=direct_search"]
+    canonical = canonical_url(url)
 
     if any(param in url for param in special_params):
-        return {"full_url": url}
+        return {"full_url": canonical}
+
+    parsed_item = parse_search_params(canonical)
 
+    # Check if all essential fields are parsed correctly
+    if parsed_item['category'] and parsed_item['query']:
+        return parsed_item
+    else:
+        return {"full_url": canonical}
+
+
+def find_similar_searches(search_items, search_item, base_url=BASE_URL):
+    """Configured searches that duplicate `search_item`, as (item, "identical" or "similar") pairs.
+
+    Identical searches load the same page once tracking parameters are
+    dropped. Similar ones look for the same text in the same category with
+    other sorting or price bounds.
+    """
+    url = search_item_url(search_item, base_url)
+    params = parse_search_params(url)
+    similar = []
+    for existing in search_items:
+        existing_url = search_item_url(existing, base_url)
+        if existing_url == url:
+            similar.append((existing, 'identical'))
+            continue
+        existing_params = parse_search_params(existing_url)
+        if (params['query'] and (existing_params['query'] or '').lower() == params['query'].lower()
+                and existing_params['category'] == params['category']):
+            similar.append((existing, 'similar'))
+    return similar
+
+
+def _as_number(value):
+    """'30' -> 30, '30.5' -> 30.5; None if missing or not a number."""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(number):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def parse_search_params(url):
+    """Category, query, sort order, price range and tab from a search URL, as far as they are present."""
     parsed_url = urllib.parse.urlparse(url)
     query_params = urllib.parse.parse_qs(parsed_url.query)
 
@@ -21,57 +127,92 @@ def parse_carousell_url(url):
         search_query = query_params.get('search', [None])[0]
     else:
         category = None
-        search_query = path_parts[1] if len(path_parts) > 1 else None
+        # /search/<query>/
+        if path_parts[0] == 'search' and len(path_parts) > 1:
+            search_query = urllib.parse.unquote(path_parts[1])
+        else:
+            search_query = query_params.get('search', [None])[0]
 
-    sort_by = query_params.get('sort_by', ['3'])[
-        0]  # Default to 3 if not present
+    sort_by = _as_number(query_params.get('sort_by', [None])[0])
 
     price_start = query_params.get('price_start', [None])[0]
     price_end = query_params.get('price_end', [None])[0]
 
     tab = query_params.get('tab', [None])[0]
 
-    parsed_item = {
+    return {
         "category": category,
         "query": search_query,
-        "sort_by": int(sort_by),
-        "price_start": int(price_start) if price_start else None,
-        "price_end": int(price_end) if price_end else None,
+        # Default to 3 if not present; a malformed value is ignored like a missing one
+        "sort_by": 3 if sort_by is None else sort_by,
+        "price_start": _as_number(price_start),
+        "price_end": _as_number(price_end),
         "tab": tab
     }
 
-    # Check if all essential fields are parsed correctly
-    if category and search_query:
-        return parsed_item
-    else:
-        return {"full_url": url}
+
+def write_config(config_file, config):
+    """Replace the config file in one step, so a running scraper never reads half of it."""
+    config_file = Path(config_file)
+    temp_path = config_file.with_name(f".{config_file.name}.tmp")
+    with open(temp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, config_file)
+
+
+def load_config(config_file):
+    with open(config_file, 'r') as f:
+        return json.load(f)
+
+
+def add_search_item(config_file, search_item):
+    config = load_config(config_file)
+    if 'SEARCH_ITEMS' not in config:
+        config['SEARCH_ITEMS'] = []
+    config['SEARCH_ITEMS'].append(search_item)
+    write_config(config_file, config)
 
 
 def add_search_item_from_url(config_file, url):
     search_item = parse_carousell_url(url)
+    add_search_item(config_file, search_item)
+    return search_item
 
-    with open(config_file, 'r+') as f:
-        config = json.load(f)
-        if 'SEARCH_ITEMS' not in config:
-            config['SEARCH_ITEMS'] = []
-        config['SEARCH_ITEMS'].append(search_item)
-        f.seek(0)
-        json.dump(config, f, indent=2)
-        f.truncate()
 
-    return search_item
+def confirm_despite_duplicates(config_file, search_item):
+    """Warn about configured searches like this one; True if it should be added anyway."""
+    config = load_config(config_file)
+    similar = find_similar_searches(config.get('SEARCH_ITEMS', []), search_item,
+                                    config.get('BASE_URL', BASE_URL))
+    if not similar:
+        return True
+    print("\nWarning: the config already has searches like this one:")
+    for existing, kind in similar:
+        description = existing.get('full_url') or f"{existing.get('query')} in category {existing.get('category')}"
+        if kind == 'identical':
+            print(f"  - {description} (same results page once tracking parameters are removed)")
+        else:
+            print(f"  - {description} (same search text and category, other sorting or price range)")
+    print("Add it anyway? (y/N)")
+    return input().strip().lower() in ('y', 'yes')
 
 
-def main():
+def main(url=None):
     config_file = Path(__file__).parent / 'config.json'
 
-    print("Welcome to the Carousell Search URL Adder!")
-    print("Please paste the Carousell search URL below:")
-
-    url = input().strip()
+    if url is None:
+        print("Welcome to the Carousell Search URL Adder!")
+        print("Please paste the Carousell search URL below:")
+        url = input().strip()
 
     try:
-        search_item = add_search_item_from_url(config_file, url)
+        search_item = parse_carousell_url(url)
+        if not confirm_despite_duplicates(config_file, search_item):
+            print("Search item not added.")
+            return
+        add_search_item(config_file, search_item)
         print("\nSearch item added successfully!")
         print("Details:")
         if "full_url" in search_item:
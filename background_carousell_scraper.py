@@ -13,10 +13,15 @@ bg_log_path = log_dir / "background_carousell_scraper.log"
 logging.basicConfig(filename=bg_log_path, level=logging.INFO,
                     format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Under scraper_supervisor.py the PID file holds the supervisor's PID, and
+# crashes are left to the supervisor to restart
+supervised = '--supervised' in sys.argv
+
 # Write PID to file
 pid_file = Path(__file__).parent / "carousell_scraper.pid"
-with open(pid_file, 'w') as f:
-    f.write(str(os.getpid()))
+if not supervised:
+    with open(pid_file, 'w') as f:
+        f.write(str(os.getpid()))
 
 logging.info(f"Background script started. PID: {os.getpid()}")
 
@@ -35,17 +40,15 @@ except Exception as e:
 if __name__ == '__main__':
     while True:
         try:
-            logging.info("Starting Carousell scraper iteration")
-            main()
-            logging.info("Finished Carousell scraper iteration")
-            # Sleep for 1 hour
-            logging.info("Sleeping for 1 hour")
-            for _ in range(60):  # Check every minute if we should continue
-                time.sleep(60)
-                if not os.path.exists(pid_file):
-                    logging.info("PID file not found. Exiting.")
-                    sys.exit(0)
+            logging.info("Starting Carousell scraper")
+            # main() schedules the searches itself and returns once it is
+            # stopped or the PID file has been removed
+            main(pid_file=pid_file)
+            logging.info("Carousell scraper stopped. Exiting.")
+            sys.exit(0)
         except Exception as e:
             logging.error(f"Error occurred: {str(e)}")
             logging.error(traceback.format_exc())
+            if supervised:
+                sys.exit(1)
             time.sleep(60)  # Wait for 1 minute before retrying
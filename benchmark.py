@@ -0,0 +1,307 @@
+"""End-to-end scraper benchmark against local Carousell and Telegram stand-ins.
+
+Runs ScraperApp.check_listings() with a real Chrome against recorded pages,
+then writes per-search and per-stage timings as JSON:
+
+    python benchmark.py --output bench.json
+    python benchmark.py --output new.json --baseline bench.json --threshold 0.25
+    python benchmark.py --compare-profiles
+    python benchmark.py --import-budget 150
+
+With --baseline, exits with status 1 if any tracked timing is more than
+`threshold` (as a fraction) slower than in the baseline run.
+--compare-profiles runs once with the full and once with the lean browser
+profile and reports the bytes and page-load time saved per search.
+--import-budget only times `import carousell_scraper` (with -X importtime)
+and exits with status 1 if it takes longer than the budget in milliseconds
+or pulls in a module that should only load once a search runs.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from carousell_stub_server import CarousellStubServer, DEFAULT_CORPUS
+from telegram_stub_server import TelegramStubServer
+
+REPO_DIR = Path(__file__).parent
+# Imported by carousell_scraper only when a browser, the bot or a spreadsheet is needed
+LAZY_MODULES = ('selenium', 'telebot', 'openpyxl', 'webdriver_manager', 'requests', 'psutil')
+
+# Timings compared against a baseline: (name in "stages", statistic)
+TRACKED = [
+    ('search_seconds', 'mean'),
+    ('page_load_seconds', 'mean'),
+    ('time_to_first_card_seconds', 'mean'),
+    ('time_to_stable_seconds', 'mean'),
+    ('card_extract_seconds', 'mean'),
+    ('telegram_send_seconds', 'mean'),
+    ('persist_seconds', 'mean'),
+]
+
+
+def build_config(workdir, site, telegram, repeat, extra):
+    search_items = []
+    for copy in range(repeat):
+        # Each copy gets its own URL, or the scraper would fetch the shared page only once
+        suffix = f"?copy={copy}" if copy else ""
+        search_items.extend({"full_url": site.page_url(name) + suffix} for name in site.pages)
+        # A query search exercises build_url against the stand-in's BASE_URL
+        search_items.append({"category": "5704", "query": "apple pencil", "sort_by": 3 + copy,
+                             "price_start": None, "price_end": None, "tab": None})
+    config = {
+        "TELEGRAM_BOT_TOKEN": "123:benchmark",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": telegram.api_url,
+        "TELEGRAM_RATE_PER_SECOND": 1000,
+        "TELEGRAM_BURST": 1000,
+        "TELEGRAM_DIGEST_THRESHOLD": 0,
+        "BASE_URL": site.base_url,
+        "DB_PATH": str(Path(workdir) / "benchmark.db"),
+        "EXCEL_PATH": str(Path(workdir) / "none.xlsx"),
+        "LOG_FILE": str(Path(workdir) / "benchmark.log"),
+        "SEARCH_ITEMS": search_items,
+        "RECORD_PAGE_BYTES": True,
+    }
+    config.update(extra)
+    return config
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(corpus, repeat, extra_config):
+    site = CarousellStubServer(corpus).start()
+    telegram = TelegramStubServer().start()
+    workdir = tempfile.mkdtemp(prefix="carousell-bench-")
+    previous_dir = os.getcwd()
+    try:
+        with open(Path(workdir) / "config.json", 'w') as f:
+            json.dump(build_config(workdir, site, telegram, repeat, extra_config), f, indent=2)
+        # Relative paths in the config, such as the image cache, land in the workdir
+        os.chdir(workdir)
+        sys.path.insert(0, str(REPO_DIR))
+        import carousell_scraper as scraper
+        app = scraper.ScraperApp()
+        scraper.metrics.reset()
+
+        start = time.perf_counter()
+        new_counts = app.check_listings()
+        scrape_seconds = time.perf_counter() - start
+        app.telegram_dispatcher.flush(timeout=120)
+        total_seconds = time.perf_counter() - start
+        app.close()
+
+        metrics = scraper.metrics
+        searches = []
+        for labels, values in metrics.series('search_seconds').items():
+            url = dict(labels)['search']
+            page_loads = metrics.values('page_load_seconds', search=url)
+            card_times = metrics.values('card_extract_seconds', search=url)
+            page_bytes = metrics.values('page_bytes', search=url)
+            first_card = metrics.values('time_to_first_card_seconds', search=url)
+            stable = metrics.values('time_to_stable_seconds', search=url)
+            searches.append({
+                'search': url,
+                'runs': len(values),
+                'wall_seconds': sum(values) / len(values),
+                'page_load_seconds': sum(page_loads) / len(page_loads) if page_loads else None,
+                'card_extract_ms': 1000 * sum(card_times) / len(card_times) if card_times else None,
+                'page_bytes': sum(page_bytes) / len(page_bytes) if page_bytes else None,
+                'time_to_first_card_seconds': sum(first_card) / len(first_card) if first_card else None,
+                'time_to_stable_seconds': sum(stable) / len(stable) if stable else None,
+            })
+        return {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'config': extra_config,
+            'searches_run': len(app.config['SEARCH_ITEMS']),
+            'failed_searches': sum(1 for count in (new_counts or []) if count is None),
+            'new_listings': int(metrics.counter('new_listings')),
+            'telegram_messages': len(telegram.messages()),
+            'webdriver_calls': int(metrics.counter('webdriver_calls')),
+            'bytes_served': site.bytes_served,
+            'scrape_seconds': scrape_seconds,
+            'total_seconds': total_seconds,
+            'stages': {name: metrics.summary(name) for name, _ in TRACKED + [('page_bytes', 'mean')]},
+            'searches': searches,
+        }
+    finally:
+        os.chdir(previous_dir)
+        site.stop()
+        telegram.stop()
+
+
+def find_regressions(result, baseline, threshold):
+    regressions = []
+    for name, statistic in TRACKED:
+        new = result['stages'].get(name, {}).get(statistic)
+        old = baseline.get('stages', {}).get(name, {}).get(statistic)
+        if new is None or not old:
+            continue
+        if new > old * (1 + threshold):
+            regressions.append(f"{name} {statistic}: {old * 1000:.1f} ms -> {new * 1000:.1f} ms "
+                               f"(+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def run_profile(args, lean):
+    """Run the benchmark in a fresh interpreter, so the two profiles share no Chrome or metrics."""
+    with tempfile.NamedTemporaryFile(suffix='.json', delete=False) as f:
+        output = f.name
+    command = [sys.executable, str(Path(__file__).resolve()), '--corpus', args.corpus,
+               '--repeat', str(args.repeat), '--output', output,
+               '--set', f'LEAN_BROWSER={json.dumps(lean)}']
+    for item in args.set:
+        command += ['--set', item]
+    try:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+
+def measure_import(runs=5):
+    """Best of `runs` cumulative import times of carousell_scraper (seconds), and the modules it loaded."""
+    best = None
+    for _ in range(runs):
+        # A fresh interpreter each time; -X importtime reports to stderr in microseconds
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import carousell_scraper'],
+                                cwd=REPO_DIR, capture_output=True, text=True, check=True)
+        modules = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if name.strip() == 'site' and not name.startswith('  '):
+                # Interpreter startup, not part of the import being timed
+                modules = {}
+                continue
+            modules[name.strip()] = int(cumulative) / 1e6
+        seconds = modules['carousell_scraper']
+        if best is None or seconds < best[0]:
+            best = (seconds, modules)
+    return best
+
+
+def check_import_budget(budget_ms, runs=5):
+    seconds, modules = measure_import(runs)
+    loaded = sorted(name for name in LAZY_MODULES if name in modules)
+    slowest = sorted(((name, value) for name, value in modules.items() if name != 'carousell_scraper'),
+                     key=lambda item: item[1], reverse=True)[:10]
+    print(json.dumps({
+        'import_ms': seconds * 1000,
+        'budget_ms': budget_ms,
+        'lazy_modules_loaded': loaded,
+        'slowest_ms': {name: value * 1000 for name, value in slowest},
+    }, indent=2))
+    failures = []
+    if seconds * 1000 > budget_ms:
+        failures.append(f"import carousell_scraper took {seconds * 1000:.0f} ms, budget {budget_ms:.0f} ms")
+    if loaded:
+        failures.append(f"import carousell_scraper loaded {', '.join(loaded)}")
+    for failure in failures:
+        print(failure)
+    return not failures
+
+
+def compare_profiles(full, lean):
+    """Per-search savings of the lean profile over the full one."""
+    lean_searches = {search['search']: search for search in lean['searches']}
+    savings = []
+    for search in full['searches']:
+        other = lean_searches.get(search['search'])
+        if not other:
+            continue
+        saving = {'search': search['search']}
+        for key in ('page_bytes', 'page_load_seconds', 'wall_seconds'):
+            if search.get(key) is not None and other.get(key) is not None:
+                saving[f'{key}_full'] = search[key]
+                saving[f'{key}_lean'] = other[key]
+                saving[f'{key}_saved'] = search[key] - other[key]
+        savings.append(saving)
+
+    def mean_saved(key):
+        values = [saving[key] for saving in savings if key in saving]
+        return sum(values) / len(values) if values else None
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'bytes_saved_per_search': mean_saved('page_bytes_saved'),
+        'page_load_seconds_saved_per_search': mean_saved('page_load_seconds_saved'),
+        'searches': savings,
+        'full': full,
+        'lean': lean,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', default=str(DEFAULT_CORPUS), help="directory of recorded .html pages")
+    parser.add_argument('--repeat', type=int, default=2, help="times each page is searched")
+    parser.add_argument('--output', help="write results JSON here")
+    parser.add_argument('--baseline', help="previous results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="allowed slowdown, e.g. 0.25 = 25%%")
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=JSON',
+                        help="override a config value, e.g. --set EXTRACTION_MODE='\"bulk\"'")
+    parser.add_argument('--compare-profiles', action='store_true',
+                        help="run with the full and the lean browser profile and report the savings")
+    parser.add_argument('--import-budget', type=float, metavar='MS',
+                        help="only check that importing carousell_scraper stays within MS milliseconds")
+    args = parser.parse_args()
+
+    if args.import_budget is not None:
+        if not check_import_budget(args.import_budget):
+            sys.exit(1)
+        print("Import within budget.")
+        return
+
+    if args.compare_profiles:
+        result = compare_profiles(run_profile(args, lean=False), run_profile(args, lean=True))
+        output = json.dumps(result, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output)
+        print(output)
+        print(f"Saved per search: {(result['bytes_saved_per_search'] or 0) / 1024:.1f} KiB, "
+              f"{result['page_load_seconds_saved_per_search'] or 0:.2f} s page load")
+        return
+
+    extra_config = {}
+    for item in args.set:
+        key, _, value = item.partition('=')
+        extra_config[key] = json.loads(value)
+
+    result = run_benchmark(args.corpus, args.repeat, extra_config)
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(result, baseline, args.threshold)
+        if regressions:
+            print("Regressions beyond threshold:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("No regressions beyond threshold.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""Reads listing cards out of a live Chrome page over WebDriver.
+
+This is the part of the scraper that needs Selenium, so carousell_scraper
+only imports it once a search actually opens a browser.
+"""
+import logging
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
+from listing_parser import (
+    PRICE_XPATHS, TIME_XPATHS, IMAGE_SELECTORS, CONDITION_TYPES, LISTING_CARD_XPATH,
+    TITLE_MAX_LINE_XPATH, TITLE_IN_LINK_XPATH, TITLE_NESTED_XPATH, TITLE_CANDIDATES_XPATH,
+    SELLER_XPATH)
+from selector_cache import FixedOrder
+
+# carousell_scraper configures this logger
+logger = logging.getLogger('carousell_scraper')
+
+
+def log(message, *args, level=logging.INFO, **fields):
+    if logger.isEnabledFor(level):
+        logger.log(level, message, *args, extra={'fields': fields} if fields else None)
+
+
+PRICE_SELECTORS = [(By.XPATH, xpath) for xpath in PRICE_XPATHS]
+TIME_SELECTORS = [(By.XPATH, xpath) for xpath in TIME_XPATHS]
+# Tries every strategy in its listed order, for callers without a SelectorCache
+FIXED_ORDER = FixedOrder()
+
+
+def extract_text_content(element):
+    return element.text.strip() if element else 'Not found'
+
+
+def find_element_by_text(driver, text):
+    try:
+        return driver.find_element(By.XPATH, f"//p[contains(text(), '{text}')]")
+    except NoSuchElementException:
+        return None
+
+
+def find_element_by_text_in_card(card, text):
+    try:
+        return card.find_element(By.XPATH, f".//p[contains(text(), '{text}')]")
+    except NoSuchElementException:
+        return None
+
+
+def find_by_xpath(context, xpath):
+    try:
+        return context.find_element(By.XPATH, xpath)
+    except NoSuchElementException:
+        return None
+
+
+def xpath_strategies(card, xpaths):
+    # Named by the XPath itself, so the learned order follows edits to the lists
+    return [(xpath, lambda xpath=xpath: find_by_xpath(card, xpath)) for xpath in xpaths]
+
+
+def find_image(card, selectors=FIXED_ORDER, layout=None):
+    # The last selector matches any image and is only tried once the others missed
+    return selectors.first(layout, 'image', xpath_strategies(card, IMAGE_SELECTORS), fallbacks=1)
+
+
+def title_strategies(card):
+    def in_second_link():
+        # The first <a> is usually the seller link
+        links = card.find_elements(By.TAG_NAME, "a")
+        return find_by_xpath(links[1], TITLE_IN_LINK_XPATH) if len(links) > 1 else None
+
+    def longest_text():
+        # Excluding the seller name and price
+        elements = card.find_elements(By.XPATH, TITLE_CANDIDATES_XPATH)
+        if not elements:
+            return None
+        return max(elements, key=lambda e: len(e.text) if not (e.text.startswith('S$') or e.get_attribute('data-testid') == 'listing-card-text-seller-name') else 0)
+
+    return [
+        # The <p> element with multiple 'D_' classes and --max-line style
+        ('max_line', lambda: find_by_xpath(card, TITLE_MAX_LINE_XPATH)),
+        ('second_link', in_second_link),
+        # The first <p> with multiple 'D_' classes within an <a> tag
+        ('nested_link', lambda: find_by_xpath(card, TITLE_NESTED_XPATH)),
+        ('longest_text', longest_text),
+    ]
+
+
+def find_title_dynamically(card, selectors=FIXED_ORDER, layout=None):
+    return selectors.first(layout, 'title', title_strategies(card), fallbacks=1)
+
+
+def card_layout(card):
+    """The card's class names, which change whenever Carousell rebuilds its obfuscated styles."""
+    return ' '.join(sorted((card.get_attribute('class') or '').split())) or 'unknown'
+
+
+def analyze_listing_card(card, html_capture, selectors=FIXED_ORDER, layout=None):
+    # Log the entire card HTML for debugging
+    if html_capture.enabled():
+        log("Card HTML: %s", card.get_attribute('outerHTML'), event='card_html')
+
+    # Find title dynamically
+    title_element = find_title_dynamically(card, selectors, layout)
+
+    # Log the found title element for debugging
+    if logger.isEnabledFor(logging.DEBUG):
+        log("Debug - Raw title element: %s", title_element, level=logging.DEBUG)
+        log("Debug - Raw title text: %s", title_element.text if title_element else 'Not found', level=logging.DEBUG)
+
+    # The class-based selectors go first; the text matches are the fallbacks
+    price = selectors.first(layout, 'price', xpath_strategies(card, PRICE_XPATHS), fallbacks=1)
+    seller_name = card.find_element(By.XPATH, SELLER_XPATH)
+    time = selectors.first(layout, 'time', xpath_strategies(card, TIME_XPATHS), fallbacks=1)
+
+    # Each card has its own condition, so the most common ones are simply tried first
+    condition = selectors.first(layout, 'condition', [
+        (condition_type, lambda condition_type=condition_type: find_element_by_text_in_card(card, condition_type))
+        for condition_type in CONDITION_TYPES], sticky=False)
+
+    listing_id = card.get_attribute('data-testid').replace('listing-card-', '')
+    image = find_image(card, selectors, layout)
+
+    return {
+        'id': listing_id,
+        'title': title_element.text if title_element else 'Not found',
+        'price': extract_text_content(price),
+        'seller_name': extract_text_content(seller_name),
+        'time': extract_text_content(time),
+        'condition': extract_text_content(condition),
+        'image_url': image.get_attribute('src') if image else 'Not found',
+        'href': f"https://www.carousell.sg/p/{listing_id}"
+    }
+
+
+# Mirrors analyze_listing_card in the page so a whole result page is read in a
+# single WebDriver round-trip. The selector lists are passed in from Python so
+# both paths always try the same fallbacks in the same order.
+BULK_EXTRACT_JS = """
+const [cardXpath, limit, priceXpaths, timeXpaths, imageXpaths, conditionTypes,
+       titleMaxLineXpath, titleInLinkXpath, titleNestedXpath, titleCandidatesXpath, sellerXpath] = arguments;
+
+function first(context, xpath) {
+    return document.evaluate(xpath, context, null,
+        XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+}
+
+function all(context, xpath) {
+    const result = document.evaluate(xpath, context, null,
+        XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+    const nodes = [];
+    for (let i = 0; i < result.snapshotLength; i++) {
+        nodes.push(result.snapshotItem(i));
+    }
+    return nodes;
+}
+
+function firstOf(context, xpaths) {
+    for (const xpath of xpaths) {
+        const element = first(context, xpath);
+        if (element) return element;
+    }
+    return null;
+}
+
+function text(element) {
+    return element ? (element.innerText || '').trim() : 'Not found';
+}
+
+function findTitle(card) {
+    let element = first(card, titleMaxLineXpath);
+    if (element) return element;
+
+    const links = card.getElementsByTagName('a');
+    if (links.length > 1) {
+        element = first(links[1], titleInLinkXpath);
+        if (element) return element;
+    }
+
+    element = first(card, titleNestedXpath);
+    if (element) return element;
+
+    let best = null;
+    let bestLength = -1;
+    for (const candidate of all(card, titleCandidatesXpath)) {
+        const candidateText = candidate.innerText || '';
+        const length = (candidateText.startsWith('S$') ||
+            candidate.getAttribute('data-testid') === 'listing-card-text-seller-name') ? 0 : candidateText.length;
+        if (length > bestLength) {
+            best = candidate;
+            bestLength = length;
+        }
+    }
+    return best;
+}
+
+return all(document, cardXpath).slice(0, limit).map((card) => {
+    let condition = null;
+    for (const conditionType of conditionTypes) {
+        condition = first(card, `.//p[contains(text(), '${conditionType}')]`);
+        if (condition) break;
+    }
+    const image = firstOf(card, imageXpaths);
+    return {
+        id: card.getAttribute('data-testid').replace('listing-card-', ''),
+        title: text(findTitle(card)),
+        price: text(firstOf(card, priceXpaths)),
+        seller_name: text(first(card, sellerXpath)),
+        time: text(firstOf(card, timeXpaths)),
+        condition: text(condition),
+        image_url: image ? image.src : 'Not found',
+    };
+});
+"""
+
+
+def extract_listing_cards_bulk(driver, limit):
+    cards = driver.execute_script(
+        BULK_EXTRACT_JS, LISTING_CARD_XPATH, limit,
+        [selector for _, selector in PRICE_SELECTORS],
+        [selector for _, selector in TIME_SELECTORS],
+        IMAGE_SELECTORS, CONDITION_TYPES,
+        TITLE_MAX_LINE_XPATH, TITLE_IN_LINK_XPATH, TITLE_NESTED_XPATH, TITLE_CANDIDATES_XPATH, SELLER_XPATH)
+    if not isinstance(cards, list):
+        raise WebDriverException(
+            f"Bulk extraction returned {type(cards).__name__}, expected a list")
+
+    return [{
+        'id': card['id'],
+        'title': card['title'],
+        'price': card['price'],
+        'seller_name': card['seller_name'],
+        'time': card['time'],
+        'condition': card['condition'],
+        'image_url': card['image_url'],
+        'href': f"https://www.carousell.sg/p/{card['id']}"
+    } for card in cards]
+
+
+def extract_listings_per_element(listing_cards, html_capture, selector_cache=None):
+    """Analyze each card over WebDriver, trying the selectors `selector_cache` has
+    learned for this layout first (or every selector in order without one)."""
+    listings = []
+    selectors, layout = FIXED_ORDER, None
+    if selector_cache is not None and listing_cards:
+        # One extra round-trip per page, for the first card only
+        selectors, layout = selector_cache, card_layout(listing_cards[0])
+    for index, card in enumerate(listing_cards):
+        log("Processing listing %d...", index + 1, level=logging.DEBUG)
+        try:
+            listings.append(analyze_listing_card(card, html_capture, selectors, layout))
+        except Exception as e:
+            log(f"Error processing listing: {str(e)}", level=logging.WARNING)
+            if html_capture.enabled(failure=True):
+                log("Listing HTML: %s", card.get_attribute('outerHTML'), event='card_html')
+    return listings
+
+
+def find_listing_cards(driver):
+    return driver.find_elements(By.XPATH, LISTING_CARD_XPATH)
+
+
+def build_chrome_options(headless=False, lean=False, page_load_strategy='normal'):
+    chrome_options = Options()
+    chrome_options.add_argument("--no-sandbox")
+    chrome_options.add_argument("--disable-dev-shm-usage")
+    if headless:
+        chrome_options.add_argument("--headless=new")
+        chrome_options.add_argument("--window-size=1280,2000")
+    if lean:
+        # Images are never displayed; the img src attribute is still in the DOM
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    chrome_options.page_load_strategy = page_load_strategy
+    return chrome_options
+
+
+def count_webdriver_calls(driver, metrics):
+    # Every command, including WebElement lookups, goes through driver.execute
+    execute = driver.execute
+
+    def counted_execute(driver_command, params=None):
+        metrics.increment('webdriver_calls', command=driver_command)
+        return execute(driver_command, params)
+
+    driver.execute = counted_execute
+
+
+def block_urls(driver, patterns):
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": patterns})
+        log(f"Blocking {len(patterns)} URL patterns in Chrome.")
+    except WebDriverException as e:
+        log(f"Could not set blocked URLs: {str(e)}", level=logging.WARNING)
+
+
+def page_bytes(driver):
+    # Bytes actually transferred for the page and its subresources; blocked requests never appear
+    return driver.execute_script(
+        "return performance.getEntriesByType('navigation')"
+        ".concat(performance.getEntriesByType('resource'))"
+        ".reduce((total, entry) => total + (entry.transferSize || 0), 0);") or 0
+
+
+CARD_IDS_JS = """
+return arguments[0].map(card => (card.getAttribute('data-testid') || '').replace('listing-card-', ''));
+"""
+SHOW_MORE_XPATH = "//button[contains(normalize-space(.), 'Show more')]"
+
+
+def read_card_ids(driver, listing_cards):
+    # One round-trip for every card's ID, before any card is analyzed
+    return driver.execute_script(CARD_IDS_JS, listing_cards)
+
+
+def load_more_cards(driver, card_count, wait=10):
+    """Click "Show more results", or scroll to the bottom if there is no button.
+
+    Returns True once more than card_count cards are on the page.
+    """
+    buttons = driver.find_elements(By.XPATH, SHOW_MORE_XPATH)
+    if buttons:
+        # A script click is not intercepted by sticky banners covering the button
+        driver.execute_script("arguments[0].click();", buttons[0])
+    else:
+        driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+    try:
+        WebDriverWait(driver, wait).until(
+            lambda d: len(d.find_elements(By.XPATH, LISTING_CARD_XPATH)) > card_count)
+        return True
+    except TimeoutException:
+        return False
@@ -1,463 +1,977 @@
+"""Searches Carousell on a schedule and sends new listings to Telegram.
+
+    python -m carousell_scraper [run]        search until stopped
+    python -m carousell_scraper once         run every search once, then exit
+    python -m carousell_scraper status       whether the background scraper is running
+    python -m carousell_scraper add-url      add a search from a Carousell URL
+    python -m carousell_scraper export       write the listing database to a spreadsheet
+
+Importing this module does nothing by itself: ScraperApp reads the config
+and sets up logging, the Telegram bot and signal handlers when it is
+created. Selenium and telebot are only imported once something needs them.
+"""
+import argparse
 import time
 import json
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, WebDriverException
-import telebot
-import openpyxl
-from openpyxl import Workbook, load_workbook
 import os
 import traceback
-import urllib.parse
-import time
 import signal
 import logging
+import re
+import sys
+import threading
 from datetime import datetime
-from collections import Counter
-
-# Global flag to control the main loop
-running = True
-
-# Set up logging
-logging.basicConfig(filename='carousell_scraper.log', level=logging.INFO,
-                    format='%(asctime)s - %(levelname)s - %(message)s')
-
-
-def signal_handler(signum, frame):
-    global running
-    print("\nReceived signal to stop. Finishing current iteration and then stopping...")
-    running = False
-
-
-# Register the signal handler
-signal.signal(signal.SIGINT, signal_handler)
-
-step_counter = 0
-
-
-def log(message):
-    global step_counter
-    step_counter += 1
-    log_message = f"[Step {step_counter}]: {message}"
-    print(log_message)
-    logging.info(log_message)
-
-
-# Load configuration
-
-
-def load_config():
-    log("Loading configuration...")
-    try:
-        with open('config.json', 'r') as f:
-            config = json.load(f)
-            log("Configuration loaded successfully.")
-            return config
-    except FileNotFoundError:
-        log("Configuration file not found. Please create a config.json file.")
-        sys.exit(1)
-    except json.JSONDecodeError:
-        log("Error decoding JSON from config file. Please check the format.")
-        sys.exit(1)
-
-
-config = load_config()
-# Default to 48 if not specified
-MAX_LISTINGS = config.get('MAX_LISTINGS_TO_SCRAPE', 48)
-
-# Initialize the Telegram bot
-log("Initializing Telegram bot...")
-try:
-    bot = telebot.TeleBot(config['TELEGRAM_BOT_TOKEN'])
-    log("Telegram bot initialized successfully.")
-except Exception as e:
-    log(f"Error initializing Telegram bot: {str(e)}")
-    bot = None
-
-
-def send_telegram_message(message):
-    if bot:
+from concurrent.futures import ThreadPoolExecutor
+from listing_store import ListingStore, EXCEL_PATH as DEFAULT_EXCEL_PATH
+from listing_journal import ListingJournal
+from telegram_dispatcher import TelegramDispatcher, send_photos
+from image_cache import MB, ImageCache, ImageFetcher
+from search_scheduler import SearchScheduler, search_key, search_name
+from config_watcher import ConfigError, ConfigWatcher, read_config, validate_search_items
+from listing_matcher import ListingMatcher, compile_matchers
+from selector_cache import SelectorCache
+from add_search_url import search_item_url
+from scraper_logging import setup_logging, HtmlCapture
+from scraper_metrics import metrics, MetricsServer
+from page_readiness import AdaptiveTimeout, wait_for_listings
+from embedded_state import HttpPageFetcher, StateSchemaError, parse_state_listings
+from listing_parser import LISTING_CARD_XPATH, LISTINGS_CONTAINER_XPATH, parse_listing_page
+
+CONFIG_FILE = 'config.json'
+LOGGER_NAME = 'carousell_scraper'
+
+# Settings a running scraper picks up from an edited config; the rest need a restart
+RELOADABLE_KEYS = {'SEARCH_ITEMS', 'EXCLUDE_SELLERS', 'SEARCH_INTERVAL', 'MIN_SEARCH_INTERVAL',
+                   'MAX_SEARCH_INTERVAL', 'BASE_URL', 'TELEGRAM_CHAT_ID'}
+DEFAULT_BLOCKED_URL_PATTERNS = [
+    "*.woff", "*.woff2", "*.ttf", "*.otf",
+    "*googletagmanager.com*", "*google-analytics.com*", "*doubleclick.net*",
+    "*googlesyndication.com*", "*googleadservices.com*", "*facebook.net*",
+    "*connect.facebook.com*", "*hotjar.com*", "*branch.io*", "*criteo*",
+    "*adnxs.com*", "*scorecardresearch.com*", "*tiktok.com*",
+]
+
+
+def find_new_cards(card_ids, known_ids, stop_after=3):
+    """Walk card IDs newest first, collecting unseen ones.
+
+    Returns (new IDs, number of cards up to the last new one, caught_up).
+    A single seen card is not enough to stop: bumped and promoted listings
+    show up among new ones, so it takes `stop_after` seen cards in a row.
+    """
+    new_ids = []
+    scan_limit = 0
+    seen_run = 0
+    for index, card_id in enumerate(card_ids):
+        if card_id in known_ids:
+            seen_run += 1
+            if seen_run >= stop_after:
+                return new_ids, scan_limit, True
+        else:
+            seen_run = 0
+            new_ids.append(card_id)
+            scan_limit = index + 1
+    return new_ids, scan_limit, False
+
+
+def save_page_to_corpus(corpus_dir, page_source, listings):
+    os.makedirs(corpus_dir, exist_ok=True)
+    name = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    with open(os.path.join(corpus_dir, f"{name}.html"), 'w', encoding='utf-8') as f:
+        f.write(page_source)
+    with open(os.path.join(corpus_dir, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(listings, f, indent=2, ensure_ascii=False)
+    return name
+
+
+class ScraperApp:
+    """The scraper's config and everything built from it.
+
+    Creating one reads the config file, sets up logging and creates the
+    Telegram bot, the message dispatcher and the image fetcher. run() adds
+    the signal handlers and searches until stopped; check_listings() runs a
+    set of searches once.
+    """
+
+    def __init__(self, config_file=CONFIG_FILE):
+        self.config_file = config_file
+        self.running = True
+        # Set up logging with defaults until the config has been read
+        self.logger = setup_logging(LOGGER_NAME, 'carousell_scraper.log')
+        self.config = config = self.load_config()
+        self.logger = setup_logging(LOGGER_NAME, config.get('LOG_FILE', 'carousell_scraper.log'),
+                                    level=config.get('LOG_LEVEL', 'INFO'),
+                                    max_bytes=config.get('LOG_MAX_BYTES', 5 * 1024 * 1024),
+                                    backup_count=config.get('LOG_BACKUP_COUNT', 5))
+        # Debug HTML dumps cost an extra WebDriver round-trip each: "off", "failures", "sample" or "all"
+        self.html_capture = HtmlCapture(config.get('HTML_CAPTURE', 'off'),
+                                        config.get('HTML_CAPTURE_SAMPLE_RATE', 0.01))
+        # Default to 48 if not specified
+        self.max_listings = config.get('MAX_LISTINGS_TO_SCRAPE', 48)
+        # Watermark mode: read card IDs first, stop at a run of already-seen IDs and
+        # analyze only the new cards, loading more results until the watermark is reached
+        self.watermark_mode = config.get('WATERMARK_MODE', False)
+        self.watermark_stop_after = max(1, config.get('WATERMARK_STOP_AFTER', 3))
+        self.watermark_max_pages = max(1, config.get('WATERMARK_MAX_PAGES', 3))
+        # Seconds to wait for more cards after clicking "Show more results" or scrolling
+        self.pagination_wait = config.get('PAGINATION_WAIT', 10)
+        # "html" (parse one page_source snapshot), "bulk" (one injected script per page),
+        # "element" (one WebDriver call per field), "state" (the page's embedded JSON
+        # state, else "html") or "compare" (run them all, log differences and timings,
+        # keep the per-element result)
+        self.extraction_mode = config.get('EXTRACTION_MODE', 'html')
+        # "browser", or "http" to read embedded state over plain HTTP and only open
+        # Chrome for pages without usable state
+        self.fetch_mode = config.get('FETCH_MODE', 'browser')
+        # SQLite store of seen listings; the workbook is only read once to migrate it
+        self.db_path = config.get('DB_PATH', 'carousell_listings.db')
+        self.excel_path = config.get('EXCEL_PATH', 'carousell_listings.xlsx')
+        # On-disk index of seen listing IDs in front of the database; IDs, and the
+        # per-search record of analyzed cards, are forgotten after SEEN_TTL_DAYS (null keeps them)
+        self.seen_index = config.get('SEEN_INDEX', True)
+        self.seen_ttl_days = config.get('SEEN_TTL_DAYS', 180)
+        # New listings are fsync'd to this journal before they are announced and
+        # copied into the database every JOURNAL_COMPACT_EVERY listings and after
+        # each round of searches; null writes straight to the database instead
+        self.journal_path = config.get('JOURNAL_PATH', 'carousell_listings.journal')
+        self.journal_compact_every = config.get('JOURNAL_COMPACT_EVERY', 50)
+        # Seconds between refreshes of the EXCEL_PATH spreadsheet from the database,
+        # skipped when nothing new was stored; null leaves it to "listing_store.py export-xlsx"
+        self.excel_export_interval = config.get('EXCEL_EXPORT_INTERVAL', 3600)
+        # Number of Chrome instances searches are spread across
+        self.max_parallel_browsers = max(1, config.get('MAX_PARALLEL_BROWSERS', 1))
+        # Seconds before driver.get gives up on a page, so one hung search frees its browser
+        self.page_load_timeout = config.get('PAGE_LOAD_TIMEOUT', 90)
+        # Recycle a Chrome session between searches once it uses CHROME_MAX_RSS_MB,
+        # has served CHROME_MAX_PAGES searches or is CHROME_MAX_AGE_HOURS old; null turns a limit off
+        self.chrome_max_rss_mb = config.get('CHROME_MAX_RSS_MB', 1024)
+        self.chrome_max_pages = config.get('CHROME_MAX_PAGES', 500)
+        self.chrome_max_age_hours = config.get('CHROME_MAX_AGE_HOURS', 24)
+        # Lean profile: no images or fonts, third-party scripts blocked, eager page loads
+        self.lean_browser = config.get('LEAN_BROWSER', False)
+        self.headless = config.get('HEADLESS', self.lean_browser)
+        self.page_load_strategy = config.get('PAGE_LOAD_STRATEGY', 'eager' if self.lean_browser else 'normal')
+        self.blocked_url_patterns = config.get('BLOCKED_URL_PATTERNS',
+                                               DEFAULT_BLOCKED_URL_PATTERNS if self.lean_browser else [])
+        # Measure transferred bytes per page (one extra script call per search); used by benchmark.py
+        self.record_page_bytes = config.get('RECORD_PAGE_BYTES', False)
+        # Readiness: cards must stop changing for READY_QUIET_SECONDS; the timeout is
+        # learned per search from recent load times, within READY_MIN/MAX_TIMEOUT
+        self.ready_quiet_seconds = config.get('READY_QUIET_SECONDS', 0.75)
+        self.ready_empty_quiet_seconds = config.get('READY_EMPTY_QUIET_SECONDS', 3)
+        self.ready_max_timeout = config.get('READY_MAX_TIMEOUT', 90)
+        self.readiness_timeouts = AdaptiveTimeout(config.get('READY_TIMEOUT', 45),
+                                                  config.get('READY_MIN_TIMEOUT', 10), self.ready_max_timeout)
+        # Seconds between checks of config.json for edits; null turns hot reloading off
+        self.config_reload_interval = config.get('CONFIG_RELOAD_INTERVAL', 5)
+        # Local HTTP endpoint with /metrics (Prometheus) and /metrics.json; null turns it off
+        self.metrics_host = config.get('METRICS_HOST', '127.0.0.1')
+        self.metrics_port = config.get('METRICS_PORT', 9178)
+        # Worker processes for parsing large pages in "html" mode; 0 parses in-process
+        self.parse_processes = config.get('PARSE_PROCESSES', 0)
+        # In "compare" mode, save each page and its per-element result here for offline re-parsing
+        self.page_corpus_dir = config.get('PAGE_CORPUS_DIR')
+        # Per-element extraction tries the selectors that worked on this card layout first,
+        # learned in SELECTOR_STATS_FILE; null tries every fallback in its fixed order
+        self.selector_stats_file = config.get('SELECTOR_STATS_FILE', 'selector_stats.json')
+        self.selector_cache = (SelectorCache(self.selector_stats_file, log=self.log, metrics=metrics)
+                               if self.selector_stats_file else None)
+
+        self.bot = self.create_bot()
+        # Listing photos: thumbnails download on a thread pool into a size-capped
+        # cache and go out with the messages, bursts as albums of up to 10
+        self.telegram_photos = config.get('TELEGRAM_PHOTOS', False)
+        self.image_fetcher = ImageFetcher(
+            ImageCache(config.get('IMAGE_CACHE_DIR', 'image_cache'),
+                       max_bytes=config.get('IMAGE_CACHE_MAX_MB', 100) * MB),
+            pool_size=config.get('IMAGE_FETCH_THREADS', 8),
+            timeout=config.get('IMAGE_FETCH_TIMEOUT', 10),
+            log=self.log) if self.telegram_photos else None
+        # Sends happen on a background thread so the scrape loop never waits on Telegram
+        self.telegram_dispatcher = TelegramDispatcher(
+            self.deliver_telegram_message,
+            rate=config.get('TELEGRAM_RATE_PER_SECOND', 1.0),
+            burst=config.get('TELEGRAM_BURST', 3),
+            digest_threshold=config.get('TELEGRAM_DIGEST_THRESHOLD', 5),
+            digest_size=config.get('TELEGRAM_DIGEST_SIZE', 10),
+            log=self.log,
+            send_album=self.deliver_telegram_photos if self.image_fetcher else None,
+            on_done=self.notifications_done)
+
+        # Seller usernames ignored by every search, on top of each item's "exclude_sellers"
+        self.exclude_sellers = config.get('EXCLUDE_SELLERS', [])
+        # Compiled once here; get_matcher() compiles items that are not in the config
+        self.matchers = compile_matchers(config.get('SEARCH_ITEMS', []), self.exclude_sellers)
+        # Created on first use in "http" fetch mode; shared by the search threads
+        self.http_fetcher = None
+        self.http_fetcher_lock = threading.Lock()
+        # Opened with the listing store
+        self.listing_journal = None
+
+    def log(self, message, *args, level=logging.INFO, **fields):
+        # %-style args are only formatted if the record is actually emitted, so
+        # debug calls in the card loop cost a level check when debug is off.
+        # Keyword arguments become fields of the JSON log line.
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, message, *args, extra={'fields': fields} if fields else None)
+
+    def load_config(self):
+        self.log("Loading configuration...")
+        if not os.path.exists(self.config_file):
+            raise ConfigError(f"Configuration file {self.config_file} not found. Please create a config.json file.")
+        try:
+            config = read_config(self.config_file)
+        except ConfigError as e:
+            raise ConfigError(f"Error reading config file: {str(e)}. Please check the format.") from e
+        self.log("Configuration loaded successfully.")
+        return config
+
+    def install_signal_handlers(self):
+        # SIGTERM is how scraper_supervisor.py asks the scraper to stop
+        signal.signal(signal.SIGINT, self.signal_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+
+    def signal_handler(self, signum, frame):
+        print("\nReceived signal to stop. Finishing current iteration and then stopping...")
+        self.running = False
+
+    def create_bot(self):
+        self.log("Initializing Telegram bot...")
         try:
-            log(f"Sending Telegram message: {message}")
-            bot.send_message(config['TELEGRAM_CHAT_ID'], message)
-            log("Telegram message sent successfully.")
+            import telebot
+
+            if self.config.get('TELEGRAM_API_URL'):
+                # e.g. telegram_stub_server.py for offline runs
+                telebot.apihelper.API_URL = self.config['TELEGRAM_API_URL']
+            bot = telebot.TeleBot(self.config['TELEGRAM_BOT_TOKEN'])
+            self.log("Telegram bot initialized successfully.")
+            return bot
         except Exception as e:
-            log(f"Error sending Telegram message: {str(e)}")
-    else:
-        log("Telegram bot not initialized. Message not sent.")
-
-
-def load_existing_ids(excel_path):
-    log(f"Loading existing IDs from Excel file: {excel_path}")
-    try:
-        if os.path.exists(excel_path):
-            log("Excel file found. Loading existing IDs...")
-            workbook = load_workbook(excel_path)
-            sheet = workbook.active
-            existing_ids = {sheet.cell(
-                row=row, column=1).value for row in range(2, sheet.max_row + 1)}
-            log(f"Loaded {len(existing_ids)} existing IDs.")
+            self.log(f"Error initializing Telegram bot: {str(e)}")
+            return None
+
+    def deliver_telegram_message(self, message):
+        self.log("Sending Telegram message: %s", message, level=logging.DEBUG)
+        with metrics.timer('telegram_send_seconds'):
+            self.bot.send_message(self.config['TELEGRAM_CHAT_ID'], message)
+        self.log("Telegram message sent successfully.", level=logging.DEBUG)
+
+    def deliver_telegram_photos(self, photos):
+        self.log("Sending %d listings with photos.", len(photos), level=logging.DEBUG)
+        with metrics.timer('telegram_send_seconds'):
+            send_photos(self.bot, self.config['TELEGRAM_CHAT_ID'], photos)
+        metrics.increment('telegram_photos_sent', len(photos))
+
+    def notifications_done(self, listing_ids):
+        if self.listing_journal is not None:
+            self.listing_journal.done(listing_ids)
+
+    def send_telegram_message(self, message, image_url=None, listing_id=None):
+        if self.bot:
+            image = None
+            if self.image_fetcher is not None and image_url and image_url.startswith(('http://', 'https://')):
+                # Starts downloading now; the dispatcher waits for it only when the message's turn comes
+                image = self.image_fetcher.prefetch(image_url)
+            self.telegram_dispatcher.enqueue(message, image, key=listing_id)
         else:
-            log("Excel file not found. Creating a new workbook...")
-            workbook = Workbook()
-            sheet = workbook.active
-            sheet.append(["Listing ID", "Href", "Seller", "Time Posted",
-                         "Product Details", "Price", "Condition", "Image URL"])
-            existing_ids = set()
-            workbook.save(excel_path)
-            log("New Excel file created and saved.")
-        return existing_ids, workbook, sheet
-    except Exception as e:
-        log(f"Error handling Excel file: {str(e)}")
-        return set(), Workbook(), Workbook().active
-
-
-def save_to_excel(data, excel_path, sheet):
-    try:
-        log(f"Saving {len(data)} new listings to Excel...")
-        for listing in data:
-            sheet.append(listing)
-        sheet.parent.save(excel_path)
-        log("Excel file updated and saved successfully.")
-    except PermissionError:
-        log(f"Error: Permission denied when trying to save to {excel_path}")
-        log("Please ensure the file is not open in another program and that you have write permissions.")
-        alternative_path = os.path.join(os.path.expanduser(
-            "~"), "Desktop", "carousell_listings.xlsx")
-        log(f"Attempting to save to alternative location: {alternative_path}")
+            self.log("Telegram bot not initialized. Message not sent.")
+
+    def open_listing_store(self):
+        listing_store = ListingStore(self.db_path, seen_index=self.seen_index,
+                                     seen_ttl=self.seen_ttl_days * 86400 if self.seen_ttl_days else None)
+        listing_store.migrate_from_workbook(self.excel_path, log=self.log)
+        self.expire_seen(listing_store)
+        if self.journal_path:
+            self.listing_journal = ListingJournal(self.journal_path, listing_store, self.journal_compact_every,
+                                                  log=self.log)
+            # Announce what the last run accepted but never got to send
+            for record in self.listing_journal.replay():
+                self.send_telegram_message(record['text'], record['image_url'], listing_id=record['id'])
+        return listing_store
+
+    def close_listing_store(self, listing_store):
+        if self.listing_journal is not None:
+            self.listing_journal.close()
+            self.listing_journal = None
+        if self.excel_export_interval:
+            self.export_spreadsheet(listing_store)
+        listing_store.close()
+
+    def export_spreadsheet(self, listing_store):
+        try:
+            with metrics.timer('excel_export_seconds'):
+                count = listing_store.export_workbook_if_changed(self.excel_path)
+        except OSError as e:
+            self.log(f"Could not update {self.excel_path}: {str(e)}. Close it if it is open in Excel; "
+                     f"it will be retried at the next export.", level=logging.WARNING)
+            return
+        if count is not None:
+            self.log(f"Exported {count} listings to {self.excel_path}.")
+
+    def expire_seen(self, listing_store):
+        if not self.seen_ttl_days:
+            return
+        expired = listing_store.expire_seen(self.seen_ttl_days * 86400)
+        if expired:
+            self.log(f"Forgot {expired} analyzed cards older than {self.seen_ttl_days} days.")
+
+    def build_url(self, search_item):
+        # Canonical, so searches that load the same results page share one fetch
+        return search_item_url(search_item, self.config['BASE_URL'])
+
+    def group_by_url(self, search_items):
+        """Search items keyed by the results page they load, in order of first appearance."""
+        groups = {}
+        for search_item in search_items:
+            groups.setdefault(self.build_url(search_item), []).append(search_item)
+        return groups
+
+    def extract_listing_cards_from_source(self, driver, limit):
+        return parse_listing_page(driver.page_source, limit, processes=self.parse_processes)
+
+    def extract_listings_from_state(self, driver, limit):
+        # Both the state and the DOM fallback read the same page_source snapshot
+        page_source = driver.page_source
         try:
-            sheet.parent.save(alternative_path)
-            log(
-                f"Successfully saved to alternative location: {alternative_path}")
+            listings = parse_state_listings(page_source, limit)
+            if listings is not None:
+                return listings
+            self.log("No embedded state in the page. Parsing the DOM instead.", level=logging.DEBUG)
+            metrics.increment('state_fallbacks', reason='missing')
+        except StateSchemaError as e:
+            self.log("Embedded state changed shape: %s. Parsing the DOM instead.", e, level=logging.WARNING)
+            metrics.increment('state_fallbacks', reason='schema')
+        return parse_listing_page(page_source, limit, processes=self.parse_processes)
+
+    def fast_extractors(self):
+        import browser_extraction
+
+        return {
+            'html': self.extract_listing_cards_from_source,
+            'bulk': browser_extraction.extract_listing_cards_bulk,
+            'state': self.extract_listings_from_state,
+        }
+
+    def compare_extraction_paths(self, driver, listing_cards, scan_limit=None):
+        import browser_extraction
+
+        start = time.perf_counter()
+        element_listings = browser_extraction.extract_listings_per_element(listing_cards, self.html_capture,
+                                                                           self.selector_cache)
+        timings = [f"element: {len(element_listings)} cards in {time.perf_counter() - start:.3f}s"]
+
+        for mode, extractor in self.fast_extractors().items():
+            start = time.perf_counter()
+            try:
+                listings = extractor(driver, scan_limit or len(listing_cards))
+            except Exception as e:
+                self.log(f"Compare - {mode} extraction failed: {str(e)}")
+                continue
+            timings.append(f"{mode}: {len(listings)} cards in {time.perf_counter() - start:.3f}s")
+
+            by_id = {listing['id']: listing for listing in listings}
+            mismatches = 0
+            for listing in element_listings:
+                other = by_id.get(listing['id'])
+                if other is None:
+                    mismatches += 1
+                    self.log(f"Compare - listing {listing['id']} missing from {mode} extraction.",
+                             level=logging.WARNING)
+                    continue
+                differences = {key: (value, other.get(key))
+                               for key, value in listing.items() if other.get(key) != value}
+                if differences:
+                    mismatches += 1
+                    self.log(f"Compare - listing {listing['id']} differs (element, {mode}): {differences}",
+                             level=logging.WARNING)
+            timings.append(f"{mode} mismatching cards: {mismatches}")
+
+        self.log(f"Compare - {', '.join(timings)}.")
+        if self.page_corpus_dir:
+            name = save_page_to_corpus(self.page_corpus_dir, driver.page_source, element_listings)
+            self.log(f"Saved page and {len(element_listings)} extracted listings to corpus as {name}.")
+        return element_listings
+
+    def extract_listings(self, driver, listing_cards, scan_limit=None, wanted_ids=None):
+        """Extract listing_cards; the page-wide extractors read the first scan_limit
+        cards (default len(listing_cards)) and keep only wanted_ids, if given."""
+        import browser_extraction
+
+        if self.extraction_mode == 'compare':
+            return self.compare_extraction_paths(driver, listing_cards, scan_limit)
+
+        extractor = self.fast_extractors().get(self.extraction_mode)
+        if extractor:
+            start = time.perf_counter()
+            try:
+                listings = extractor(driver, scan_limit or len(listing_cards))
+                if wanted_ids is not None:
+                    listings = [listing for listing in listings if listing['id'] in wanted_ids]
+                self.log(f"{self.extraction_mode} extraction read {len(listings)} cards in "
+                         f"{time.perf_counter() - start:.3f}s.")
+                if listings or not listing_cards:
+                    return listings
+                self.log(f"{self.extraction_mode} extraction found no cards. Falling back to per-element extraction.")
+            except Exception as e:
+                self.log(f"{self.extraction_mode} extraction failed: {str(e)}. "
+                         f"Falling back to per-element extraction.")
+
+        return browser_extraction.extract_listings_per_element(listing_cards, self.html_capture,
+                                                               self.selector_cache)
+
+    def build_chrome_options(self):
+        import browser_extraction
+
+        return browser_extraction.build_chrome_options(self.headless, self.lean_browser, self.page_load_strategy)
+
+    def configure_new_driver(self, driver):
+        import browser_extraction
+
+        browser_extraction.count_webdriver_calls(driver, metrics)
+        # The readiness script runs until the cards settle, so it needs more than the default 30s
+        driver.set_script_timeout(self.ready_max_timeout + 10)
+        if self.blocked_url_patterns:
+            browser_extraction.block_urls(driver, self.blocked_url_patterns)
+
+    def scan_to_watermark(self, driver, listing_cards, listing_store, url):
+        """Read card IDs, loading more pages until a run of known IDs is reached.
+
+        Returns (listing cards, their IDs, new IDs, scan limit).
+        """
+        import browser_extraction
+
+        pages = 1
+        while True:
+            card_ids = browser_extraction.read_card_ids(driver, listing_cards)
+            new_ids, scan_limit, caught_up = find_new_cards(card_ids, listing_store.known_ids(url, card_ids),
+                                                            self.watermark_stop_after)
+            if caught_up or pages >= self.watermark_max_pages:
+                break
+            self.log("No seen listings among %d cards yet. Loading more results...", len(card_ids), url=url)
+            if not browser_extraction.load_more_cards(driver, len(listing_cards), self.pagination_wait):
+                self.log("No more results loaded.", url=url)
+                break
+            pages += 1
+            listing_cards = browser_extraction.find_listing_cards(driver)
+        metrics.increment('pages_loaded', pages)
+        self.log("Watermark scan: %d new of %d cards over %d page(s), caught up: %s.",
+                 len(new_ids), len(card_ids), pages, caught_up, url=url,
+                 cards=len(card_ids), new_cards=len(new_ids), pages=pages)
+        return listing_cards, card_ids, new_ids, scan_limit
+
+    def create_driver_pool(self):
+        from driver_manager import DriverPool
+
+        return DriverPool(self.max_parallel_browsers, self.build_chrome_options, log=self.log,
+                          page_load_timeout=self.page_load_timeout, on_start=self.configure_new_driver,
+                          max_rss=self.chrome_max_rss_mb and self.chrome_max_rss_mb * 1024 * 1024,
+                          max_pages=self.chrome_max_pages,
+                          max_age=self.chrome_max_age_hours and self.chrome_max_age_hours * 3600)
+
+    def process_search_page(self, driver, url, search_items, listing_store):
+        """Load a results page once and match its listings against every search that loads it.
+
+        Returns the number of new listings per search item.
+        """
+        import browser_extraction
+
+        no_listings = [0] * len(search_items)
+        self.log("Navigating to URL: %s", url, url=url)
+        load_start = time.perf_counter()
+        driver.get(url)
+
+        timeout = self.readiness_timeouts.timeout(url)
+        self.log("Waiting for listing cards to settle (timeout: %.0f seconds)...", timeout, url=url)
+        readiness = wait_for_listings(driver, LISTING_CARD_XPATH, LISTINGS_CONTAINER_XPATH, timeout,
+                                      quiet=self.ready_quiet_seconds, empty_quiet=self.ready_empty_quiet_seconds)
+        if readiness['first_card_seconds'] is not None:
+            metrics.observe('time_to_first_card_seconds', readiness['first_card_seconds'], search=url)
+
+        if readiness['timed_out']:
+            new_timeout = self.readiness_timeouts.record_timeout(url)
+            metrics.increment('readiness_timeouts', search=url)
+            self.log("Timeout occurred while waiting for the page to load (%d cards so far). "
+                     "Next timeout: %.0f seconds.",
+                     readiness['cards'], new_timeout, level=logging.WARNING, url=url)
+            if self.html_capture.enabled(failure=True):
+                self.log("Current page source: %s", driver.page_source, event='page_html', url=url)
+            return no_listings
+
+        self.readiness_timeouts.record(url, readiness['stable_seconds'])
+        metrics.observe('time_to_stable_seconds', readiness['stable_seconds'], search=url)
+        metrics.observe('page_load_seconds', time.perf_counter() - load_start, search=url)
+        self.log("%d listing cards settled %.2fs after navigation (first card at %s).", readiness['cards'],
+                 readiness['stable_seconds'], f"{readiness['first_card_seconds']:.2f}s"
+                 if readiness['first_card_seconds'] is not None else "none", url=url, **readiness)
+        if self.record_page_bytes:
+            metrics.observe('page_bytes', browser_extraction.page_bytes(driver), search=url)
+
+        listing_cards = browser_extraction.find_listing_cards(driver)
+        self.log("Found %d listing cards.", len(listing_cards), url=url, cards=len(listing_cards))
+
+        if not listing_cards:
+            self.log("No listing cards found. Possible page structure change.", level=logging.WARNING, url=url)
+            if self.html_capture.enabled(failure=True):
+                self.log("Current page source: %s", driver.page_source, event='page_html', url=url)
+            return no_listings
+
+        if self.watermark_mode:
+            listing_cards, card_ids, new_ids, scan_limit = self.scan_to_watermark(
+                driver, listing_cards, listing_store, url)
+            if not new_ids:
+                return no_listings
+            wanted_ids = set(new_ids)
+            new_cards = [card for card, card_id in zip(listing_cards, card_ids) if card_id in wanted_ids]
+            extract_start = time.perf_counter()
+            listings = self.extract_listings(driver, new_cards, scan_limit=scan_limit, wanted_ids=wanted_ids)
+        else:
+            extract_start = time.perf_counter()
+            listings = self.extract_listings(driver, listing_cards[:self.max_listings])
+        if listings:
+            metrics.observe('card_extract_seconds', (time.perf_counter() - extract_start) / len(listings),
+                            search=url)
+        metrics.increment('cards_parsed', len(listings))
+        return self.process_listings(search_items, url, listings, listing_store)
+
+    def get_matcher(self, search_item):
+        key = search_key(search_item)
+        matcher = self.matchers.get(key)
+        if matcher is None:
+            matcher = self.matchers[key] = ListingMatcher(search_item, self.exclude_sellers)
+        return matcher
+
+    def process_listings(self, search_items, url, listings, listing_store):
+        """Match a page's listings against each search that loads it, then store and announce new ones.
+
+        Returns the number of new listings per search item.
+        """
+        stored = listing_store.stored_ids([listing_data['id'] for listing_data in listings])
+        fresh = [listing_data for listing_data in listings if listing_data['id'] not in stored]
+        new_counts = []
+        for search_item in search_items:
+            matched, rejected = self.get_matcher(search_item).filter(fresh)
+            self.log("%d of %d unseen listings match the search (rejected: %s).", len(matched), len(fresh),
+                     ', '.join(f"{count} {reason}" for reason, count in rejected.items()) or 'none',
+                     url=url, search=search_name(search_item), unseen=len(fresh), matched=len(matched),
+                     rejected=dict(rejected))
+            new_counts.append(self.announce_listings(matched, url, listing_store))
+
+        if self.watermark_mode:
+            # Non-matching cards count as seen too, so the next check stops at them
+            listing_store.mark_seen(url, [listing_data['id'] for listing_data in listings])
+        return new_counts
+
+    def announce_listings(self, matched, url, listing_store):
+        """Store matched listings and send a Telegram message for each one not stored before."""
+        new_listing_count = 0
+        for listing_data in matched:
+            try:
+                row = [
+                    listing_data['id'], listing_data['href'], listing_data['seller_name'],
+                    listing_data['time'], listing_data['title'], listing_data['price'],
+                    listing_data['condition'], listing_data['image_url']
+                ]
+                message = f"New listing found!\nTitle: {listing_data['title']}\nPrice: {listing_data['price']}\nCondition: {listing_data['condition']}\nSeller: {listing_data['seller_name']}\nPosted: {listing_data['time']}\nLink: {listing_data['href']}"
+                # The journal (or INSERT OR IGNORE without one) claims the ID, so a
+                # listing matched by two searches (sharing a page or running in
+                # parallel) is only recorded and sent once
+                with metrics.timer('persist_seconds'):
+                    if self.listing_journal is not None:
+                        added = self.listing_journal.accept(row, message, listing_data['image_url'])
+                    else:
+                        added = listing_store.add(row)
+                if not added:
+                    self.log("Listing already claimed by another search. Skipping.", level=logging.DEBUG)
+                    continue
+                new_listing_count += 1
+                metrics.increment('new_listings')
+                self.send_telegram_message(message, listing_data['image_url'], listing_id=str(listing_data['id']))
+                self.log("New listing: %s", listing_data['title'], listing_id=listing_data['id'],
+                         price=listing_data['price'], url=url)
+
+            except Exception as e:
+                self.log(f"Error processing listing {listing_data['id']}: {str(e)}", level=logging.WARNING)
+        return new_listing_count
+
+    def get_http_fetcher(self):
+        with self.http_fetcher_lock:
+            if self.http_fetcher is None:
+                self.http_fetcher = HttpPageFetcher(pool_size=self.max_parallel_browsers,
+                                                    timeout=self.page_load_timeout)
+            return self.http_fetcher
+
+    def fetch_search_page(self, url, search_items, listing_store):
+        """Read a results page's listings from its embedded state over plain HTTP.
+
+        Returns the new listings per search item, or None when the page can't
+        be fetched or has no usable state, so the caller falls back to the browser.
+        """
+        start = time.perf_counter()
+        try:
+            html = self.get_http_fetcher().fetch(url)
+            metrics.observe('page_load_seconds', time.perf_counter() - start, search=url)
+            listings = parse_state_listings(html, None if self.watermark_mode else self.max_listings)
+        except StateSchemaError as e:
+            self.log("Embedded state changed shape: %s. Falling back to the browser.", e,
+                     level=logging.WARNING, url=url)
+            metrics.increment('state_fallbacks', reason='schema')
+            return None
         except Exception as e:
-            log(f"Error saving to alternative location: {str(e)}")
-    except Exception as e:
-        log(f"Error saving to Excel: {str(e)}")
-        log(f"Current working directory: {os.getcwd()}")
-        log(f"Full path of excel file: {os.path.abspath(excel_path)}")
-        log(f"File exists: {os.path.exists(excel_path)}")
-        if os.path.exists(excel_path):
-            log(f"File is writable: {os.access(excel_path, os.W_OK)}")
-            log(f"Directory is writable: {os.access(os.path.dirname(excel_path), os.W_OK)}")
-
-
-def build_url(search_item):
-    if 'full_url' in search_item:
-        return search_item['full_url']
-
-    base_url = config['BASE_URL']
-    params = {
-        "search": search_item['query'],
-        "price_start": search_item['price_start'],
-        "price_end": search_item['price_end'],
-        "sort_by": search_item['sort_by'],
-    }
-
-    if 'tab' in search_item and search_item['tab'] != 'all':
-        params['tab'] = search_item['tab']
-
-    category = search_item['category']
-    url = f"{base_url}categories/{category}/"
-
-    # Encode the query parameters
-    encoded_params = urllib.parse.urlencode(
-        {k: v for k, v in params.items() if v is not None},
-        quote_via=urllib.parse.quote
-    )
-
-    if encoded_params:
-        url += f"?{encoded_params}"
-
-    return url
-
+            self.log(f"HTTP fetch failed: {str(e)}. Falling back to the browser.", level=logging.WARNING, url=url)
+            metrics.increment('state_fallbacks', reason='fetch')
+            return None
+        if listings is None:
+            self.log("No embedded state in the page. Falling back to the browser.", url=url)
+            metrics.increment('state_fallbacks', reason='missing')
+            return None
+
+        self.log("Read %d listings from embedded state over HTTP.", len(listings), url=url, cards=len(listings))
+        metrics.increment('searches_run')
+        metrics.increment('cards_parsed', len(listings))
+        new_counts = self.process_listings(search_items, url, listings, listing_store)
+        metrics.observe('search_seconds', time.perf_counter() - start, search=url)
+        return new_counts
+
+    def run_search_page(self, driver_pool, url, search_items, listing_store):
+        """Fetch one results page for the searches that load it; None per search if it failed."""
+        if self.fetch_mode == 'http':
+            new_counts = self.fetch_search_page(url, search_items, listing_store)
+            if new_counts is not None:
+                return new_counts
+
+        # Each page borrows a browser for its own duration only, so a slow or
+        # timed-out page ties up one worker while the others keep going
+        with driver_pool.acquire() as driver_manager:
+            try:
+                driver = driver_manager.get_driver()
+                metrics.increment('searches_run')
+                with metrics.timer('search_seconds', search=url):
+                    return self.process_search_page(driver, url, search_items, listing_store)
+            except Exception as e:
+                self.log(f"Error checking search {', '.join(search_name(item) for item in search_items)}: "
+                         f"{str(e)}", level=logging.ERROR)
+                self.log(traceback.format_exc(), level=logging.ERROR)
+                return [None] * len(search_items)
+
+    def check_listings(self, driver_pool=None, listing_store=None, search_items=None):
+        """Run the given searches (all configured ones by default).
+
+        Returns the number of new listings per search, None for a search that
+        failed, or None overall if the run itself failed.
+        """
+        self.log("Starting to check Carousell listings...")
+        # Without a long-lived pool or store, open them for this run only
+        owns_pool = driver_pool is None
+        if owns_pool:
+            driver_pool = self.create_driver_pool()
+        owns_store = listing_store is None
 
-def find_element_with_fallback(card, selectors):
-    for selector_type, selector in selectors:
         try:
-            if selector_type == By.XPATH:
-                element = card.find_element(By.XPATH, selector)
-            elif selector_type == By.CSS_SELECTOR:
-                element = card.find_element(By.CSS_SELECTOR, selector)
-            if element:
-                return element
-        except NoSuchElementException:
-            continue
-    return None
+            if owns_store:
+                listing_store = self.open_listing_store()
+            self.log(f"Listing database has {len(listing_store)} listings.")
+
+            if search_items is None:
+                search_items = self.config['SEARCH_ITEMS']
+            # Searches that load the same page (e.g. URLs differing only in
+            # tracking parameters) share one fetch per run
+            pages = self.group_by_url(search_items)
+            if len(pages) < len(search_items):
+                self.log(f"{len(search_items)} searches load {len(pages)} distinct pages; "
+                         f"each page is fetched once.")
+                metrics.increment('shared_fetches', len(search_items) - len(pages))
+            with ThreadPoolExecutor(max_workers=driver_pool.size) as executor:
+                futures = {url: executor.submit(self.run_search_page, driver_pool, url, items, listing_store)
+                           for url, items in pages.items()}
+                page_counts = {url: iter(future.result()) for url, future in futures.items()}
+            new_counts = [next(page_counts[self.build_url(search_item)]) for search_item in search_items]
+            new_listing_count = sum(count or 0 for count in new_counts)
+            self.log(f"Chrome session stats: {driver_pool.stats()}")
+
+            if new_listing_count:
+                self.log(f"Saved {new_listing_count} new listings to {self.db_path}.")
+            else:
+                self.log("No new listings found.")
+            self.log(f"Telegram messages sent: {self.telegram_dispatcher.sent}, "
+                     f"failed: {self.telegram_dispatcher.failed}, queued: {self.telegram_dispatcher.pending()}")
+            if self.listing_journal is not None:
+                self.listing_journal.compact()
+            self.save_selector_stats()
 
+        except Exception as e:
+            self.log(f"Unexpected error: {str(e)}", level=logging.ERROR)
+            self.log(traceback.format_exc(), level=logging.ERROR)
+            return None
+        finally:
+            if owns_pool:
+                driver_pool.quit()
+            if owns_store and listing_store is not None:
+                # Messages still queued when the journal closes would be sent again next time
+                self.telegram_dispatcher.flush(timeout=60)
+                self.close_listing_store(listing_store)
+        return new_counts
+
+    def create_search_scheduler(self):
+        return SearchScheduler(
+            self.config['SEARCH_ITEMS'],
+            default_interval=self.config.get('SEARCH_INTERVAL', 3600),
+            min_interval=self.config.get('MIN_SEARCH_INTERVAL', 300),
+            max_interval=self.config.get('MAX_SEARCH_INTERVAL', 4 * 3600))
+
+    @staticmethod
+    def validate_config(new_config):
+        """Raise ConfigError if an edited config cannot replace the running one."""
+        if not new_config.get('BASE_URL'):
+            raise ConfigError("BASE_URL is missing")
+        validate_search_items(new_config.get('SEARCH_ITEMS', []))
+        # check_listings builds every URL before any search runs, so one bad item would fail them all
+        for position, search_item in enumerate(new_config.get('SEARCH_ITEMS', []), 1):
+            try:
+                search_item_url(search_item, new_config['BASE_URL'])
+            except (KeyError, TypeError, ValueError) as e:
+                raise ConfigError(f"Search item {position} has no usable URL: {e!r}") from e
+        try:
+            compile_matchers(new_config.get('SEARCH_ITEMS', []), new_config.get('EXCLUDE_SELLERS', []))
+        except (ValueError, TypeError, AttributeError, re.error) as e:
+            raise ConfigError(f"Invalid search filter: {str(e)}") from e
+
+    def apply_config(self, new_config, scheduler):
+        """Switch to an edited config, touching only the searches that changed.
+
+        Returns True if the set of searches changed.
+        """
+        old_config = self.config
+        self.config = config = new_config
+        scheduler.default_interval = config.get('SEARCH_INTERVAL', 3600)
+        scheduler.min_interval = config.get('MIN_SEARCH_INTERVAL', 300)
+        scheduler.max_interval = config.get('MAX_SEARCH_INTERVAL', 4 * 3600)
+        added, removed, updated = scheduler.set_items(config['SEARCH_ITEMS'])
+
+        new_exclude_sellers = config.get('EXCLUDE_SELLERS', [])
+        if new_exclude_sellers != self.exclude_sellers:
+            # Every matcher includes the global seller list
+            self.exclude_sellers = new_exclude_sellers
+            self.matchers.clear()
+            self.matchers.update(compile_matchers(config['SEARCH_ITEMS'], self.exclude_sellers))
+        else:
+            for key in removed + [old_key for old_key, _ in updated]:
+                self.matchers.pop(key, None)
+            for key in added + [new_key for _, new_key in updated]:
+                self.matchers[key] = ListingMatcher(scheduler.schedules[key].search_item, self.exclude_sellers)
+
+        def names(keys):
+            return ', '.join(search_name(json.loads(key)) for key in keys) or 'none'
+
+        self.log("Reloaded config: %d searches added (%s), %d removed (%s), %d edited (%s).",
+                 len(added), names(added), len(removed), names(removed),
+                 len(updated), names(new_key for _, new_key in updated),
+                 added=len(added), removed=len(removed), updated=len(updated))
+        needs_restart = sorted(key for key in set(old_config) | set(config)
+                               if key not in RELOADABLE_KEYS and old_config.get(key) != config.get(key))
+        if needs_restart:
+            self.log(f"Changed settings that only take effect after a restart: {', '.join(needs_restart)}",
+                     level=logging.WARNING)
+        metrics.increment('config_reloads')
+        return bool(added or removed or updated)
+
+    def should_keep_running(self, pid_file=None):
+        if not self.running:
+            return False
+        if pid_file is not None and not os.path.exists(pid_file):
+            self.log("PID file not found. Stopping.")
+            return False
+        return True
+
+    def start_metrics_server(self, driver_pool, listing_store, scheduler):
+        dispatcher = self.telegram_dispatcher
+        metrics.set_buckets('page_bytes', [2 ** power for power in range(14, 25)])
+        for name in ('chrome_rss_before_recycle_bytes', 'chrome_rss_after_recycle_bytes'):
+            metrics.set_buckets(name, [2 ** power for power in range(26, 34)])
+        metrics.register_gauge('telegram_queue_depth', dispatcher.pending)
+        metrics.register_gauge('telegram_messages_sent', lambda: dispatcher.sent)
+        metrics.register_gauge('telegram_messages_failed', lambda: dispatcher.failed)
+        metrics.register_gauge('chrome_rss_bytes', driver_pool.rss)
+        metrics.register_gauge('listings_stored', lambda: len(listing_store))
+        if self.listing_journal is not None:
+            journal = self.listing_journal
+            metrics.register_gauge('journal_unsent', lambda: journal.stats()['unsent'])
+        if listing_store.seen_index is not None:
+            metrics.register_gauge('seen_index_ids', lambda: len(listing_store.seen_index))
+            metrics.register_gauge('seen_index_compactions', lambda: listing_store.seen_index.compactions)
+        image_fetcher = self.image_fetcher
+        if image_fetcher is not None:
+            metrics.register_gauge('image_cache_bytes', lambda: image_fetcher.cache.total_bytes)
+            metrics.register_gauge('image_cache_hits', lambda: image_fetcher.cache.hits)
+            metrics.register_gauge('image_downloads', lambda: image_fetcher.downloads)
+            metrics.register_gauge('image_download_failures', lambda: image_fetcher.failures)
+        try:
+            server = MetricsServer(metrics, self.metrics_host, self.metrics_port, status=lambda: {
+                'pid': os.getpid(),
+                'schedule': scheduler.summary(),
+                'chrome': driver_pool.stats(),
+            }).start()
+        except OSError as e:
+            self.log(f"Could not start metrics endpoint on port {self.metrics_port}: {str(e)}",
+                     level=logging.WARNING)
+            return None
+        self.log("Serving metrics at %smetrics and %smetrics.json", server.url, server.url)
+        return server
+
+    def save_selector_stats(self):
+        if self.selector_cache is None:
+            return
+        try:
+            self.selector_cache.save()
+        except OSError as e:
+            self.log(f"Could not save {self.selector_stats_file}: {str(e)}", level=logging.WARNING)
+
+    def close(self):
+        """Send what is still queued and release the HTTP and image fetchers."""
+        self.save_selector_stats()
+        if self.http_fetcher is not None:
+            self.http_fetcher.close()
+            self.http_fetcher = None
+        self.log("Sending remaining Telegram messages...")
+        self.telegram_dispatcher.stop(timeout=60)
+        if self.image_fetcher is not None:
+            self.image_fetcher.close()
+
+    def run_once(self):
+        """Run every configured search once. Returns False if the run failed."""
+        try:
+            return self.check_listings() is not None
+        finally:
+            self.close()
+
+    def run(self, pid_file=None):
+        from driver_manager import cleanup_orphaned_browsers
+
+        self.install_signal_handlers()
+        self.log("Starting main loop. Press Ctrl+C to stop safely.")
+        cleanup_orphaned_browsers(self.log)
+        driver_pool = self.create_driver_pool()
+        listing_store = self.open_listing_store()
+        scheduler = self.create_search_scheduler()
+        metrics_server = (self.start_metrics_server(driver_pool, listing_store, scheduler)
+                          if self.metrics_port else None)
+        config_watcher = (ConfigWatcher(self.config_file, self.validate_config, self.config_reload_interval,
+                                        log=self.log)
+                          if self.config_reload_interval else None)
+        last_expiry = last_export = time.monotonic()
+        while self.should_keep_running(pid_file):
+            if time.monotonic() - last_expiry >= 86400:
+                self.expire_seen(listing_store)
+                last_expiry = time.monotonic()
+            if self.excel_export_interval and time.monotonic() - last_export >= self.excel_export_interval:
+                self.export_spreadsheet(listing_store)
+                last_export = time.monotonic()
+            due_items = scheduler.due()
+            try:
+                if due_items:
+                    self.log(f"Checking {len(due_items)} due searches...")
+                    new_counts = self.check_listings(driver_pool, listing_store, due_items)
+                    if new_counts is not None:
+                        self.log("Successfully checked listings.")
+                    else:
+                        self.log("Failed to check listings.")
+                        new_counts = [None] * len(due_items)
+                    for search_item, new_count in zip(due_items, new_counts):
+                        scheduler.record(search_item, new_count)
+                    self.log(f"Search schedule: {scheduler.summary()}")
+            except Exception as e:
+                self.log(f"Unexpected error in main loop: {str(e)}")
+                self.log("Continuing to next iteration...")
+                for search_item in due_items:
+                    scheduler.record(search_item, None)
+
+            wait = scheduler.seconds_until_next()
+            if wait is None:
+                self.log("No searches configured. Waiting for 1 hour...")
+                wait = 3600
+            elif wait > 0:
+                self.log(f"Waiting {wait:.0f} seconds until the next search is due...")
+            for _ in range(int(wait)):
+                if not self.should_keep_running(pid_file):
+                    break
+                if config_watcher is not None:
+                    new_config = config_watcher.poll()
+                    # Added or edited searches may be due right away
+                    if new_config is not None and self.apply_config(new_config, scheduler):
+                        break
+                time.sleep(1)
+            else:
+                time.sleep(wait % 1)
 
-def extract_text_content(element):
-    return element.text.strip() if element else 'Not found'
+        if metrics_server is not None:
+            metrics_server.stop()
+        driver_pool.quit()
+        self.close()
+        # After the dispatcher, so the journal records every message it sent
+        self.close_listing_store(listing_store)
+        self.log(f"Chrome session stats: {driver_pool.stats()}")
+        self.log("Script stopped gracefully.")
 
 
-def find_element_by_text(driver, text):
-    try:
-        return driver.find_element(By.XPATH, f"//p[contains(text(), '{text}')]")
-    except NoSuchElementException:
-        return None
+def main(pid_file=None):
+    """Run the scraper until it is stopped; what background_carousell_scraper.py calls."""
+    ScraperApp().run(pid_file=pid_file)
 
 
-def find_element_by_text_in_card(card, text):
+def export_listings(path=None, config_file=CONFIG_FILE):
+    """Write the listing database to a spreadsheet, using the paths in the config if there is one."""
     try:
-        return card.find_element(By.XPATH, f".//p[contains(text(), '{text}')]")
-    except NoSuchElementException:
-        return None
-
-
-def find_image(card):
-    selectors = [
-        ".//img[contains(@class, 'D_QJ')]",
-        ".//img[contains(@class, 'D_SC')]",
-        ".//img"  # fallback to any image
-    ]
-    for selector in selectors:
-        try:
-            return card.find_element(By.XPATH, selector)
-        except NoSuchElementException:
-            continue
-    return None
-
-
-def find_title_dynamically(card):
-    # Strategy 1: Find the <p> element with multiple 'D_' classes and --max-line style
+        config = read_config(config_file)
+    except ConfigError:
+        config = {}
+    path = path or config.get('EXCEL_PATH', str(DEFAULT_EXCEL_PATH))
+    store = ListingStore(config.get('DB_PATH', 'carousell_listings.db'))
     try:
-        title_element = card.find_element(
-            By.XPATH, ".//p[contains(@class, 'D_') and contains(@style, '--max-line')]")
-        return title_element
-    except NoSuchElementException:
-        pass
+        count = store.export_workbook(path)
+    finally:
+        store.close()
+    print(f"Exported {count} listings to {path}")
+
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m carousell_scraper",
+                                     description="Search Carousell and send new listings to Telegram.")
+    subcommands = parser.add_subparsers(dest='command')
+    subcommands.add_parser('run', help="search on schedule until stopped (the default)")
+    subcommands.add_parser('once', help="run every search once, then exit")
+    subcommands.add_parser('status', help="show whether the background scraper is running")
+    add_parser = subcommands.add_parser('add-url', help="add a search from a Carousell search URL")
+    add_parser.add_argument('url', nargs='?', help="asked for if not given")
+    export_parser = subcommands.add_parser('export', help="write the listing database to a spreadsheet")
+    export_parser.add_argument('path', nargs='?', help="default: EXCEL_PATH from the config")
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        from check_scraper_status import check_scraper_status
+        check_scraper_status()
+        return 0
+    if args.command == 'add-url':
+        import add_search_url
+        add_search_url.main(args.url)
+        return 0
+    if args.command == 'export':
+        export_listings(args.path)
+        return 0
 
-    # Strategy 2: Find the second <a> element (first is usually the seller link) and get its text content
     try:
-        links = card.find_elements(By.TAG_NAME, "a")
-        if len(links) > 1:
-            title_element = links[1].find_element(
-                By.XPATH, ".//p[contains(@class, 'D_')]")
-            return title_element
-    except (NoSuchElementException, IndexError):
-        pass
-
-    # Strategy 3: Find the first <p> with multiple 'D_' classes within an <a> tag
+        app = ScraperApp()
+    except ConfigError as e:
+        print(str(e), file=sys.stderr)
+        return 1
+    if args.command == 'once':
+        return 0 if app.run_once() else 1
     try:
-        title_element = card.find_element(
-            By.XPATH, ".//a//p[contains(@class, 'D_l')]")
-        return title_element
-    except NoSuchElementException:
-        pass
-
-    # Strategy 4: Find the element with the longest text content (excluding seller name and price)
-    elements = card.find_elements(By.XPATH, ".//p[contains(@class, 'D_')]")
-    if elements:
-        return max(elements, key=lambda e: len(e.text) if not (e.text.startswith('S$') or e.get_attribute('data-testid') == 'listing-card-text-seller-name') else 0)
-
-    # If all strategies fail, return None
-    return None
-
-
-def analyze_listing_card(card):
-    # Log the entire card HTML for debugging
-    log(f"Card HTML: {card.get_attribute('outerHTML')}")
-
-    price_selectors = [
-        (By.XPATH, ".//p[contains(@class, 'D_ma')]"),
-        (By.XPATH, ".//p[contains(@class, 'D_mc')]"),
-        (By.XPATH, ".//p[contains(text(), 'S$')]")
-    ]
-    time_selectors = [
-        (By.XPATH, ".//p[contains(@class, 'D_ow')]"),
-        (By.XPATH, ".//p[contains(@class, 'D_pc')]"),
-        (By.XPATH, ".//p[contains(text(), 'ago')]")
-    ]
-
-    # Find title dynamically
-    title_element = find_title_dynamically(card)
-
-    # Log the found title element for debugging
-    log(f"Debug - Raw title element: {title_element}")
-    log(f"Debug - Raw title text: {title_element.text if title_element else 'Not found'}")
-
-    price = find_element_with_fallback(card, price_selectors)
-    seller_name = card.find_element(
-        By.XPATH, ".//p[@data-testid='listing-card-text-seller-name']")
-    time = find_element_with_fallback(card, time_selectors)
-
-    condition_types = ['Brand new', 'Like new',
-                       'Lightly used', 'Well used', 'Heavily used']
-    condition = None
-    for condition_type in condition_types:
-        condition_element = find_element_by_text_in_card(card, condition_type)
-        if condition_element:
-            condition = condition_element
-            break
-
-    listing_id = card.get_attribute('data-testid').replace('listing-card-', '')
-    image = find_image(card)
-
-    return {
-        'id': listing_id,
-        'title': title_element.text if title_element else 'Not found',
-        'price': extract_text_content(price),
-        'seller_name': extract_text_content(seller_name),
-        'time': extract_text_content(time),
-        'condition': extract_text_content(condition),
-        'image_url': image.get_attribute('src') if image else 'Not found',
-        'href': f"https://www.carousell.sg/p/{listing_id}"
-    }
-
-
-def check_carousell_listings():
-    log("Starting to check Carousell listings...")
-    chrome_options = Options()
-    chrome_options.add_argument("--no-sandbox")
-    chrome_options.add_argument("--disable-dev-shm-usage")
-
-    try:
-        log("Initializing Chrome driver...")
-        driver = webdriver.Chrome(service=Service(
-            ChromeDriverManager().install()), options=chrome_options)
-
-        excel_path = "carousell_listings.xlsx"
-        log(f"Loading existing IDs from Excel: {excel_path}")
-        existing_ids, workbook, sheet = load_existing_ids(excel_path)
-        new_listings = []
-
-        for search_item in config['SEARCH_ITEMS']:
-            url = build_url(search_item)
-            log(f"Navigating to URL: {url}")
-            driver.get(url)
-
-            log(f"Waiting for page to load (timeout: 45 seconds)...")
-
-            try:
-                WebDriverWait(driver, 45).until(
-                    EC.presence_of_element_located((By.TAG_NAME, "body"))
-                )
-                log("Initial page content loaded.")
-
-                WebDriverWait(driver, 45).until(
-                    EC.presence_of_element_located(
-                        (By.XPATH, "//div[contains(@class, 'browse-listings')]"))
-                )
-                log("Listing cards container found.")
-
-            except TimeoutException:
-                log("Timeout occurred while waiting for the page to load.")
-                log("Current page source:")
-                log(driver.page_source)
-                continue
-
-            listing_cards = driver.find_elements(
-                By.XPATH, "//div[starts-with(@data-testid, 'listing-card-')]")
-            log(f"Found {len(listing_cards)} listing cards.")
-
-            if not listing_cards:
-                log("No listing cards found. Possible page structure change.")
-                log("Current page source:")
-                log(driver.page_source)
-                continue
-
-            for index, card in enumerate(listing_cards[:MAX_LISTINGS]):
-                log(f"Processing listing {index + 1}...")
-                try:
-                    listing_data = analyze_listing_card(card)
-                    log(
-                        f"Extracted details - Title: {listing_data['title']}, Price: {listing_data['price']}, Condition: {listing_data['condition']}")
-
-                    if listing_data['id'] in existing_ids:
-                        log("Listing already exists in database. Skipping.")
-                        continue
-
-                    price_value = float(listing_data['price'].replace(
-                        "S$", "").replace(",", ""))
-
-                    # Add these debug log statements here
-                    log(
-                        f"Debug - search_item['query']: {search_item.get('query', 'N/A')}")
-                    log(
-                        f"Debug - listing_data['title']: {listing_data['title']}")
-                    log(
-                        f"Debug - search_item['price_start']: {search_item.get('price_start', 'N/A')}")
-                    log(
-                        f"Debug - search_item['price_end']: {search_item.get('price_end', 'N/A')}")
-                    log(f"Debug - price_value: {price_value}")
-
-                    # Check if it's a full_url search_item or a regular one
-                    if 'full_url' in search_item:
-                        # For full_url items, we don't have specific criteria, so we add all listings
-                        log("Full URL search item. Adding to new listings.")
-                        new_listing = True
-                    elif (search_item['query'].lower() in listing_data['title'].lower() and
-                          (search_item['price_start'] is None or price_value >= search_item['price_start']) and
-                            (search_item['price_end'] is None or price_value <= search_item['price_end'])):
-                        log("Listing matches criteria. Adding to new listings.")
-                        new_listing = True
-                    else:
-                        log("Listing does not match criteria. Skipping.")
-                        new_listing = False
-
-                    if new_listing:
-                        new_listings.append([
-                            listing_data['id'], listing_data['href'], listing_data['seller_name'],
-                            listing_data['time'], listing_data['title'], listing_data['price'],
-                            listing_data['condition'], listing_data['image_url']
-                        ])
-                        message = f"New listing found!\nTitle: {listing_data['title']}\nPrice: {listing_data['price']}\nCondition: {listing_data['condition']}\nSeller: {listing_data['seller_name']}\nPosted: {listing_data['time']}\nLink: {listing_data['href']}"
-                        send_telegram_message(message)
-                        log("Telegram message sent for new listing.")
-
-                except Exception as e:
-                    log(f"Error processing listing: {str(e)}")
-                    log(f"Listing HTML: {card.get_attribute('outerHTML')}")
-
-        if new_listings:
-            log(f"Saving {len(new_listings)} new listings to Excel...")
-            save_to_excel(new_listings, excel_path, sheet)
-        else:
-            log("No new listings found.")
-
+        app.run()
     except Exception as e:
-        log(f"Unexpected error: {str(e)}")
-        log(traceback.format_exc())
-        return False
+        app.log(f"Critical error: {str(e)}")
     finally:
-        driver.quit()
-        log("Chrome driver closed.")
-    return True
-
-
-def main():
-    global running
-    log("Starting main loop. Press Ctrl+C to stop safely.")
-    while running:
-        try:
-            log("Checking Carousell listings...")
-            success = check_carousell_listings()
-            if success:
-                log("Successfully checked listings.")
-            else:
-                log("Failed to check listings.")
-
-            if running:
-                log("Waiting for 1 hour before next check...")
-                for _ in range(3600):  # 3600 seconds = 1 hour
-                    if not running:
-                        break
-                    time.sleep(1)
-        except Exception as e:
-            log(f"Unexpected error in main loop: {str(e)}")
-            log("Continuing to next iteration...")
-
-    log("Script stopped gracefully.")
+        app.log("Script execution completed.")
+    return 0
 
 
 if __name__ == "__main__":
-    try:
-        main()
-    except Exception as e:
-        log(f"Critical error: {str(e)}")
-    finally:
-        log("Script execution completed.")
+    sys.exit(cli())
@@ -0,0 +1,111 @@
+"""Local stand-in for carousell.sg that serves recorded search-result pages.
+
+    python carousell_stub_server.py --corpus fixtures/listing_pages --port 8765
+
+/pages/<name>.html serves that page from the corpus; /images/<name> serves a
+made-up JPEG, different for each name; any other path (for example the
+/categories/... URLs build_url produces) serves the default page.
+"""
+import argparse
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+DEFAULT_CORPUS = Path(__file__).parent / "fixtures" / "listing_pages"
+
+
+class CarousellStubServer:
+    def __init__(self, corpus_dir=DEFAULT_CORPUS, host='127.0.0.1', port=0, default_page=None):
+        self.pages = {path.name: path.read_bytes() for path in sorted(Path(corpus_dir).glob('*.html'))}
+        if not self.pages:
+            raise ValueError(f"No .html pages found in {corpus_dir}")
+        self.default_page = default_page or next(iter(self.pages))
+        self.requests = []
+        self.bytes_served = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def page_url(self, name):
+        return f"{self.base_url}pages/{name}"
+
+    def image_url(self, name):
+        return f"{self.base_url}images/{name}"
+
+    @staticmethod
+    def image_bytes(name, size=4096):
+        """JPEG markers around filler derived from the name: not a real picture, but distinct per name."""
+        seed = hashlib.sha256(name.encode()).digest()
+        return b'\xff\xd8\xff\xe0' + (seed * (size // len(seed) + 1))[:size] + b'\xff\xd9'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _page_for(self, path):
+        name = path.split('?')[0].rstrip('/').split('/')[-1]
+        if path.startswith('/pages/') and name in self.pages:
+            return self.pages[name]
+        return self.pages[self.default_page]
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.startswith('/favicon'):
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if self.path.startswith('/images/'):
+                    body = stub.image_bytes(self.path.split('?')[0])
+                    content_type = 'image/jpeg'
+                else:
+                    body = stub._page_for(self.path)
+                    content_type = 'text/html; charset=utf-8'
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with stub.lock:
+                    stub.requests.append(self.path)
+                    stub.bytes_served += len(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve recorded Carousell pages locally.")
+    parser.add_argument('--corpus', default=str(DEFAULT_CORPUS))
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    stub = CarousellStubServer(args.corpus, port=args.port)
+    print(f"Serving {len(stub.pages)} pages at {stub.base_url} (default: {stub.default_page})")
+    for name in stub.pages:
+        print(f"  {stub.page_url(name)}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stub.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,85 @@
+import json
 import os
+import time
+import urllib.request
 import psutil
 from pathlib import Path
 
 PID_FILE = Path(__file__).parent / "carousell_scraper.pid"
+CONFIG_FILE = Path(__file__).parent / "config.json"
+DEFAULT_METRICS_PORT = 9178
+
+
+def metrics_url():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            config = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        config = {}
+    port = config.get('METRICS_PORT', DEFAULT_METRICS_PORT)
+    if not port:
+        return None
+    return f"http://{config.get('METRICS_HOST', '127.0.0.1')}:{port}/metrics.json"
+
+
+def fetch_metrics(url, timeout=3):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return json.load(response)
+
+
+def _total(entries, name):
+    return sum(entry['value'] for entry in entries if entry['name'] == name)
+
+
+def _histogram(snapshot, name):
+    """Count, mean and worst p95 over all of a histogram's series."""
+    series = [entry for entry in snapshot['histograms'] if entry['name'] == name]
+    count = sum(entry['count'] for entry in series)
+    if not count:
+        return None
+    return {
+        'count': count,
+        'mean': sum(entry['sum'] for entry in series) / count,
+        'p95': max(entry['p95'] for entry in series if entry['p95'] is not None),
+    }
+
+
+def _format_seconds(stats):
+    if stats is None:
+        return "no data"
+    return f"mean {stats['mean']:.2f}s, p95 {stats['p95']:.2f}s over {stats['count']}"
+
+
+def print_metrics_summary(snapshot):
+    counters = snapshot['counters']
+    gauges = snapshot['gauges']
+    hours, remainder = divmod(int(snapshot['uptime_seconds']), 3600)
+    print(f"Uptime: {hours}h {remainder // 60}m")
+    print(f"Searches run: {_total(counters, 'searches_run'):.0f}, "
+          f"cards parsed: {_total(counters, 'cards_parsed'):.0f}, "
+          f"new listings: {_total(counters, 'new_listings'):.0f}")
+    print(f"Search duration: {_format_seconds(_histogram(snapshot, 'search_seconds'))}")
+    print(f"Page load: {_format_seconds(_histogram(snapshot, 'page_load_seconds'))}")
+    print(f"WebDriver calls: {_total(counters, 'webdriver_calls'):.0f}")
+    selector_misses = [entry for entry in counters if entry['name'] == 'selector_misses']
+    if selector_misses or _total(counters, 'selector_hits'):
+        print(f"Selector lookups: {_total(counters, 'selector_hits'):.0f} hits, "
+              f"{_total(counters, 'selector_misses'):.0f} misses")
+        for entry in sorted(selector_misses, key=lambda entry: entry['value'], reverse=True)[:5]:
+            print(f"  {entry['labels']['field']} {entry['labels']['selector']}: {entry['value']:.0f} misses")
+    print(f"Telegram send: {_format_seconds(_histogram(snapshot, 'telegram_send_seconds'))}, "
+          f"queued: {_total(gauges, 'telegram_queue_depth'):.0f}, "
+          f"sent: {_total(gauges, 'telegram_messages_sent'):.0f}, "
+          f"failed: {_total(gauges, 'telegram_messages_failed'):.0f}")
+    print(f"Database write: {_format_seconds(_histogram(snapshot, 'persist_seconds'))}, "
+          f"listings stored: {_total(gauges, 'listings_stored'):.0f}")
+    print(f"Chrome memory: {_total(gauges, 'chrome_rss_bytes') / (1024 * 1024):.0f} MB, "
+          f"sessions recycled: {_total(counters, 'chrome_recycles'):.0f}")
+    schedule = snapshot.get('status', {}).get('schedule', [])
+    if schedule:
+        print("Next searches:")
+        for entry in schedule[:5]:
+            print(f"  {entry['search']}: in {entry['next_run_in']}s (every {entry['interval']}s)")
 
 
 def check_scraper_status():
@@ -15,6 +92,16 @@ def check_scraper_status():
                 print(f"Carousell scraper is running (PID: {pid})")
                 print(f"Process name: {process.name()}")
                 print(f"Started at: {process.create_time()}")
+                # Under scraper_supervisor.py the PID is the supervisor's; the scraper is its child
+                for child in process.children():
+                    print(f"Scraper process: PID {child.pid}, running for "
+                          f"{(time.time() - child.create_time()) / 60:.0f} minutes")
+                url = metrics_url()
+                if url:
+                    try:
+                        print_metrics_summary(fetch_metrics(url))
+                    except (OSError, ValueError) as e:
+                        print(f"Live metrics unavailable from {url}: {e}")
                 return
         except psutil.NoSuchProcess:
             pass
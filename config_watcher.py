@@ -0,0 +1,98 @@
+"""Notices edits to config.json while the scraper is running.
+
+The file is polled: a change in its modification time, size or inode (an
+atomic replace gives the file a new inode) means a new version to read.
+A version that does not parse or fails validation is logged and skipped,
+and the last good config stays in use until the file changes again.
+"""
+import json
+import logging
+import os
+import time
+
+
+def _log(message, level=logging.INFO):
+    logging.log(level, message)
+
+
+class ConfigError(ValueError):
+    """The config file could not be read or is not a usable config."""
+
+
+def read_config(path):
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    except OSError as e:
+        raise ConfigError(f"Could not read {path}: {e}") from e
+    except json.JSONDecodeError as e:
+        raise ConfigError(f"{path} is not valid JSON: {e}") from e
+    if not isinstance(config, dict):
+        raise ConfigError(f"{path} must hold a JSON object, not {type(config).__name__}")
+    return config
+
+
+def validate_search_items(search_items):
+    """Raise ConfigError unless every search item names a query or a full URL."""
+    if not isinstance(search_items, list):
+        raise ConfigError("SEARCH_ITEMS must be a list")
+    for position, item in enumerate(search_items, 1):
+        if not isinstance(item, dict):
+            raise ConfigError(f"Search item {position} must be an object")
+        if not item.get('query') and not item.get('full_url'):
+            raise ConfigError(f"Search item {position} needs a \"query\" or a \"full_url\"")
+        for key in ('query', 'full_url'):
+            if item.get(key) is not None and not isinstance(item[key], str):
+                raise ConfigError(f"Search item {position} has a {key} that is not a string: {item[key]!r}")
+        interval = item.get('interval')
+        if interval is not None and (not isinstance(interval, (int, float)) or interval <= 0):
+            raise ConfigError(f"Search item {position} has an invalid interval: {interval!r}")
+
+
+class ConfigWatcher:
+    """Polls a config file and hands back each new version that validates.
+
+    `validate` is called with the parsed config and raises ValueError (or
+    ConfigError) to reject it.
+    """
+
+    def __init__(self, path, validate=None, interval=5, log=_log, clock=time.monotonic):
+        self.path = path
+        self.validate = validate
+        self.interval = interval
+        self.log = log
+        self.clock = clock
+        self.signature = self._signature()
+        self.next_check = clock() + interval
+        self.reloads = 0
+        self.rejected = 0
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def poll(self):
+        """Return the new config if the file changed and the new version is valid, else None."""
+        now = self.clock()
+        if now < self.next_check:
+            return None
+        self.next_check = now + self.interval
+        signature = self._signature()
+        if signature is None or signature == self.signature:
+            return None
+        # Remember the version even if it is rejected, so a broken edit is reported once
+        self.signature = signature
+        try:
+            config = read_config(self.path)
+            if self.validate:
+                self.validate(config)
+        except ValueError as e:
+            self.rejected += 1
+            self.log(f"Ignoring changed {self.path}, keeping the previous config: {e}",
+                     level=logging.ERROR)
+            return None
+        self.reloads += 1
+        return config
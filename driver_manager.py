@@ -0,0 +1,320 @@
+import logging
+import os
+import queue
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import psutil
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.common.exceptions import WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+
+from scraper_metrics import metrics
+
+DRIVER_PATH_CACHE = Path(__file__).parent / "chromedriver_path.txt"
+# Added to every Chrome the scraper starts, which ignores it; lets orphan cleanup
+# tell the scraper's own sessions from other automated browsers
+SESSION_MARKER = "--carousell-scraper-session"
+MB = 1024 * 1024
+
+
+def terminate_processes(processes, timeout=5):
+    """Terminate the processes still running, killing any that outlast `timeout`.
+
+    Returns how many were still running.
+    """
+    alive = []
+    for process in processes:
+        try:
+            if process.is_running():
+                process.terminate()
+                alive.append(process)
+        except psutil.Error:
+            pass
+    _, stubborn = psutil.wait_procs(alive, timeout=timeout)
+    for process in stubborn:
+        try:
+            process.kill()
+        except psutil.Error:
+            pass
+    return len(alive)
+
+
+def _is_chromedriver(process):
+    return (process.name() or '').lower().startswith('chromedriver')
+
+
+def _is_scraper_browser(process):
+    """A Chrome main process started by this scraper (helpers carry --type=...)."""
+    name = (process.info['name'] or '').lower()
+    cmdline = process.info['cmdline'] or []
+    return (('chrome' in name or 'chromium' in name) and SESSION_MARKER in cmdline
+            and not any(arg.startswith('--type=') for arg in cmdline))
+
+
+def find_orphaned_browsers():
+    """Chrome sessions this scraper started whose owner has gone.
+
+    Only browsers carrying SESSION_MARKER are considered, so Chrome run by
+    the user, Puppeteer, Playwright or other Selenium tools is never
+    touched. A marked browser is orphaned when no chromedriver is among its
+    ancestors; if its chromedriver is there but that has lost its parent
+    (re-parented to init), the chromedriver is returned instead.
+    """
+    try:
+        user = psutil.Process().username()
+    except psutil.Error:
+        return []
+    orphans = []
+    for process in psutil.process_iter(['name', 'cmdline', 'username']):
+        try:
+            if process.info['username'] != user or not _is_scraper_browser(process):
+                continue
+            driver = next((ancestor for ancestor in process.parents() if _is_chromedriver(ancestor)), None)
+            if driver is None:
+                orphans.append(process)
+            else:
+                parent = driver.parent()
+                if (parent is None or parent.pid == 1) and driver not in orphans:
+                    orphans.append(driver)
+        except psutil.Error:
+            pass
+    return orphans
+
+
+def cleanup_orphaned_browsers(log=logging.info):
+    """Kill Chrome sessions left behind by crashed runs, with all their helper processes."""
+    processes = []
+    for orphan in find_orphaned_browsers():
+        try:
+            processes.extend([orphan] + orphan.children(recursive=True))
+        except psutil.Error:
+            pass
+    if not processes:
+        return 0
+    killed = terminate_processes(processes)
+    log(f"Cleaned up {killed} orphaned Chrome processes.")
+    metrics.increment('chrome_orphans_killed', killed)
+    return killed
+
+
+class DriverManager:
+    """Keeps one Chrome session alive across scrape iterations.
+
+    The chromedriver path is resolved through webdriver_manager once and
+    cached on disk, so later starts skip its network version check. The
+    session is only restarted when the health check finds it dead, or
+    recycled between searches once it grows past max_rss bytes, has served
+    max_pages searches or is max_age seconds old (each limit off when None).
+    """
+
+    def __init__(self, options, log=logging.info, path_cache=DRIVER_PATH_CACHE,
+                 page_load_timeout=None, on_start=None, max_rss=None, max_pages=None, max_age=None):
+        self.options = options
+        if SESSION_MARKER not in options.arguments:
+            options.add_argument(SESSION_MARKER)
+        self.log = log
+        self.path_cache = Path(path_cache)
+        self.page_load_timeout = page_load_timeout
+        # Called with each new driver, e.g. to send CDP commands that do not survive a restart
+        self.on_start = on_start
+        self.max_rss = max_rss
+        self.max_pages = max_pages
+        self.max_age = max_age
+        self.driver = None
+        self.started_at = 0.0
+        self.pages = 0
+        self.last_rss = 0
+        # Memory before the last recycle, reported with the new session's once it starts
+        self.recycled_rss = None
+        self.startups = 0
+        self.reuses = 0
+        self.recycles = 0
+        self.last_startup_seconds = 0.0
+        self.total_startup_seconds = 0.0
+
+    def resolve_driver_path(self, refresh=False):
+        if not refresh and self.path_cache.exists():
+            cached_path = self.path_cache.read_text().strip()
+            if os.path.exists(cached_path):
+                return cached_path
+            self.log(f"Cached chromedriver path no longer exists: {cached_path}")
+
+        self.log("Resolving chromedriver path with webdriver_manager...")
+        driver_path = ChromeDriverManager().install()
+        try:
+            self.path_cache.write_text(driver_path)
+        except OSError as e:
+            self.log(f"Could not cache chromedriver path: {str(e)}")
+        return driver_path
+
+    def is_healthy(self):
+        if self.driver is None:
+            return False
+        try:
+            self.driver.execute_script("return document.readyState")
+            return True
+        except WebDriverException as e:
+            self.log(f"Chrome session is not responding: {str(e)}")
+            return False
+
+    def start(self):
+        self.log("Initializing Chrome driver...")
+        start = time.perf_counter()
+        try:
+            self.driver = webdriver.Chrome(
+                service=Service(self.resolve_driver_path()), options=self.options)
+        except WebDriverException as e:
+            # Usually a cached chromedriver that no longer matches an updated Chrome
+            self.log(f"Chrome failed to start with cached chromedriver: {str(e)}. Re-resolving...")
+            self.driver = webdriver.Chrome(
+                service=Service(self.resolve_driver_path(refresh=True)), options=self.options)
+        if self.page_load_timeout:
+            self.driver.set_page_load_timeout(self.page_load_timeout)
+        if self.on_start:
+            self.on_start(self.driver)
+        self.last_startup_seconds = time.perf_counter() - start
+        self.total_startup_seconds += self.last_startup_seconds
+        self.startups += 1
+        self.started_at = time.monotonic()
+        self.pages = 0
+        self.log(f"Chrome driver started in {self.last_startup_seconds:.2f}s (startup #{self.startups}).")
+        if self.recycled_rss is not None:
+            rss = self.rss()
+            metrics.observe('chrome_rss_after_recycle_bytes', rss)
+            self.log(f"Recycled Chrome session uses {rss / MB:.0f} MB, down from {self.recycled_rss / MB:.0f} MB.")
+            self.recycled_rss = None
+        return self.driver
+
+    def get_driver(self):
+        if self.is_healthy():
+            self.reuses += 1
+            self.log(f"Reusing Chrome session (reuse #{self.reuses}).")
+            return self.driver
+
+        if self.driver is not None:
+            self.quit()
+        return self.start()
+
+    def quit(self):
+        if self.driver is None:
+            return
+        processes = self.processes()
+        try:
+            self.driver.quit()
+        except WebDriverException as e:
+            self.log(f"Error closing Chrome driver: {str(e)}")
+        self.driver = None
+        # Chrome sometimes leaves renderers or the browser itself running after quit()
+        leftovers = terminate_processes(processes)
+        if leftovers:
+            self.log(f"Killed {leftovers} Chrome processes left running after quit.")
+        self.log("Chrome driver closed.")
+
+    def recycle_reason(self):
+        """Which limit the session has reached, or None. Samples its memory as a side effect."""
+        if self.driver is None:
+            return None
+        self.last_rss = self.rss()
+        if self.max_rss and self.last_rss > self.max_rss:
+            return 'rss'
+        if self.max_pages and self.pages >= self.max_pages:
+            return 'pages'
+        if self.max_age and time.monotonic() - self.started_at > self.max_age:
+            return 'age'
+        return None
+
+    def after_search(self):
+        """Count a finished search and recycle the session if it reached a limit.
+
+        Call only while no search is using the driver.
+        """
+        if self.driver is None:
+            return
+        self.pages += 1
+        reason = self.recycle_reason()
+        if reason is None:
+            return
+        self.log(f"Recycling Chrome session ({reason}): {self.last_rss / MB:.0f} MB after "
+                 f"{self.pages} searches in {(time.monotonic() - self.started_at) / 60:.0f} minutes.")
+        metrics.increment('chrome_recycles', reason=reason)
+        metrics.observe('chrome_rss_before_recycle_bytes', self.last_rss)
+        self.recycles += 1
+        self.recycled_rss = self.last_rss
+        # The next get_driver() starts a fresh session
+        self.quit()
+
+    def processes(self):
+        """The chromedriver process and everything it started (Chrome and its helpers)."""
+        try:
+            root = psutil.Process(self.driver.service.process.pid)
+            return [root] + root.children(recursive=True)
+        except (AttributeError, psutil.Error):
+            return []
+
+    def rss(self):
+        """Resident memory of the chromedriver process tree, in bytes."""
+        total = 0
+        for process in self.processes():
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+
+    def stats(self):
+        return {
+            'startups': self.startups,
+            'reuses': self.reuses,
+            'recycles': self.recycles,
+            'rss_bytes': self.last_rss,
+            'last_startup_seconds': round(self.last_startup_seconds, 3),
+            'total_startup_seconds': round(self.total_startup_seconds, 3),
+        }
+
+
+class DriverPool:
+    """A fixed set of DriverManagers shared by search worker threads.
+
+    Managers are handed out one per search through acquire(), so a worker
+    never shares a Chrome session with another thread.
+    """
+
+    def __init__(self, size, options_factory, log=logging.info, page_load_timeout=None,
+                 on_start=None, max_rss=None, max_pages=None, max_age=None):
+        self.size = size
+        self.managers = [DriverManager(options_factory(), log=log,
+                                       page_load_timeout=page_load_timeout, on_start=on_start,
+                                       max_rss=max_rss, max_pages=max_pages, max_age=max_age)
+                         for _ in range(size)]
+        self.available = queue.Queue()
+        for manager in self.managers:
+            self.available.put(manager)
+
+    @contextmanager
+    def acquire(self):
+        manager = self.available.get()
+        try:
+            yield manager
+        finally:
+            # Between searches: nobody else can be using this session yet
+            try:
+                manager.after_search()
+            finally:
+                self.available.put(manager)
+
+    def quit(self):
+        for manager in self.managers:
+            manager.quit()
+
+    def rss(self):
+        return sum(manager.rss() for manager in self.managers)
+
+    def stats(self):
+        per_browser = [manager.stats() for manager in self.managers]
+        totals = {key: sum(stats[key] for stats in per_browser) for key in per_browser[0]}
+        totals['last_startup_seconds'] = max(stats['last_startup_seconds'] for stats in per_browser)
+        totals['browsers'] = self.size
+        return totals
@@ -0,0 +1,299 @@
+"""Read listings from the JSON state Carousell embeds in its pages.
+
+The server-rendered page carries the search results as a JSON payload that
+the app hydrates from. Reading it skips DOM scraping altogether and gives
+exact prices and posting timestamps. parse_state_listings() returns None when
+there is no payload and raises StateSchemaError when the payload's shape is
+not the one below, so callers can fall back to listing_parser.
+
+Expected card shape (extra keys are ignored):
+
+    {"id": "1313701072", "title": "...", "price": "S$80",
+     "seller": {"username": "..."},
+     "photoUrls": ["https://media.karousell.com/..."],
+     "belowFold": [{"component": "paragraph", "stringContent": "Like new"}],
+     "aboveFold": [{"component": "time_created",
+                    "timestampContent": {"seconds": {"low": 1720690104}}}]}
+
+    python embedded_state.py page.html
+    python embedded_state.py http://127.0.0.1:8765/pages/apple_pencil_gen_1.html
+    python embedded_state.py --check fixtures/state_pages
+    python embedded_state.py --check-http fixtures/state_pages
+
+The URL above is the state page served by
+`python carousell_stub_server.py --corpus fixtures/state_pages`.
+--check-http starts that server itself and fetches every page through
+HttpPageFetcher, as FETCH_MODE "http" does, before comparing.
+"""
+import json
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+from listing_parser import CONDITION_TYPES, parse_price
+
+# <script id="__NEXT_DATA__" type="application/json">{...}</script>
+JSON_SCRIPT_PATTERN = re.compile(
+    r'<script[^>]*\bid="(?:__NEXT_DATA__|__INITIAL_STATE__|initial-state)"[^>]*>(.*?)</script>', re.S)
+# window.initialState = {...};  or  window.initialState = JSON.parse("...");
+ASSIGNMENT_PATTERN = re.compile(
+    r'window\.(?:initialState|__INITIAL_STATE__|__PRELOADED_STATE__)\s*=\s*(JSON\.parse\()?', re.S)
+CARD_LIST_KEYS = ('listingCards', 'listings')
+REQUIRED_CARD_KEYS = ('title', 'price')
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36")
+
+
+class StateSchemaError(ValueError):
+    """The embedded state is there but no longer looks like what the mapping expects."""
+
+
+def find_state(html):
+    """Return the decoded embedded state, or None if the page has none."""
+    match = JSON_SCRIPT_PATTERN.search(html)
+    if match:
+        try:
+            return json.loads(match.group(1))
+        except json.JSONDecodeError as e:
+            raise StateSchemaError(f"Embedded state script is not valid JSON: {e}") from e
+
+    match = ASSIGNMENT_PATTERN.search(html)
+    if not match:
+        return None
+    decoder = json.JSONDecoder()
+    try:
+        value, _ = decoder.raw_decode(html, match.end())
+        # JSON.parse("...") wraps the state in a string literal
+        if match.group(1) and isinstance(value, str):
+            value = json.loads(value)
+    except json.JSONDecodeError as e:
+        raise StateSchemaError(f"Embedded state assignment is not valid JSON: {e}") from e
+    return value
+
+
+def _unwrap(card):
+    return card.get('listingCard', card) if isinstance(card, dict) else card
+
+
+def _looks_like_card(card):
+    card = _unwrap(card)
+    return (isinstance(card, dict) and ('id' in card or 'listingID' in card)
+            and all(key in card for key in REQUIRED_CARD_KEYS))
+
+
+def find_listing_cards(state):
+    """Find the search-result card list anywhere in the state.
+
+    Returns the first list stored under one of CARD_LIST_KEYS, or None if
+    there is none. Raises StateSchemaError if that list's cards are missing
+    the fields the mapping needs.
+    """
+    stack = [state]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key in CARD_LIST_KEYS:
+                cards = node.get(key)
+                if isinstance(cards, list) and cards and isinstance(_unwrap(cards[0]), dict):
+                    cards = [_unwrap(card) for card in cards]
+                    broken = [card for card in cards if not _looks_like_card(card)]
+                    if broken:
+                        raise StateSchemaError(
+                            f"{len(broken)} of {len(cards)} cards under {key!r} lack id/title/price; "
+                            f"first has keys {sorted(broken[0])[:10]}")
+                    return cards
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
+    return None
+
+
+def format_price(value):
+    return f"S${value:,.0f}" if value == int(value) else f"S${value:,.2f}"
+
+
+def relative_time(timestamp, now):
+    """Carousell's own wording for how long ago a listing was posted."""
+    seconds = max(0, now - timestamp)
+    for unit, length in (('year', 365 * 86400), ('month', 30 * 86400), ('day', 86400),
+                         ('hour', 3600), ('minute', 60)):
+        if seconds >= length:
+            count = int(seconds // length)
+            return f"{count} {unit}{'s' if count != 1 else ''} ago"
+    return "just now"
+
+
+def _timestamp(card):
+    for component in card.get('aboveFold') or []:
+        content = component.get('timestampContent') if isinstance(component, dict) else None
+        if not content:
+            continue
+        seconds = content.get('seconds', content)
+        if isinstance(seconds, dict):
+            seconds = seconds.get('low')
+        if isinstance(seconds, (int, float)):
+            return int(seconds)
+    return None
+
+
+def _condition(card):
+    for component in card.get('belowFold') or []:
+        text = component.get('stringContent') if isinstance(component, dict) else None
+        if text in CONDITION_TYPES:
+            return text
+    return 'Not found'
+
+
+def _image_url(card):
+    if card.get('photoUrls'):
+        return card['photoUrls'][0]
+    for key in ('thumbnailURL', 'thumbnailUrl', 'photoUrl'):
+        if card.get(key):
+            return card[key]
+    for media in card.get('media') or []:
+        url = (media.get('photoItem') or {}).get('url') if isinstance(media, dict) else None
+        if url:
+            return url
+    return 'Not found'
+
+
+def map_listing_card(card, now=None):
+    """Map one state card to the dict analyze_listing_card produces.
+
+    Adds 'price_value' (float) and 'posted_at' (Unix seconds), which the
+    rendered page only shows rounded ("3 days ago").
+    """
+    now = time.time() if now is None else now
+    listing_id = str(card.get('id') or card.get('listingID'))
+    price_value = parse_price(card['price'])
+    posted_at = _timestamp(card)
+    seller = card.get('seller') or {}
+    return {
+        'id': listing_id,
+        'title': card['title'],
+        'price': format_price(price_value) if price_value is not None else str(card['price']),
+        'seller_name': seller.get('username', 'Not found') if isinstance(seller, dict) else str(seller),
+        'time': relative_time(posted_at, now) if posted_at is not None else 'Not found',
+        'condition': _condition(card),
+        'image_url': _image_url(card),
+        'href': f"https://www.carousell.sg/p/{listing_id}",
+        'price_value': price_value,
+        'posted_at': posted_at,
+    }
+
+
+def parse_state_listings(html, limit=None, now=None):
+    """Listings from the page's embedded state; None if the page has no state or no cards."""
+    state = find_state(html)
+    if state is None:
+        return None
+    cards = find_listing_cards(state)
+    if cards is None:
+        return None
+    return [map_listing_card(card, now) for card in cards[:limit]]
+
+
+class HttpPageFetcher:
+    """Fetches result pages without a browser over pooled keep-alive connections."""
+
+    def __init__(self, pool_size=4, timeout=30, user_agent=USER_AGENT):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers.update({'User-Agent': user_agent, 'Accept-Language': 'en-SG,en;q=0.9'})
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def fetch(self, url):
+        response = self.session.get(url, timeout=self.timeout)
+        response.raise_for_status()
+        with self.lock:
+            self.requests += 1
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+
+def check_corpus(corpus_dir, over_http=False):
+    """Compare each page's state listings with the recorded .json output.
+
+    The .json file holds {"now": <Unix seconds>, "listings": [...]}, or null
+    for a page that should fall back to DOM scraping. With `over_http`, the
+    pages are served by CarousellStubServer and read through HttpPageFetcher.
+    """
+    stub = fetcher = None
+    if over_http:
+        from carousell_stub_server import CarousellStubServer
+
+        stub = CarousellStubServer(corpus_dir).start()
+        fetcher = HttpPageFetcher()
+    failures = 0
+    try:
+        for page in sorted(Path(corpus_dir).glob('*.html')):
+            expected_path = page.with_suffix('.json')
+            if not expected_path.exists():
+                print(f"{page.name}: no recorded output, skipping")
+                continue
+            with open(expected_path, encoding='utf-8') as f:
+                expected = json.load(f)
+            html = fetcher.fetch(stub.page_url(page.name)) if fetcher else page.read_text(encoding='utf-8')
+            if not _check_page(page.name, html, expected):
+                failures += 1
+    finally:
+        if stub is not None:
+            fetcher.close()
+            stub.stop()
+    return failures
+
+
+def _check_page(name, html, expected):
+    try:
+        parsed = parse_state_listings(html, now=expected['now'] if expected else None)
+    except StateSchemaError as e:
+        parsed = None
+        print(f"{name}: schema changed ({e})")
+    want = expected['listings'] if expected else None
+    if parsed == want:
+        print(f"{name}: {'falls back to DOM scraping' if want is None else f'{len(want)} cards match'}")
+        return True
+    print(f"{name}: parsed {'no state' if parsed is None else len(parsed)}, "
+          f"expected {'no state' if want is None else len(want)}")
+    for got, wanted in zip(parsed or [], want or []):
+        for key in wanted:
+            if got.get(key) != wanted[key]:
+                print(f"  {wanted['id']} {key}: got {got.get(key)!r}, expected {wanted[key]!r}")
+    return False
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] in ('--check', '--check-http'):
+        sys.exit(1 if check_corpus(sys.argv[2], over_http=sys.argv[1] == '--check-http') else 0)
+    if len(sys.argv) != 2 or sys.argv[1].startswith('-'):
+        print("Usage: python embedded_state.py <page.html or URL>")
+        print("       python embedded_state.py --check|--check-http <corpus_dir>")
+        sys.exit(2)
+    if sys.argv[1].startswith(('http://', 'https://')):
+        fetcher = HttpPageFetcher()
+        html = fetcher.fetch(sys.argv[1])
+        fetcher.close()
+    else:
+        with open(sys.argv[1], encoding='utf-8') as f:
+            html = f.read()
+    listings = parse_state_listings(html)
+    if listings is None:
+        print("No embedded listing state found.")
+        sys.exit(1)
+    print(json.dumps(listings, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
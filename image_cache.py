@@ -0,0 +1,240 @@
+"""Listing thumbnails for Telegram notifications, downloaded in the background and cached on disk.
+
+    python image_cache.py stats [cache_dir]
+    python image_cache.py clear [cache_dir]
+"""
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+MB = 1024 * 1024
+DEFAULT_CACHE_DIR = Path(__file__).parent / "image_cache"
+INDEX_FILE = "index.json"
+# Save the URL index after this many new entries, besides on close()
+INDEX_SAVE_EVERY = 50
+
+
+class ImageCache:
+    """Images on disk, named by the SHA-256 of their content.
+
+    An index maps each image URL to its content hash, so URLs serving the
+    same photo share one file. When the files add up to more than
+    `max_bytes`, the least recently used are deleted. Reading or writing a
+    file refreshes its modification time, which keeps that order across
+    restarts.
+    """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=100 * MB):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        # Content hash -> size, least recently used first
+        self.files = OrderedDict()
+        for path in sorted(self.directory.glob('*.img'), key=lambda path: path.stat().st_mtime):
+            self.files[path.stem] = path.stat().st_size
+        self.total_bytes = sum(self.files.values())
+        self.urls = self._load_index()
+        self.unsaved = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self.lock:
+            self._evict()
+
+    def _path(self, digest):
+        return self.directory / f"{digest}.img"
+
+    def _load_index(self):
+        try:
+            with open(self.directory / INDEX_FILE, 'r') as f:
+                urls = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        return {url: digest for url, digest in urls.items() if digest in self.files}
+
+    def save_index(self):
+        with self.lock:
+            # Drop URLs whose file has been evicted
+            self.urls = {url: digest for url, digest in self.urls.items() if digest in self.files}
+            urls = dict(self.urls)
+            self.unsaved = 0
+        temp_path = self.directory / f"{INDEX_FILE}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(urls, f)
+        os.replace(temp_path, self.directory / INDEX_FILE)
+
+    def get(self, url):
+        """The cached image for `url`, or None."""
+        with self.lock:
+            digest = self.urls.get(url)
+            if digest is None or digest not in self.files:
+                self.misses += 1
+                return None
+            self.files.move_to_end(digest)
+        path = self._path(digest)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.total_bytes -= self.files.pop(digest, 0)
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return data
+
+    def put(self, url, data):
+        """Store an image downloaded from `url`; returns its content hash."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        with self.lock:
+            if digest in self.files:
+                self.files.move_to_end(digest)
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+            else:
+                temp_path = path.with_suffix('.tmp')
+                temp_path.write_bytes(data)
+                os.replace(temp_path, path)
+                self.files[digest] = len(data)
+                self.total_bytes += len(data)
+                self._evict()
+            self.urls[url] = digest
+            self.unsaved += 1
+            save = self.unsaved >= INDEX_SAVE_EVERY
+        if save:
+            self.save_index()
+        return digest
+
+    def _evict(self):
+        # The newest file stays even if it alone is over the cap
+        while self.total_bytes > self.max_bytes and len(self.files) > 1:
+            digest, size = self.files.popitem(last=False)
+            try:
+                self._path(digest).unlink()
+            except OSError:
+                pass
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            for digest in self.files:
+                try:
+                    self._path(digest).unlink()
+                except OSError:
+                    pass
+            self.files.clear()
+            self.urls.clear()
+            self.total_bytes = 0
+        self.save_index()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'files': len(self.files),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'urls': len(self.urls),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class ImageFetcher:
+    """Downloads images on a thread pool, through an ImageCache.
+
+    prefetch() returns a Future straight away, so the photos for a burst of
+    new listings download in parallel, over pooled keep-alive connections,
+    while the scrape carries on. A failed or oversized download resolves
+    to None and the listing goes out as text.
+    """
+
+    def __init__(self, cache, pool_size=8, timeout=10, max_image_bytes=5 * MB, log=logging.info):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.cache = cache
+        self.timeout = timeout
+        self.max_image_bytes = max_image_bytes
+        self.log = log
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='image-fetch')
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.failures = 0
+
+    def prefetch(self, url):
+        return self.executor.submit(self.fetch, url)
+
+    def fetch(self, url):
+        data = self.cache.get(url)
+        if data is not None:
+            return data
+        try:
+            data = self._download(url)
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+            self.log(f"Could not download image {url}: {str(e)}")
+            return None
+        self.cache.put(url, data)
+        with self.lock:
+            self.downloads += 1
+        return data
+
+    def _download(self, url):
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            content_type = response.headers.get('Content-Type', '')
+            if not content_type.startswith('image/'):
+                raise ValueError(f"not an image ({content_type or 'no content type'})")
+            chunks = []
+            size = 0
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > self.max_image_bytes:
+                    raise ValueError(f"larger than {self.max_image_bytes} bytes")
+                chunks.append(chunk)
+        return b''.join(chunks)
+
+    def stats(self):
+        stats = self.cache.stats()
+        stats.update(downloads=self.downloads, failures=self.failures)
+        return stats
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.session.close()
+        self.cache.save_index()
+
+
+def main():
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in ('stats', 'clear'):
+        print("Usage: python image_cache.py stats|clear [cache_dir]")
+        sys.exit(2)
+    cache = ImageCache(sys.argv[2] if len(sys.argv) == 3 else DEFAULT_CACHE_DIR, max_bytes=float('inf'))
+    if sys.argv[1] == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.directory}")
+    else:
+        stats = cache.stats()
+        print(f"{stats['files']} images, {stats['bytes'] / MB:.1f} MB, {stats['urls']} URLs in {cache.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Write-ahead journal for new listings, so a crash neither loses nor re-sends one.
+
+Each listing a search accepts is appended to the journal and fsync'd
+before its Telegram message is queued, and a "done" record follows once
+the message has been sent. Accepted listings reach the ListingStore in
+batches: compact() inserts them with INSERT OR IGNORE and rewrites the
+journal with only the listings still waiting to be sent.
+
+After a crash, replay() compacts what the journal holds and returns the
+listings whose messages never went out, including ones Telegram kept
+refusing, so a restart re-sends only those. Every step can be repeated safely; the one duplicate possible is a message
+Telegram accepted just before the crash, ahead of its "done" record.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+
+class ListingJournal:
+    """Append-only journal of accepted listings in front of a ListingStore. Thread-safe."""
+
+    def __init__(self, path, store, compact_every=50, log=logging.info):
+        self.path = str(path)
+        self.store = store
+        self.compact_every = compact_every
+        self.log = log
+        self.lock = threading.Lock()
+        # Listing ID -> accept record, for listings not yet compacted or not yet sent
+        self.entries = {}
+        self.done_ids = set()
+        self.uncompacted = 0
+        self.accepted = 0
+        self.compactions = 0
+        self._read()
+        self.file = open(self.path, 'ab')
+
+    def _read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return
+        torn = 0
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Only a crash mid-append leaves a partial line, and only as the last one
+                torn += 1
+                continue
+            if record['op'] == 'accept':
+                self.entries.setdefault(record['id'], record)
+            elif record['op'] == 'done':
+                self.done_ids.add(record['id'])
+        self.uncompacted = len(self.entries)
+        if torn:
+            self.log(f"Ignored {torn} incomplete records in {self.path}.")
+
+    def _append(self, records):
+        self.file.write(b''.join(json.dumps(record).encode() + b'\n' for record in records))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def accept(self, row, text, image_url=None):
+        """Journal a new listing (a row in EXCEL_HEADERS order) and the message announcing it.
+
+        Returns False if the listing is already journaled or stored, so a
+        listing matched by two searches is only sent once.
+        """
+        listing_id = str(row[0])
+        with self.lock:
+            # Asks the table itself: stored_ids() may skip IDs the seen-index no longer holds
+            if listing_id in self.entries or listing_id in self.store:
+                return False
+            record = {'op': 'accept', 'id': listing_id, 'row': [listing_id] + list(row[1:]),
+                      'text': text, 'image_url': image_url, 'at': time.time()}
+            self._append([record])
+            self.entries[listing_id] = record
+            self.uncompacted += 1
+            self.accepted += 1
+            due = self.uncompacted >= self.compact_every
+        if due:
+            self.compact()
+        return True
+
+    def done(self, listing_ids):
+        """Record that the messages for these listings were sent."""
+        with self.lock:
+            if self.file.closed:
+                # Sent after shutdown began; the listing is sent again after a restart
+                return
+            listing_ids = [listing_id for listing_id in listing_ids
+                           if listing_id in self.entries and listing_id not in self.done_ids]
+            if listing_ids:
+                self._append([{'op': 'done', 'id': listing_id} for listing_id in listing_ids])
+                self.done_ids.update(listing_ids)
+
+    def pending(self):
+        """Accept records whose message has not been sent, oldest first."""
+        with self.lock:
+            return [record for listing_id, record in self.entries.items() if listing_id not in self.done_ids]
+
+    def compact(self):
+        """Store the journaled listings and drop the ones already sent. Returns the number stored."""
+        with self.lock:
+            if self.file.closed or (not self.uncompacted and not self.done_ids):
+                return 0
+            stored = self.store.add_many(record['row'] for record in self.entries.values())
+            self.entries = {listing_id: record for listing_id, record in self.entries.items()
+                            if listing_id not in self.done_ids}
+            self.done_ids = set()
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(b''.join(json.dumps(record).encode() + b'\n' for record in self.entries.values()))
+                f.flush()
+                os.fsync(f.fileno())
+            self.file.close()
+            os.replace(temp_path, self.path)
+            self.file = open(self.path, 'ab')
+            self.uncompacted = 0
+            self.compactions += 1
+            return stored
+
+    def replay(self):
+        """Store whatever a previous run journaled and return the listings it never announced."""
+        stored = self.compact()
+        pending = self.pending()
+        if stored or pending:
+            self.log(f"Recovered from {self.path}: {stored} listings stored, {len(pending)} messages to resend.")
+        return pending
+
+    def stats(self):
+        with self.lock:
+            return {
+                'accepted': self.accepted,
+                'unsent': sum(1 for listing_id in self.entries if listing_id not in self.done_ids),
+                'uncompacted': self.uncompacted,
+                'compactions': self.compactions,
+            }
+
+    def close(self):
+        self.compact()
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,124 @@
+import re
+from collections import Counter
+
+from add_search_url import parse_search_params
+from listing_parser import parse_price
+from search_scheduler import search_key
+
+
+def _as_list(value, key):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, (list, tuple)) or not all(isinstance(item, str) for item in value):
+        raise TypeError(f"{key} must be a string or a list of strings, got {value!r}")
+    return list(value)
+
+
+def _as_price(value, key):
+    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+        raise TypeError(f"{key} must be a number, got {value!r}")
+    return value
+
+
+def _any_of(words):
+    """One case-insensitive regex matching any of the given substrings, or None."""
+    words = [word for word in words if word]
+    if not words:
+        return None
+    return re.compile('|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)),
+                      re.IGNORECASE)
+
+
+class ListingMatcher:
+    """A search item's filters, compiled once and applied to whole batches of listings.
+
+    Search item keys, all optional:
+
+        query            the search text; by default the title must contain it
+                         ("query_match": "phrase"), or every word of it
+                         ("words"), or it is not checked ("none")
+        keywords         further words the title must all contain
+        exclude          words that reject a listing if its title has any
+        regex            pattern(s) the title must all match
+        exclude_regex    pattern(s) that reject a listing if any matches
+        conditions       allowed conditions, e.g. ["Brand new", "Like new"]
+        exclude_sellers  seller usernames to ignore
+        price_start, price_end  price bounds in S$, inclusive
+
+    full_url items take query and price bounds from the URL itself. Keys set
+    on the item override what the URL says.
+    """
+
+    def __init__(self, search_item, exclude_sellers=()):
+        criteria = dict(search_item)
+        if 'full_url' in search_item:
+            url_criteria = parse_search_params(search_item['full_url'])
+            for key in ('query', 'price_start', 'price_end'):
+                if criteria.get(key) is None:
+                    criteria[key] = url_criteria[key]
+
+        query = (criteria.get('query') or '').lower()
+        query_match = criteria.get('query_match', 'phrase')
+        if query_match not in ('phrase', 'words', 'none'):
+            raise ValueError(f"query_match must be 'phrase', 'words' or 'none', got {query_match!r}")
+        if query_match == 'phrase':
+            required = [query] if query else []
+        elif query_match == 'words':
+            required = query.split()
+        else:
+            required = []
+        self.required = required + [word.lower() for word in _as_list(criteria.get('keywords'), 'keywords')]
+        self.excluded = _any_of(_as_list(criteria.get('exclude'), 'exclude'))
+        self.patterns = [re.compile(pattern, re.IGNORECASE)
+                         for pattern in _as_list(criteria.get('regex'), 'regex')]
+        self.excluded_patterns = [re.compile(pattern, re.IGNORECASE)
+                                  for pattern in _as_list(criteria.get('exclude_regex'), 'exclude_regex')]
+        self.conditions = {condition.lower() for condition in _as_list(criteria.get('conditions'), 'conditions')}
+        self.excluded_sellers = {seller.lower() for seller in (_as_list(exclude_sellers, 'EXCLUDE_SELLERS')
+                                                               + _as_list(criteria.get('exclude_sellers'),
+                                                                          'exclude_sellers'))}
+        self.price_start = _as_price(criteria.get('price_start'), 'price_start')
+        self.price_end = _as_price(criteria.get('price_end'), 'price_end')
+
+    def rejection(self, listing):
+        """Why a listing does not match, or None if it does."""
+        title = listing['title'].lower()
+        if any(word not in title for word in self.required):
+            return 'keywords'
+        if self.excluded and self.excluded.search(title):
+            return 'excluded'
+        if any(not pattern.search(title) for pattern in self.patterns):
+            return 'regex'
+        if any(pattern.search(title) for pattern in self.excluded_patterns):
+            return 'excluded'
+        if self.conditions and listing['condition'].lower() not in self.conditions:
+            return 'condition'
+        if self.excluded_sellers and listing['seller_name'].lower() in self.excluded_sellers:
+            return 'seller'
+        if self.price_start is not None or self.price_end is not None:
+            price = listing.get('price_value')
+            if price is None:
+                price = parse_price(listing['price'])
+            if (price is None or (self.price_start is not None and price < self.price_start)
+                    or (self.price_end is not None and price > self.price_end)):
+                return 'price'
+        return None
+
+    def filter(self, listings):
+        """Return the listings that match, in order, and a Counter of rejection reasons."""
+        matched = []
+        rejected = Counter()
+        for listing in listings:
+            reason = self.rejection(listing)
+            if reason is None:
+                matched.append(listing)
+            else:
+                rejected[reason] += 1
+        return matched, rejected
+
+
+def compile_matchers(search_items, exclude_sellers=()):
+    """A ListingMatcher per search item, keyed by search_key()."""
+    return {search_key(item): ListingMatcher(item, exclude_sellers) for item in search_items}
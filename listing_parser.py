@@ -0,0 +1,351 @@
+import json
+import re
+import sys
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+
+# Selector fallbacks shared by the WebDriver, bulk-script and page-source paths.
+# Only the small XPath subset below is used so the page-source parser can
+# evaluate the same expressions without a browser.
+TITLE_MAX_LINE_XPATH = ".//p[contains(@class, 'D_') and contains(@style, '--max-line')]"
+TITLE_IN_LINK_XPATH = ".//p[contains(@class, 'D_')]"
+TITLE_NESTED_XPATH = ".//a//p[contains(@class, 'D_l')]"
+TITLE_CANDIDATES_XPATH = ".//p[contains(@class, 'D_')]"
+SELLER_XPATH = ".//p[@data-testid='listing-card-text-seller-name']"
+PRICE_XPATHS = [
+    ".//p[contains(@class, 'D_ma')]",
+    ".//p[contains(@class, 'D_mc')]",
+    ".//p[contains(text(), 'S$')]"
+]
+TIME_XPATHS = [
+    ".//p[contains(@class, 'D_ow')]",
+    ".//p[contains(@class, 'D_pc')]",
+    ".//p[contains(text(), 'ago')]"
+]
+IMAGE_SELECTORS = [
+    ".//img[contains(@class, 'D_QJ')]",
+    ".//img[contains(@class, 'D_SC')]",
+    ".//img"  # fallback to any image
+]
+CONDITION_TYPES = ['Brand new', 'Like new',
+                   'Lightly used', 'Well used', 'Heavily used']
+LISTING_CARD_XPATH = "//div[starts-with(@data-testid, 'listing-card-')]"
+LISTINGS_CONTAINER_XPATH = "//div[contains(@class, 'browse-listings')]"
+
+PAGE_BASE_URL = "https://www.carousell.sg/"
+# Below this many cards a process pool costs more to start than it saves
+POOL_MIN_CARDS = 24
+
+VOID_ELEMENTS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+                 'link', 'meta', 'param', 'source', 'track', 'wbr'}
+NON_TEXT_ELEMENTS = {'script', 'style', 'noscript', 'template', 'head'}
+# --check puts these ahead of each card: str.splitlines() breaks lines at all of them
+CARD_START_PATTERN = re.compile(r'(?=<div data-testid="listing-card-\d)')
+LINE_BREAKS = '\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029\r\n'
+
+_STEP_RE = re.compile(r"(\.?//)([\w*-]+)(?:\[(.*?)\])?(?=//|$)")
+_PREDICATE_RE = re.compile(
+    r"^(contains|starts-with)\((@[\w-]+|text\(\)),\s*'([^']*)'\)$|^(@[\w-]+)='([^']*)'$")
+
+
+class Node:
+    __slots__ = ('tag', 'attrs', 'children', 'start', 'end')
+
+    def __init__(self, tag, attrs, start=0):
+        self.tag = tag
+        self.attrs = attrs
+        self.children = []
+        self.start = start
+        self.end = start
+
+    def get(self, name):
+        return self.attrs.get(name)
+
+    def descendants(self):
+        stack = list(reversed(self.children))
+        while stack:
+            node = stack.pop()
+            if isinstance(node, Node):
+                yield node
+                stack.extend(reversed(node.children))
+
+    def first_text(self):
+        # XPath's text() in contains() only looks at the first direct text node
+        for child in self.children:
+            if isinstance(child, str):
+                return child
+        return ''
+
+    @property
+    def text(self):
+        # Approximates WebElement.text: rendered text with whitespace collapsed
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            elif node.tag not in NON_TEXT_ELEMENTS:
+                stack.extend(reversed(node.children))
+        return ' '.join(''.join(parts).replace('\xa0', ' ').split())
+
+
+class _TreeBuilder(HTMLParser):
+    def __init__(self, html):
+        super().__init__(convert_charrefs=True)
+        self.html = html
+        self.root = Node('#document', {})
+        self.stack = [self.root]
+        # getpos() counts only "\n" as a line break, unlike str.splitlines()
+        self.line_offsets = [0]
+        for line in html.split('\n'):
+            self.line_offsets.append(self.line_offsets[-1] + len(line) + 1)
+
+    def source_offset(self):
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def handle_starttag(self, tag, attrs):
+        node = Node(tag, {name: value or '' for name, value in attrs}, self.source_offset())
+        self.stack[-1].children.append(node)
+        if tag in VOID_ELEMENTS:
+            node.end = node.start + len(self.get_starttag_text())
+        else:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        node = Node(tag, {name: value or '' for name, value in attrs}, self.source_offset())
+        node.end = node.start + len(self.get_starttag_text())
+        self.stack[-1].children.append(node)
+
+    def handle_endtag(self, tag):
+        # Browsers tolerate stray and missing end tags; close up to the nearest match
+        for depth in range(len(self.stack) - 1, 0, -1):
+            if self.stack[depth].tag == tag:
+                end = self.html.find('>', self.source_offset()) + 1
+                for node in self.stack[depth:]:
+                    node.end = end
+                del self.stack[depth:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+def build_tree(html):
+    builder = _TreeBuilder(html)
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def _compile_predicate(expression):
+    match = _PREDICATE_RE.match(expression.strip())
+    if not match:
+        raise ValueError(f"Unsupported XPath predicate: {expression}")
+    function, operand, value, equals_attr, equals_value = match.groups()
+    if equals_attr:
+        return lambda node: node.get(equals_attr[1:]) == equals_value
+    if operand == 'text()':
+        def read(node): return node.first_text()
+    else:
+        def read(node): return node.get(operand[1:])
+    if function == 'contains':
+        return lambda node: value in (read(node) or '')
+    return lambda node: (read(node) or '').startswith(value)
+
+
+_compiled_xpaths = {}
+
+
+def compile_xpath(xpath):
+    """Compile the descendant-only XPath subset used by the selector lists."""
+    if xpath in _compiled_xpaths:
+        return _compiled_xpaths[xpath]
+    steps = []
+    position = 0
+    for match in _STEP_RE.finditer(xpath):
+        if match.start() != position:
+            break
+        _, tag, predicate = match.groups()
+        predicates = [_compile_predicate(part)
+                      for part in re.split(r"\s+and\s+", predicate)] if predicate else []
+        steps.append((tag, predicates))
+        position = match.end()
+    if not steps or position != len(xpath):
+        raise ValueError(f"Unsupported XPath expression: {xpath}")
+    _compiled_xpaths[xpath] = steps
+    return steps
+
+
+def find_all(context, xpath):
+    nodes = [context]
+    for tag, predicates in compile_xpath(xpath):
+        matches = []
+        seen = set()
+        for node in nodes:
+            for candidate in node.descendants():
+                if id(candidate) in seen:
+                    continue
+                if (tag == '*' or candidate.tag == tag) and all(p(candidate) for p in predicates):
+                    seen.add(id(candidate))
+                    matches.append(candidate)
+        # Keep document order when several context nodes contribute matches
+        matches.sort(key=lambda node: node.start)
+        nodes = matches
+    return nodes
+
+
+def find_first(context, xpath):
+    if len(compile_xpath(xpath)) == 1:
+        tag, predicates = compile_xpath(xpath)[0]
+        for candidate in context.descendants():
+            if (tag == '*' or candidate.tag == tag) and all(p(candidate) for p in predicates):
+                return candidate
+        return None
+    matches = find_all(context, xpath)
+    return matches[0] if matches else None
+
+
+def find_first_of(context, xpaths):
+    for xpath in xpaths:
+        element = find_first(context, xpath)
+        if element is not None:
+            return element
+    return None
+
+
+def find_title(card):
+    # Same four strategies, in the same order, as find_title_dynamically
+    title = find_first(card, TITLE_MAX_LINE_XPATH)
+    if title is not None:
+        return title
+
+    links = [node for node in card.descendants() if node.tag == 'a']
+    if len(links) > 1:
+        title = find_first(links[1], TITLE_IN_LINK_XPATH)
+        if title is not None:
+            return title
+
+    title = find_first(card, TITLE_NESTED_XPATH)
+    if title is not None:
+        return title
+
+    elements = find_all(card, TITLE_CANDIDATES_XPATH)
+    if elements:
+        return max(elements, key=lambda e: len(e.text) if not (e.text.startswith('S$') or e.get('data-testid') == 'listing-card-text-seller-name') else 0)
+    return None
+
+
+def _text(element):
+    return element.text if element is not None else 'Not found'
+
+
+def analyze_card_node(card, base_url=PAGE_BASE_URL):
+    condition = None
+    for condition_type in CONDITION_TYPES:
+        condition = find_first(card, f".//p[contains(text(), '{condition_type}')]")
+        if condition is not None:
+            break
+
+    listing_id = card.get('data-testid').replace('listing-card-', '')
+    image = find_first_of(card, IMAGE_SELECTORS)
+    image_src = image.get('src') if image is not None else None
+
+    return {
+        'id': listing_id,
+        'title': _text(find_title(card)),
+        'price': _text(find_first_of(card, PRICE_XPATHS)),
+        'seller_name': _text(find_first(card, SELLER_XPATH)),
+        'time': _text(find_first_of(card, TIME_XPATHS)),
+        'condition': _text(condition),
+        'image_url': urllib.parse.urljoin(base_url, image_src) if image_src is not None else 'Not found',
+        'href': f"https://www.carousell.sg/p/{listing_id}"
+    }
+
+
+def parse_price(price):
+    """'S$1,250' or 1250 -> 1250.0; None if there is no number."""
+    if isinstance(price, (int, float)):
+        return float(price)
+    match = re.search(r'\d[\d,]*(?:\.\d+)?', str(price or ''))
+    return float(match.group(0).replace(',', '')) if match else None
+
+
+def parse_card_html(card_html):
+    root = build_tree(card_html)
+    return analyze_card_node(find_all(root, LISTING_CARD_XPATH)[0])
+
+
+def parse_listing_page(html, limit=None, processes=0):
+    """Extract listing dicts from a saved results page without a browser.
+
+    With ``processes`` set and a page of at least POOL_MIN_CARDS cards, each
+    card's markup is sliced out of the page and analyzed in a process pool.
+    """
+    cards = find_all(build_tree(html), LISTING_CARD_XPATH)[:limit]
+    if processes and len(cards) >= POOL_MIN_CARDS:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return list(pool.map(parse_card_html,
+                                 [html[card.start:card.end] for card in cards],
+                                 chunksize=max(1, len(cards) // (processes * 4))))
+    return [analyze_card_node(card) for card in cards]
+
+
+def _parse_sliced_cards(html):
+    """Analyze each card from its own slice of the page, as the process pool does."""
+    return [parse_card_html(html[card.start:card.end]) for card in find_all(build_tree(html), LISTING_CARD_XPATH)]
+
+
+def check_corpus(corpus_dir):
+    """Re-parse every saved page and compare with the recorded analyze_listing_card output.
+
+    Each page is also parsed card by card from slices of a copy with
+    unusual line breaks between the cards, which must not move the slices.
+    """
+    failures = 0
+    pages = sorted(Path(corpus_dir).glob('*.html'))
+    for page in pages:
+        expected_path = page.with_suffix('.json')
+        if not expected_path.exists():
+            print(f"{page.name}: no recorded output, skipping")
+            continue
+        with open(page, encoding='utf-8') as f:
+            html = f.read()
+        parsed = parse_listing_page(html)
+        with open(expected_path, encoding='utf-8') as f:
+            expected = json.load(f)
+        try:
+            sliced = _parse_sliced_cards(CARD_START_PATTERN.sub(LINE_BREAKS, html))
+        except IndexError:
+            sliced = None
+        if sliced != expected:
+            failures += 1
+            print(f"{page.name}: cards sliced from the page don't match once line breaks are added")
+        if parsed == expected:
+            print(f"{page.name}: {len(parsed)} cards match")
+            continue
+        failures += 1
+        print(f"{page.name}: parsed {len(parsed)} cards, expected {len(expected)}")
+        for got, want in zip(parsed, expected):
+            for key in want:
+                if got.get(key) != want[key]:
+                    print(f"  {want['id']} {key}: got {got.get(key)!r}, expected {want[key]!r}")
+    return failures
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == '--check':
+        sys.exit(1 if check_corpus(sys.argv[2]) else 0)
+    if len(sys.argv) != 2 or sys.argv[1].startswith('-'):
+        print("Usage: python listing_parser.py <page.html>")
+        print("       python listing_parser.py --check <corpus_dir>")
+        sys.exit(2)
+    with open(sys.argv[1], encoding='utf-8') as f:
+        print(json.dumps(parse_listing_page(f.read()), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import argparse
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+DB_PATH = Path(__file__).parent / "carousell_listings.db"
+# Bumped when what the seen-index holds changes, so an older one is rebuilt
+SEEN_INDEX_VERSION = '2'
+EXCEL_PATH = Path(__file__).parent / "carousell_listings.xlsx"
+
+# Same columns, in the same order, as the rows save_to_excel used to append
+EXCEL_HEADERS = ["Listing ID", "Href", "Seller", "Time Posted",
+                 "Product Details", "Price", "Condition", "Image URL"]
+COLUMNS = ["listing_id", "href", "seller", "time_posted",
+           "product_details", "price", "condition", "image_url"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listings (
+    listing_id TEXT PRIMARY KEY,
+    href TEXT,
+    seller TEXT,
+    time_posted TEXT,
+    product_details TEXT,
+    price TEXT,
+    condition TEXT,
+    image_url TEXT,
+    saved_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+CREATE TABLE IF NOT EXISTS seen (
+    search TEXT NOT NULL,
+    listing_id TEXT NOT NULL,
+    seen_at TEXT NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (search, listing_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class ListingStore:
+    """SQLite store of every listing seen, keyed by listing ID.
+
+    One connection is shared by the search worker threads and guarded by a
+    lock; WAL mode keeps readers such as export-xlsx from blocking the scraper.
+
+    With `seen_index`, a SeenIndex in `<db_path>.seen.*` answers lookups for
+    IDs that are certainly new without touching the database. Stored
+    listings stay in it for good; IDs only analyzed by a search expire after
+    `seen_ttl` seconds, like their rows in the seen table. Rows another
+    process adds while this store is open are not in the index, so claiming a
+    listing (add(), or `listing_id in store`) always asks the table itself.
+    """
+
+    def __init__(self, db_path=DB_PATH, seen_index=False, seen_ttl=None):
+        self.db_path = str(db_path)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+        self.seen_index = self._open_seen_index(seen_ttl) if seen_index else None
+
+    def _open_seen_index(self, ttl):
+        from seen_index import PERMANENT, SeenIndex
+
+        prefix = f"{self.db_path}.seen"
+        index = SeenIndex(prefix, ttl=ttl)
+        if (not len(index) and len(self)) or self.get_meta('seen_index_version') != SEEN_INDEX_VERSION:
+            # First run with the index, its files were deleted or it predates permanent IDs:
+            # rebuild it from the database
+            index.close()
+            with self.lock:
+                entries = self.connection.execute(
+                    "SELECT listing_id, ? FROM listings "
+                    "UNION ALL SELECT listing_id, CAST(strftime('%s', seen_at) AS INTEGER) FROM seen",
+                    (PERMANENT,)).fetchall()
+            index = SeenIndex.build(prefix, entries, ttl=ttl)
+            self.set_meta('seen_index_version', SEEN_INDEX_VERSION)
+        return index
+
+    def _maybe_known(self, listing_ids):
+        if self.seen_index is None:
+            return listing_ids
+        return self.seen_index.candidates(listing_ids)
+
+    def __contains__(self, listing_id):
+        with self.lock:
+            return self.connection.execute(
+                "SELECT 1 FROM listings WHERE listing_id = ?", (str(listing_id),)).fetchone() is not None
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def add(self, row):
+        """Insert one row in EXCEL_HEADERS order. Returns False if the ID was already stored."""
+        with self.lock:
+            cursor = self.connection.execute(
+                f"INSERT OR IGNORE INTO listings ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [str(row[0])] + list(row[1:]))
+            self.connection.commit()
+        if self.seen_index is not None:
+            self.seen_index.add([str(row[0])], permanent=True)
+        return cursor.rowcount == 1
+
+    def add_many(self, rows):
+        rows = [[str(row[0])] + list(row[1:]) for row in rows]
+        with self.lock:
+            before = self.connection.total_changes
+            self.connection.executemany(
+                f"INSERT OR IGNORE INTO listings ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                rows)
+            self.connection.commit()
+            added = self.connection.total_changes - before
+        if self.seen_index is not None:
+            self.seen_index.add((row[0] for row in rows), permanent=True)
+        return added
+
+    def stored_ids(self, listing_ids):
+        """The subset of listing_ids already stored (by this process, or before it opened the store)."""
+        listing_ids = self._maybe_known([str(listing_id) for listing_id in listing_ids])
+        stored = set()
+        with self.lock:
+            for start in range(0, len(listing_ids), 500):
+                chunk = listing_ids[start:start + 500]
+                stored.update(row[0] for row in self.connection.execute(
+                    f"SELECT listing_id FROM listings WHERE listing_id IN ({', '.join('?' * len(chunk))})",
+                    chunk))
+        return stored
+
+    def known_ids(self, search, listing_ids):
+        """The subset of listing_ids already stored, or already analyzed by this search."""
+        listing_ids = self._maybe_known([str(listing_id) for listing_id in listing_ids])
+        known = set()
+        with self.lock:
+            # Stay well under SQLite's bound-parameter limit
+            for start in range(0, len(listing_ids), 500):
+                chunk = listing_ids[start:start + 500]
+                placeholders = ', '.join('?' * len(chunk))
+                known.update(row[0] for row in self.connection.execute(
+                    f"SELECT listing_id FROM listings WHERE listing_id IN ({placeholders}) "
+                    f"UNION SELECT listing_id FROM seen WHERE search = ? AND listing_id IN ({placeholders})",
+                    chunk + [search] + chunk))
+        return known
+
+    def mark_seen(self, search, listing_ids):
+        """Record cards a search has analyzed, including ones that did not match it."""
+        listing_ids = [str(listing_id) for listing_id in listing_ids]
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO seen (search, listing_id) VALUES (?, ?)",
+                ((search, listing_id) for listing_id in listing_ids))
+            self.connection.commit()
+        if self.seen_index is not None:
+            self.seen_index.add(listing_ids)
+
+    def expire_seen(self, ttl):
+        """Forget which cards searches analyzed more than `ttl` seconds ago. Returns the rows deleted."""
+        with self.lock:
+            cursor = self.connection.execute(
+                "DELETE FROM seen WHERE seen_at < datetime('now', ?)", (f"-{int(ttl)} seconds",))
+            self.connection.commit()
+        if self.seen_index is not None:
+            self.seen_index.compact_if_due()
+        return cursor.rowcount
+
+    def rows(self):
+        with self.lock:
+            return self.connection.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM listings ORDER BY rowid").fetchall()
+
+    def iter_rows(self, batch_size=1000):
+        """Every stored row, oldest first, a batch at a time.
+
+        Reads through a connection of its own, so a long export neither holds
+        the whole history in memory nor blocks the scraper's writes.
+        """
+        connection = sqlite3.connect(self.db_path)
+        try:
+            cursor = connection.execute(f"SELECT {', '.join(COLUMNS)} FROM listings ORDER BY rowid")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                yield from rows
+        finally:
+            connection.close()
+
+    def last_rowid(self):
+        with self.lock:
+            return self.connection.execute("SELECT MAX(rowid) FROM listings").fetchone()[0] or 0
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+            return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+            self.connection.commit()
+
+    def import_workbook(self, excel_path=EXCEL_PATH):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(excel_path, read_only=True)
+        try:
+            rows = (row[:len(COLUMNS)] for row in workbook.active.iter_rows(min_row=2, values_only=True)
+                    if row and row[0] is not None)
+            return self.add_many(rows)
+        finally:
+            workbook.close()
+
+    def migrate_from_workbook(self, excel_path=EXCEL_PATH, log=print):
+        """Import the legacy workbook once; later calls are no-ops."""
+        if self.get_meta('migrated_from_xlsx'):
+            return 0
+        imported = 0
+        if os.path.exists(excel_path):
+            log(f"Importing existing listings from {excel_path} into {self.db_path}...")
+            imported = self.import_workbook(excel_path)
+            log(f"Imported {imported} listings.")
+        self.set_meta('migrated_from_xlsx', str(excel_path))
+        return imported
+
+    def export_workbook(self, excel_path=EXCEL_PATH):
+        from openpyxl import Workbook
+
+        # Write-only mode streams rows, so memory stays flat however long the history
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(EXCEL_HEADERS)
+        last_rowid = self.last_rowid()
+        count = 0
+        for row in self.iter_rows():
+            sheet.append(list(row))
+            count += 1
+        temp_path = f"{excel_path}.tmp"
+        workbook.save(temp_path)
+        try:
+            os.replace(temp_path, excel_path)
+        except OSError:
+            # On Windows the spreadsheet cannot be replaced while it is open in Excel
+            os.remove(temp_path)
+            raise
+        self.set_meta(f'exported_rowid:{excel_path}', str(last_rowid))
+        return count
+
+    def export_workbook_if_changed(self, excel_path=EXCEL_PATH):
+        """Export only if listings were added since the last export to excel_path. Returns the count or None."""
+        if (self.get_meta(f'exported_rowid:{excel_path}') == str(self.last_rowid())
+                and os.path.exists(excel_path)):
+            return None
+        return self.export_workbook(excel_path)
+
+    def close(self):
+        if self.seen_index is not None:
+            self.seen_index.close()
+        with self.lock:
+            self.connection.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the Carousell listing database.")
+    parser.add_argument('--db', default=str(DB_PATH), help="SQLite database path")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    export_parser = subcommands.add_parser('export-xlsx', help="Write all stored listings to a spreadsheet")
+    export_parser.add_argument('path', nargs='?', default=str(EXCEL_PATH))
+    import_parser = subcommands.add_parser('import-xlsx', help="Import listings from a spreadsheet")
+    import_parser.add_argument('path', nargs='?', default=str(EXCEL_PATH))
+    args = parser.parse_args()
+
+    store = ListingStore(args.db)
+    try:
+        if args.command == 'export-xlsx':
+            count = store.export_workbook(args.path)
+            print(f"Exported {count} listings to {args.path}")
+        elif args.command == 'import-xlsx':
+            count = store.import_workbook(args.path)
+            store.set_meta('migrated_from_xlsx', args.path)
+            # The scraper's seen-index does not have these yet; it is rebuilt on its next start
+            store.set_meta('seen_index_version', None)
+            print(f"Imported {count} new listings from {args.path}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+import time
+from collections import defaultdict, deque
+
+# Runs inside the page: a MutationObserver re-counts cards on every DOM change
+# and a short interval notices when the count has stopped changing. Times come
+# from performance.now(), i.e. milliseconds since navigation started.
+READINESS_JS = """
+const [xpath, containerXpath, quietMs, emptyQuietMs, timeoutMs] = arguments;
+const done = arguments[arguments.length - 1];
+const evaluate = (expression, type) => document.evaluate(expression, document, null, type, null);
+const count = () => evaluate(`count(${xpath})`, XPathResult.NUMBER_TYPE).numberValue;
+const hasContainer = () => evaluate(containerXpath, XPathResult.FIRST_ORDERED_NODE_TYPE).singleNodeValue !== null;
+const start = performance.now();
+let firstCard = null, lastCount = -1, lastChange = start, finished = false;
+const finish = (timedOut) => {
+    finished = true;
+    observer.disconnect();
+    clearInterval(timer);
+    const now = performance.now();
+    done({cards: lastCount, first_card_ms: firstCard, stable_ms: timedOut ? null : now,
+          waited_ms: now - start, timed_out: timedOut});
+};
+const check = () => {
+    if (finished) return;
+    const now = performance.now();
+    const cards = count();
+    if (cards > 0 && firstCard === null) firstCard = now;
+    if (cards !== lastCount) { lastCount = cards; lastChange = now; }
+    if (cards > 0 && now - lastChange >= quietMs) finish(false);
+    // A search with no results: the container is there and nothing changes for a while
+    else if (cards === 0 && now - lastChange >= emptyQuietMs && document.readyState === 'complete'
+             && hasContainer()) finish(false);
+    else if (now - start >= timeoutMs) finish(true);
+};
+const observer = new MutationObserver(check);
+observer.observe(document.documentElement, {childList: true, subtree: true});
+const timer = setInterval(check, 100);
+check();
+"""
+
+
+def _seconds(milliseconds):
+    return None if milliseconds is None else milliseconds / 1000
+
+
+def wait_for_listings(driver, card_xpath, container_xpath, timeout, quiet=0.75, empty_quiet=3.0):
+    """Wait until the number of listing cards stops changing for `quiet` seconds.
+
+    Returns a dict with the card count, time to first card and time to a
+    stable count (seconds since navigation started; None if not reached),
+    seconds spent waiting and whether the wait timed out. The driver's script
+    timeout must be longer than `timeout`.
+    """
+    from selenium.common.exceptions import TimeoutException, WebDriverException
+
+    try:
+        result = driver.execute_async_script(
+            READINESS_JS, card_xpath, container_xpath, quiet * 1000, empty_quiet * 1000, timeout * 1000)
+        return {
+            'cards': max(0, result['cards']),
+            'first_card_seconds': _seconds(result['first_card_ms']),
+            'stable_seconds': _seconds(result['stable_ms']),
+            'waited_seconds': _seconds(result['waited_ms']),
+            'timed_out': result['timed_out'],
+        }
+    except TimeoutException:
+        return {'cards': 0, 'first_card_seconds': None, 'stable_seconds': None,
+                'waited_seconds': timeout, 'timed_out': True}
+    except WebDriverException:
+        # e.g. a page that blocks script injection; count cards from outside instead
+        return poll_for_listings(driver, card_xpath, timeout, quiet)
+
+
+def poll_for_listings(driver, card_xpath, timeout, quiet=0.75, interval=0.25):
+    """Fallback for wait_for_listings that polls the card count over WebDriver."""
+    from selenium.webdriver.common.by import By
+
+    start = time.perf_counter()
+    first_card = None
+    last_count, last_change = -1, start
+    while True:
+        now = time.perf_counter()
+        cards = len(driver.find_elements(By.XPATH, card_xpath))
+        if cards and first_card is None:
+            first_card = now - start
+        if cards != last_count:
+            last_count, last_change = cards, now
+        if cards and now - last_change >= quiet:
+            return {'cards': cards, 'first_card_seconds': first_card, 'stable_seconds': now - start,
+                    'waited_seconds': now - start, 'timed_out': False}
+        if now - start >= timeout:
+            return {'cards': cards, 'first_card_seconds': first_card, 'stable_seconds': None,
+                    'waited_seconds': now - start, 'timed_out': True}
+        time.sleep(interval)
+
+
+class AdaptiveTimeout:
+    """Per-search readiness timeout learned from recent load times.
+
+    The timeout is `factor` times the slowest of the last `history` loads,
+    within [minimum, maximum]. A search without history starts at `initial`;
+    a timed-out wait doubles that search's timeout so a slow spell does not
+    keep failing.
+    """
+
+    def __init__(self, initial=45, minimum=10, maximum=90, factor=3, history=20):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.factor = factor
+        self.load_times = defaultdict(lambda: deque(maxlen=history))
+        self.overrides = {}
+
+    def _clamp(self, seconds):
+        return max(self.minimum, min(self.maximum, seconds))
+
+    def timeout(self, key):
+        if key in self.overrides:
+            return self.overrides[key]
+        load_times = self.load_times.get(key)
+        if not load_times:
+            return self._clamp(self.initial)
+        return self._clamp(max(load_times) * self.factor)
+
+    def record(self, key, seconds):
+        self.overrides.pop(key, None)
+        self.load_times[key].append(seconds)
+
+    def record_timeout(self, key):
+        self.overrides[key] = self._clamp(self.timeout(key) * 2)
+        return self.overrides[key]
@@ -0,0 +1,95 @@
+import json
+import logging
+import random
+import sys
+import threading
+from logging.handlers import RotatingFileHandler
+
+CONSOLE_FORMAT = "[Step %(step)s]: %(message)s"
+
+
+class StepCounter(logging.Filter):
+    """Numbers each emitted record. Runs only for records that pass the level check."""
+
+    def __init__(self):
+        super().__init__()
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        with self.lock:
+            self.count += 1
+            record.step = self.count
+        return True
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per line; the message is only %-formatted here, at emit time."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S') + f".{int(record.msecs):03d}",
+            'level': record.levelname,
+            'step': getattr(record, 'step', None),
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging(name, log_file, level=logging.INFO, max_bytes=5 * 1024 * 1024,
+                  backup_count=5, console=True):
+    """(Re)configure a logger that writes JSON lines to a size-rotated file.
+
+    The logger does not propagate, so it stays out of whatever basicConfig a
+    wrapper script such as background_carousell_scraper.py has set up.
+    """
+    logger = logging.getLogger(name)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    # Keep numbering steps across reconfiguration
+    if not any(isinstance(existing, StepCounter) for existing in logger.filters):
+        logger.addFilter(StepCounter())
+
+    logger.setLevel(level if isinstance(level, int) else logging.getLevelName(level.upper()))
+    logger.propagate = False
+
+    file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                       backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonLinesFormatter())
+    logger.addHandler(file_handler)
+
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        logger.addHandler(console_handler)
+    return logger
+
+
+class HtmlCapture:
+    """Decides whether a debug HTML dump is worth its WebDriver round-trip.
+
+    Modes: "off" (default), "failures" (only when extraction or loading
+    failed), "sample" (failures plus `sample_rate` of other dumps) and "all".
+    """
+
+    MODES = ('off', 'failures', 'sample', 'all')
+
+    def __init__(self, mode='off', sample_rate=0.01):
+        if mode not in self.MODES:
+            raise ValueError(f"HTML capture mode must be one of {', '.join(self.MODES)}, got {mode!r}")
+        self.mode = mode
+        self.sample_rate = sample_rate
+
+    def enabled(self, failure=False):
+        if self.mode == 'all':
+            return True
+        if self.mode == 'off':
+            return False
+        if failure:
+            return True
+        return self.mode == 'sample' and random.random() < self.sample_rate
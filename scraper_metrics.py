@@ -0,0 +1,269 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Recent samples kept per series; enough for percentiles without growing forever
+MAX_SAMPLES = 1000
+# Histogram bucket upper bounds, in seconds unless set_buckets() says otherwise
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+METRICS_PREFIX = "carousell_"
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+class Histogram:
+    __slots__ = ('bounds', 'bucket_counts', 'count', 'total')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.bucket_counts = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        for index, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.bucket_counts[index] += 1
+                break
+
+
+class Metrics:
+    """Thread-safe in-process counters, gauges and timing samples.
+
+    Every observed value also lands in a cumulative histogram, so totals and
+    bucket counts cover the whole run while `samples` keeps only recent values
+    for percentiles. Gauges are either set directly or read from a callback
+    each time the metrics are exported.
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.samples = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self.histograms = {}
+        self.buckets = {}
+        self.gauges = {}
+        self.gauge_callbacks = {}
+
+    def increment(self, name, amount=1, **labels):
+        with self.lock:
+            self.counters[_series_key(name, labels)] += amount
+
+    def observe(self, name, value, **labels):
+        key = _series_key(name, labels)
+        with self.lock:
+            self.samples[key].append(value)
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.buckets.get(name, DEFAULT_BUCKETS))
+            histogram.add(value)
+
+    def set_buckets(self, name, bounds):
+        """Bucket bounds for a histogram that is not measured in seconds."""
+        with self.lock:
+            self.buckets[name] = tuple(sorted(bounds))
+
+    def set_gauge(self, name, value, **labels):
+        with self.lock:
+            self.gauges[_series_key(name, labels)] = value
+
+    def register_gauge(self, name, callback):
+        """Read a gauge from callback() whenever metrics are exported."""
+        with self.lock:
+            self.gauge_callbacks[name] = callback
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name, **labels):
+        with self.lock:
+            if labels:
+                return self.counters.get(_series_key(name, labels), 0)
+            return sum(value for (series, _), value in self.counters.items() if series == name)
+
+    def values(self, name, **labels):
+        """Samples for one labelled series, or for every series of `name` without labels."""
+        with self.lock:
+            if labels:
+                return list(self.samples.get(_series_key(name, labels), ()))
+            return [value for (series, _), values in self.samples.items()
+                    if series == name for value in values]
+
+    def series(self, name):
+        with self.lock:
+            return {labels: list(values) for (series, labels), values in self.samples.items()
+                    if series == name}
+
+    def summary(self, name, **labels):
+        values = sorted(self.values(name, **labels))
+        if not values:
+            return {'count': 0}
+        return {
+            'count': len(values),
+            'total': sum(values),
+            'mean': sum(values) / len(values),
+            'p50': values[len(values) // 2],
+            'p95': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'max': values[-1],
+        }
+
+    def gauge_values(self):
+        with self.lock:
+            values = dict(self.gauges)
+            callbacks = list(self.gauge_callbacks.items())
+        for name, callback in callbacks:
+            try:
+                values[(name, ())] = callback()
+            except Exception:
+                # A gauge whose source has gone away (e.g. a closed browser) is skipped
+                continue
+        return values
+
+    def prometheus_text(self, prefix=METRICS_PREFIX):
+        """All metrics in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted((key, (list(h.bounds), list(h.bucket_counts), h.count, h.total))
+                                for key, h in self.histograms.items())
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            metric = f"{prefix}{name}_total"
+            declare(metric, 'counter')
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+        for (name, labels), value in sorted(self.gauge_values().items()):
+            metric = f"{prefix}{name}"
+            declare(metric, 'gauge')
+            lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+        for (name, labels), (bounds, bucket_counts, count, total) in histograms:
+            metric = f"{prefix}{name}"
+            declare(metric, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, bucket_counts):
+                cumulative += bucket_count
+                lines.append(f"{metric}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        """JSON-friendly view: counters and gauges per series, and a summary per histogram series."""
+        with self.lock:
+            counters = list(self.counters.items())
+            histogram_keys = [(key, h.count, h.total) for key, h in self.histograms.items()]
+        snapshot = {
+            'counters': [{'name': name, 'labels': dict(labels), 'value': value}
+                         for (name, labels), value in sorted(counters)],
+            'gauges': [{'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in sorted(self.gauge_values().items())],
+            'histograms': [],
+        }
+        for (name, labels), count, total in sorted(histogram_keys):
+            recent = self.summary(name, **dict(labels))
+            snapshot['histograms'].append({
+                'name': name, 'labels': dict(labels), 'count': count, 'sum': total,
+                'mean': total / count if count else None,
+                'p50': recent.get('p50'), 'p95': recent.get('p95'), 'max': recent.get('max'),
+            })
+        return snapshot
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.samples.clear()
+            self.histograms.clear()
+            self.gauges.clear()
+
+
+class MetricsServer:
+    """Serves metrics on a local port: /metrics (Prometheus text) and /metrics.json.
+
+    `status` is an optional callable whose dict is added to the JSON, e.g.
+    the search schedule.
+    """
+
+    def __init__(self, metrics, host='127.0.0.1', port=9178, status=None):
+        self.metrics = metrics
+        self.status = status
+        self.started = time.time()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics-server', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def json_body(self):
+        body = {'uptime_seconds': time.time() - self.started}
+        body.update(self.metrics.snapshot())
+        if self.status:
+            body['status'] = self.status()
+        return body
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?')[0]
+                if path == '/metrics':
+                    body = server.metrics.prometheus_text().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path in ('/metrics.json', '/status'):
+                    body = json.dumps(server.json_body(), default=str).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+metrics = Metrics()
@@ -0,0 +1,269 @@
+"""Runs the scraper as a child process and keeps it running.
+
+    python scraper_supervisor.py
+
+- Restarts the child after a crash, waiting SUPERVISOR_BACKOFF_INITIAL
+  seconds and doubling that (up to SUPERVISOR_BACKOFF_MAX) while crashes
+  keep coming. A child that ran for SUPERVISOR_STABLE_AFTER seconds resets
+  the delay.
+- Restarts the child when it and its Chrome processes together use more than
+  SUPERVISOR_MEMORY_LIMIT_MB of resident memory.
+- SIGTERM (what stop_scraper.py sends) or removing the PID file stops the
+  child gracefully; it gets SUPERVISOR_STOP_TIMEOUT seconds to finish its
+  current search before it and its browsers are killed.
+- SIGHUP restarts the child so it picks up config.json changes, and re-reads
+  the supervisor's own settings.
+
+The supervisor's PID goes in carousell_scraper.pid, so stop_scraper.py and
+check_scraper_status.py work with it as they did with the old background
+script.
+"""
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import psutil
+
+SCRIPT_DIR = Path(__file__).parent
+PID_FILE = SCRIPT_DIR / "carousell_scraper.pid"
+CONFIG_FILE = SCRIPT_DIR / "config.json"
+CHILD_SCRIPT = SCRIPT_DIR / "background_carousell_scraper.py"
+LOG_DIR = SCRIPT_DIR / "logs"
+
+DEFAULT_SETTINGS = {
+    'SUPERVISOR_MEMORY_LIMIT_MB': 2048,
+    'SUPERVISOR_BACKOFF_INITIAL': 5,
+    'SUPERVISOR_BACKOFF_MAX': 300,
+    'SUPERVISOR_STABLE_AFTER': 600,
+    'SUPERVISOR_STOP_TIMEOUT': 90,
+    'SUPERVISOR_CHECK_INTERVAL': 5,
+}
+
+
+def load_settings(config_file=CONFIG_FILE):
+    settings = dict(DEFAULT_SETTINGS)
+    try:
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+        settings.update({key: config[key] for key in DEFAULT_SETTINGS if key in config})
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning(f"Could not read supervisor settings from {config_file}: {e}. Using defaults.")
+    return settings
+
+
+def process_tree(process):
+    """The process and all its descendants that are still alive."""
+    try:
+        return [process] + process.children(recursive=True)
+    except psutil.Error:
+        return []
+
+
+def tree_rss(processes):
+    total = 0
+    for process in processes:
+        try:
+            total += process.memory_info().rss
+        except psutil.Error:
+            pass
+    return total
+
+
+def kill_processes(processes, timeout=10):
+    """Terminate, then kill whatever is left after `timeout` seconds."""
+    alive = []
+    for process in processes:
+        try:
+            if process.is_running():
+                process.terminate()
+                alive.append(process)
+        except psutil.Error:
+            pass
+    _, alive = psutil.wait_procs(alive, timeout=timeout)
+    for process in alive:
+        try:
+            process.kill()
+        except psutil.Error:
+            pass
+    return len(alive)
+
+
+class Supervisor:
+    def __init__(self, command, pid_file=PID_FILE, settings=None, cwd=SCRIPT_DIR):
+        self.command = command
+        self.pid_file = Path(pid_file)
+        self.settings = settings or load_settings()
+        self.cwd = cwd
+        self.child = None
+        self.child_started = 0.0
+        # Descendants seen while the child ran; Chrome outlives a crashed child otherwise
+        self.known_processes = {}
+        self.stopping = False
+        self.reload_requested = False
+        self.restarts = 0
+
+    def install_signal_handlers(self):
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, self._request_reload)
+
+    def _request_stop(self, signum, frame):
+        logging.info(f"Received signal {signum}. Stopping the scraper...")
+        self.stopping = True
+
+    def _request_reload(self, signum, frame):
+        logging.info("Received SIGHUP. Restarting the scraper with the current config...")
+        self.reload_requested = True
+
+    def write_pid_file(self):
+        with open(self.pid_file, 'w') as f:
+            f.write(str(os.getpid()))
+
+    def remove_pid_file(self):
+        # Only if it is still ours; stop_scraper.py may already have removed it
+        try:
+            if int(self.pid_file.read_text().strip()) == os.getpid():
+                self.pid_file.unlink()
+        except (OSError, ValueError):
+            pass
+
+    def start_child(self):
+        LOG_DIR.mkdir(exist_ok=True)
+        # The scraper logs to its own files; keep stderr for tracebacks from crashes
+        with open(LOG_DIR / "scraper_stderr.log", 'ab') as stderr:
+            self.child = subprocess.Popen(self.command, cwd=self.cwd, stdin=subprocess.DEVNULL,
+                                          stdout=subprocess.DEVNULL, stderr=stderr)
+        self.child_started = time.monotonic()
+        self.known_processes = {}
+        logging.info(f"Started scraper (PID: {self.child.pid}).")
+
+    def _child_processes(self):
+        try:
+            processes = process_tree(psutil.Process(self.child.pid))
+        except psutil.Error:
+            processes = []
+        for process in processes:
+            self.known_processes[process.pid] = process
+        return processes
+
+    def watch_child(self):
+        """Wait for a reason to act: 'exited', 'memory', 'reload' or 'stop'."""
+        limit = self.settings['SUPERVISOR_MEMORY_LIMIT_MB'] * 1024 * 1024
+        next_check = 0.0
+        while True:
+            if self.stopping or not self.pid_file.exists():
+                return 'stop'
+            if self.reload_requested:
+                self.reload_requested = False
+                return 'reload'
+            if self.child.poll() is not None:
+                return 'exited'
+            if time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.settings['SUPERVISOR_CHECK_INTERVAL']
+                rss = tree_rss(self._child_processes())
+                if limit and rss > limit:
+                    logging.warning(f"Scraper and its browsers use {rss / 1024 / 1024:.0f} MB, over the "
+                                    f"{limit / 1024 / 1024:.0f} MB limit. Restarting it.")
+                    return 'memory'
+            time.sleep(0.5)
+
+    def stop_child(self):
+        """Ask the child to stop, then kill it and any browsers it leaves behind."""
+        if self.child is None:
+            return
+        self._child_processes()
+        if self.child.poll() is None:
+            logging.info(f"Stopping scraper (PID: {self.child.pid})...")
+            try:
+                # On Windows terminate() kills outright, but the scraper also
+                # stops by itself once the PID file is gone, so give it that chance
+                if os.name != 'nt' or self.pid_file.exists():
+                    self.child.terminate()
+                self.child.wait(timeout=self.settings['SUPERVISOR_STOP_TIMEOUT'])
+            except subprocess.TimeoutExpired:
+                logging.warning("Scraper did not stop in time. Killing it.")
+        self.cleanup_orphans()
+        self.child = None
+
+    def cleanup_orphans(self):
+        leftovers = []
+        for process in self.known_processes.values():
+            try:
+                if process.is_running():
+                    leftovers.append(process)
+            except psutil.Error:
+                pass
+        if leftovers:
+            killed = kill_processes(leftovers)
+            logging.info(f"Cleaned up {len(leftovers)} leftover processes ({killed} needed killing).")
+        self.known_processes = {}
+
+    def sleep(self, seconds):
+        """Sleep, waking early for a stop or reload request."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            if self.stopping or self.reload_requested or not self.pid_file.exists():
+                return
+            time.sleep(0.5)
+
+    def run(self):
+        self.install_signal_handlers()
+        self.write_pid_file()
+        logging.info(f"Supervisor started. PID: {os.getpid()}. Settings: {self.settings}")
+        backoff = self.settings['SUPERVISOR_BACKOFF_INITIAL']
+        try:
+            while True:
+                self.start_child()
+                reason = self.watch_child()
+                if reason == 'stop':
+                    self.stop_child()
+                    break
+                if reason == 'reload':
+                    self.stop_child()
+                    self.settings = load_settings()
+                    backoff = self.settings['SUPERVISOR_BACKOFF_INITIAL']
+                    continue
+                ran_for = time.monotonic() - self.child_started
+                if reason == 'memory':
+                    self.stop_child()
+                    problem = f"Scraper went over the memory limit after {ran_for:.0f}s."
+                else:
+                    returncode = self.child.returncode
+                    self.cleanup_orphans()
+                    self.child = None
+                    if returncode == 0:
+                        # The scraper only exits cleanly when told to stop
+                        logging.info("Scraper exited normally.")
+                        break
+                    problem = f"Scraper exited with code {returncode} after {ran_for:.0f}s."
+
+                if ran_for >= self.settings['SUPERVISOR_STABLE_AFTER']:
+                    backoff = self.settings['SUPERVISOR_BACKOFF_INITIAL']
+                self.restarts += 1
+                logging.error(f"{problem} Restarting in {backoff:.0f}s (restart #{self.restarts}).")
+                self.sleep(backoff)
+                backoff = min(self.settings['SUPERVISOR_BACKOFF_MAX'], backoff * 2)
+                if self.stopping or not self.pid_file.exists():
+                    break
+        finally:
+            self.stop_child()
+            self.remove_pid_file()
+            logging.info("Supervisor stopped.")
+
+
+def main():
+    LOG_DIR.mkdir(exist_ok=True)
+    logging.basicConfig(filename=LOG_DIR / "supervisor.log", level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - %(message)s')
+    supervisor = Supervisor([sys.executable, str(CHILD_SCRIPT), '--supervised'])
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
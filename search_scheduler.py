@@ -0,0 +1,150 @@
+import heapq
+import itertools
+import json
+import time
+
+from add_search_url import search_item_url
+
+
+def search_key(search_item):
+    """Stable identity for a search item, independent of its position in the config."""
+    return json.dumps(search_item, sort_keys=True)
+
+
+def search_name(search_item):
+    """What a search looks for, for logs and for recognising an edited search."""
+    return search_item.get('query') or search_item.get('full_url')
+
+
+class SearchSchedule:
+    __slots__ = ('search_item', 'interval', 'next_run', 'quiet_runs')
+
+    def __init__(self, search_item, interval, next_run):
+        self.search_item = search_item
+        self.interval = interval
+        self.next_run = next_run
+        self.quiet_runs = 0
+
+
+class SearchScheduler:
+    """Priority queue of searches, each with its own adaptive interval.
+
+    A search that turns up new listings is checked more often (interval times
+    `speedup`), one that stays quiet less often (interval times `slowdown`),
+    always within [min_interval, max_interval]. A search item may set its own
+    starting "interval" in seconds.
+    """
+
+    def __init__(self, search_items, default_interval=3600, min_interval=300,
+                 max_interval=4 * 3600, speedup=0.5, slowdown=1.5, clock=time.time):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.clock = clock
+        self.schedules = {}
+        self.heap = []
+        self.counter = itertools.count()
+        self.set_items(search_items)
+
+    def _clamp(self, interval):
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def _push(self, key):
+        heapq.heappush(self.heap, (self.schedules[key].next_run, next(self.counter), key))
+
+    def set_items(self, search_items):
+        """Sync with the configured searches.
+
+        New searches are due now and removed ones are dropped. An edited
+        search (same results URL, other settings changed) keeps its
+        interval and next run time, unless its "interval" was changed.
+        Returns the added keys, the removed keys and (old key, new key)
+        pairs for the edited searches.
+        """
+        now = self.clock()
+        items = dict(zip((search_key(item) for item in search_items), search_items))
+        added = [key for key in items if key not in self.schedules]
+        removed = [key for key in self.schedules if key not in items]
+        updated = []
+        for new_key in list(added):
+            # Not by search_name: the same query in another category is another search
+            url = search_item_url(items[new_key])
+            old_key = next((key for key in removed if search_item_url(self.schedules[key].search_item) == url),
+                           None)
+            if old_key is not None:
+                updated.append((old_key, new_key))
+                added.remove(new_key)
+                removed.remove(old_key)
+        for key in removed:
+            # Heap entries for removed searches are skipped when they surface
+            del self.schedules[key]
+        for old_key, new_key in updated:
+            schedule = self.schedules.pop(old_key)
+            if items[new_key].get('interval') != schedule.search_item.get('interval'):
+                schedule.interval = self._clamp(items[new_key].get('interval', self.default_interval))
+                schedule.next_run = min(schedule.next_run, now + schedule.interval)
+            schedule.search_item = items[new_key]
+            self.schedules[new_key] = schedule
+            self._push(new_key)
+        for key in added:
+            interval = self._clamp(items[key].get('interval', self.default_interval))
+            self.schedules[key] = SearchSchedule(items[key], interval, now)
+            self._push(key)
+        return added, removed, updated
+
+    def due(self, now=None):
+        """Return the search items whose next run time has passed, most overdue first."""
+        now = self.clock() if now is None else now
+        due_items = []
+        seen = set()
+        for next_run, _, key in sorted(self.heap):
+            if next_run > now:
+                break
+            schedule = self.schedules.get(key)
+            if schedule is None or schedule.next_run != next_run or key in seen:
+                continue
+            seen.add(key)
+            due_items.append(schedule.search_item)
+        return due_items
+
+    def record(self, search_item, new_count, now=None):
+        """Reschedule a search after a run. new_count=None (failed run) keeps the interval."""
+        key = search_key(search_item)
+        schedule = self.schedules.get(key)
+        if schedule is None:
+            return None
+        now = self.clock() if now is None else now
+        if new_count:
+            schedule.interval = self._clamp(schedule.interval * self.speedup)
+            schedule.quiet_runs = 0
+        elif new_count is not None:
+            schedule.interval = self._clamp(schedule.interval * self.slowdown)
+            schedule.quiet_runs += 1
+        schedule.next_run = now + schedule.interval
+        self._push(key)
+        self._discard_stale()
+        return schedule.interval
+
+    def _discard_stale(self):
+        while self.heap:
+            next_run, _, key = self.heap[0]
+            schedule = self.schedules.get(key)
+            if schedule is not None and schedule.next_run == next_run:
+                return
+            heapq.heappop(self.heap)
+
+    def seconds_until_next(self, now=None):
+        self._discard_stale()
+        if not self.heap:
+            return None
+        now = self.clock() if now is None else now
+        return max(0.0, self.heap[0][0] - now)
+
+    def summary(self):
+        return [{
+            'search': search_name(schedule.search_item),
+            'interval': round(schedule.interval),
+            'next_run_in': round(schedule.next_run - self.clock()),
+        } for schedule in sorted(self.schedules.values(), key=lambda s: s.next_run)]
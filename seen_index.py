@@ -0,0 +1,423 @@
+"""Compact on-disk index of every listing ID the scraper has seen.
+
+Lets ListingStore skip the database for IDs that are certainly new, which
+on a busy search is most of a page. The index lives in four files next to
+the database:
+
+    <prefix>.ids    sorted uint64 listing IDs, memory-mapped
+    <prefix>.times  uint32 Unix time each ID was first seen, same order
+    <prefix>.log    IDs added since the last compaction, appended as they come
+    <prefix>.bloom  Bloom filter over all of the above, plus a JSON header
+
+A lookup checks the Bloom filter first: a miss means the ID is certainly
+new. A hit is confirmed against the recent IDs and a binary search of the
+sorted array. compact() merges the log into the array, drops IDs older
+than the TTL and rebuilds the filter; it runs by itself once the log gets
+long or the oldest ID is past the TTL. IDs added as permanent (stored
+listings) get the time PERMANENT and never expire.
+
+    python seen_index.py benchmark 1000000 10000000
+"""
+import array
+import bisect
+import heapq
+import itertools
+import json
+import math
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+LOG_RECORD = struct.Struct('<QI')
+UINT64_MASK = (1 << 64) - 1
+# Multipliers for the two hashes the Bloom filter's positions are derived from
+HASH_MULTIPLIER_1 = 0x9E3779B97F4A7C15
+HASH_MULTIPLIER_2 = 0xC2B2AE3D27D4EB4F
+# First-seen time of IDs that never expire; later than any real time
+PERMANENT = 0xFFFFFFFF
+
+
+def listing_number(listing_id):
+    """The listing ID as an integer, or None if it is not a plain number."""
+    try:
+        number = int(listing_id)
+    except (TypeError, ValueError):
+        return None
+    return number if 0 <= number <= UINT64_MASK else None
+
+
+class BloomFilter:
+    """A bit array with `hashes` bits set per item; no false negatives."""
+
+    def __init__(self, bit_count, hashes, bits=None):
+        self.bit_count = bit_count
+        self.hashes = hashes
+        self.bits = bits if bits is not None else bytearray((bit_count + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate=0.01):
+        # Standard sizing: m = -n ln p / (ln 2)^2, k = m/n ln 2
+        capacity = max(capacity, 1024)
+        bit_count = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        hashes = max(1, round(bit_count / capacity * math.log(2)))
+        return cls(bit_count, hashes)
+
+    def _positions(self, number):
+        first = (number * HASH_MULTIPLIER_1) & UINT64_MASK
+        second = (((number ^ (number >> 29)) * HASH_MULTIPLIER_2) & UINT64_MASK) | 1
+        bit_count = self.bit_count
+        return [(first + index * second) % bit_count for index in range(self.hashes)]
+
+    def add(self, number):
+        bits = self.bits
+        for position in self._positions(number):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, number):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(number))
+
+    def save(self, path):
+        header = json.dumps({'bit_count': self.bit_count, 'hashes': self.hashes}).encode()
+        with open(path, 'wb') as f:
+            f.write(struct.pack('<I', len(header)) + header)
+            f.write(self.bits)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            (header_length,) = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(header_length))
+            bits = bytearray(f.read())
+        if len(bits) != (header['bit_count'] + 7) // 8:
+            raise ValueError(f"{path} is truncated")
+        return cls(header['bit_count'], header['hashes'], bits)
+
+
+class SeenIndex:
+    """Persistent set of listing IDs with first-seen times; see the module docstring.
+
+    `ttl` is in seconds (None keeps IDs forever). Thread-safe.
+    """
+
+    def __init__(self, prefix, ttl=None, compact_after=100000, error_rate=0.01, clock=time.time):
+        self.prefix = str(prefix)
+        self.ttl = ttl
+        self.compact_after = compact_after
+        self.error_rate = error_rate
+        self.clock = clock
+        self.lock = threading.Lock()
+        self._ids_map = self._times_map = None
+        self.ids = self.times = ()
+        self.recent = {}
+        self.compactions = 0
+        self._open_arrays()
+        self._read_log()
+        self.log_file = open(self._path('log'), 'ab')
+        try:
+            self.bloom = BloomFilter.load(self._path('bloom'))
+            # The filter is saved on close and compaction only; after a crash the log holds IDs it lacks
+            for number in self.recent:
+                self.bloom.add(number)
+        except (OSError, ValueError, KeyError):
+            self.bloom = self._build_bloom()
+        self.oldest = min(self.times) if len(self.times) else None
+        self.compact_if_due()
+
+    def _path(self, suffix):
+        return f"{self.prefix}.{suffix}"
+
+    def _map(self, suffix, typecode):
+        path = self._path(suffix)
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None, array.array(typecode)
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mapped, memoryview(mapped).cast(typecode)
+
+    def _open_arrays(self):
+        self._ids_map, self.ids = self._map('ids', 'Q')
+        self._times_map, self.times = self._map('times', 'I')
+        if len(self.ids) != len(self.times):
+            # A compaction was interrupted between its two renames; start the arrays over
+            self._close_arrays()
+            self.ids, self.times = array.array('Q'), array.array('I')
+
+    def _close_arrays(self):
+        for view, mapped in ((self.ids, self._ids_map), (self.times, self._times_map)):
+            if isinstance(view, memoryview):
+                view.release()
+            if mapped is not None:
+                mapped.close()
+        self._ids_map = self._times_map = None
+        self.ids = self.times = ()
+
+    def _read_log(self):
+        try:
+            with open(self._path('log'), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return
+        # A torn last record from a crash is ignored
+        for offset in range(0, len(data) - LOG_RECORD.size + 1, LOG_RECORD.size):
+            number, seen_at = LOG_RECORD.unpack_from(data, offset)
+            if seen_at == PERMANENT or number not in self.recent:
+                self.recent[number] = seen_at
+
+    def _build_bloom(self):
+        bloom = BloomFilter.for_capacity(2 * (len(self.ids) + len(self.recent)), self.error_rate)
+        for number in self.ids:
+            bloom.add(number)
+        for number in self.recent:
+            bloom.add(number)
+        return bloom
+
+    def __len__(self):
+        with self.lock:
+            return len(self.ids) + sum(1 for number in self.recent if not self._in_array(number))
+
+    def _in_array(self, number):
+        position = bisect.bisect_left(self.ids, number)
+        return position < len(self.ids) and self.ids[position] == number
+
+    def _contains(self, number):
+        return number in self.bloom and (number in self.recent or self._in_array(number))
+
+    def _is_permanent(self, number):
+        if number in self.recent:
+            return self.recent[number] == PERMANENT
+        position = bisect.bisect_left(self.ids, number)
+        return position < len(self.ids) and self.ids[position] == number and self.times[position] == PERMANENT
+
+    def __contains__(self, listing_id):
+        number = listing_number(listing_id)
+        if number is None:
+            return False
+        with self.lock:
+            return self._contains(number)
+
+    def candidates(self, listing_ids):
+        """The IDs that may have been seen: those in the index, and any that are not plain numbers."""
+        with self.lock:
+            return [listing_id for listing_id in listing_ids
+                    if (listing_number(listing_id) is None or self._contains(listing_number(listing_id)))]
+
+    def add(self, listing_ids, seen_at=None, permanent=False):
+        """Record IDs as seen; returns how many were new to the index.
+
+        `permanent` IDs are kept past the TTL, including ones already in the index.
+        """
+        seen_at = PERMANENT if permanent else int(self.clock() if seen_at is None else seen_at)
+        added = 0
+        with self.lock:
+            records = []
+            for listing_id in listing_ids:
+                number = listing_number(listing_id)
+                if number is None:
+                    continue
+                if self._contains(number):
+                    if not permanent or self._is_permanent(number):
+                        continue
+                    # A stored listing that was only analyzed before: keep it past the TTL from now on
+                    self.recent[number] = seen_at
+                    records.append(LOG_RECORD.pack(number, seen_at))
+                    continue
+                added += 1
+                self.recent[number] = seen_at
+                self.bloom.add(number)
+                records.append(LOG_RECORD.pack(number, seen_at))
+            if records:
+                self.log_file.write(b''.join(records))
+                self.log_file.flush()
+            due = len(self.recent) >= self.compact_after
+        if due:
+            self.compact()
+        return added
+
+    def compact_if_due(self):
+        with self.lock:
+            expired = (self.ttl is not None and self.oldest is not None
+                       and self.oldest < self.clock() - self.ttl * 1.1)
+            due = expired or len(self.recent) >= self.compact_after
+        if due:
+            self.compact()
+
+    def compact(self):
+        """Merge recent IDs into the sorted array and drop expired ones. Returns the number dropped."""
+        with self.lock:
+            cutoff = int(self.clock() - self.ttl) if self.ttl is not None else None
+            ids = array.array('Q')
+            times = array.array('I')
+            dropped = 0
+            merged = heapq.merge(zip(self.ids, self.times), sorted(self.recent.items()))
+            for number, entries in itertools.groupby(merged, key=lambda entry: entry[0]):
+                # Sorted by time too, so the first is when the ID was first seen; PERMANENT sorts last
+                entry_times = [seen_at for _, seen_at in entries]
+                seen_at = PERMANENT if entry_times[-1] == PERMANENT else entry_times[0]
+                if cutoff is not None and seen_at < cutoff:
+                    dropped += 1
+                    continue
+                ids.append(number)
+                times.append(seen_at)
+
+            # Readers of the old files go away first; Windows cannot replace a mapped file
+            self._close_arrays()
+            for suffix, values in (('ids', ids), ('times', times)):
+                with open(self._path(f'{suffix}.tmp'), 'wb') as f:
+                    values.tofile(f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(self._path(f'{suffix}.tmp'), self._path(suffix))
+            self.recent = {}
+            self.log_file.close()
+            self.log_file = open(self._path('log'), 'wb')
+            self._open_arrays()
+            self.bloom = self._build_bloom()
+            self.bloom.save(self._path('bloom.tmp'))
+            os.replace(self._path('bloom.tmp'), self._path('bloom'))
+            self.oldest = min(times) if times else None
+            self.compactions += 1
+            return dropped
+
+    @classmethod
+    def build(cls, prefix, entries, **options):
+        """Create an index from (listing ID, first seen Unix time or PERMANENT) pairs, replacing any existing one."""
+        first_seen = {}
+        for listing_id, seen_at in entries:
+            number = listing_number(listing_id)
+            if number is None:
+                continue
+            current = first_seen.get(number)
+            if current is None or seen_at == PERMANENT or (current != PERMANENT and seen_at < current):
+                first_seen[number] = int(seen_at)
+        numbers = sorted(first_seen)
+        return cls.from_sorted(prefix, array.array('Q', numbers),
+                               array.array('I', (first_seen[number] for number in numbers)), **options)
+
+    @classmethod
+    def from_sorted(cls, prefix, ids, times, **options):
+        """Create an index from a sorted, duplicate-free array of IDs and their first-seen times."""
+        for suffix in ('log', 'bloom'):
+            try:
+                os.remove(f"{prefix}.{suffix}")
+            except OSError:
+                pass
+        for suffix, values in (('ids', ids), ('times', times)):
+            with open(f"{prefix}.{suffix}", 'wb') as f:
+                values.tofile(f)
+        return cls(prefix, **options)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'ids': len(self.ids),
+                'recent': len(self.recent),
+                'bloom_bytes': len(self.bloom.bits),
+                'array_bytes': len(self.ids) * 12,
+                'compactions': self.compactions,
+            }
+
+    def close(self):
+        with self.lock:
+            self.bloom.save(self._path('bloom.tmp'))
+            os.replace(self._path('bloom.tmp'), self._path('bloom'))
+            self.log_file.close()
+            self._close_arrays()
+
+
+def _rss():
+    import psutil
+    return psutil.Process().memory_info().rss
+
+
+def benchmark(size, lookups=200000, seed=1):
+    """Build an index of `size` random IDs and time lookups of present and absent IDs."""
+    rng = random.Random(seed)
+    # Carousell IDs are ten-digit numbers
+    present = rng.sample(range(1000000000, 2000000000), size)
+    now = int(time.time())
+    workdir = tempfile.mkdtemp(prefix="seen-index-bench-")
+    prefix = str(Path(workdir) / "seen")
+
+    probe_present = [str(listing_id) for listing_id in rng.sample(present, min(lookups, size))]
+    probe_absent = [str(rng.randrange(2000000000, 3000000000)) for _ in range(lookups)]
+    present.sort()
+    ids = array.array('Q', present)
+    del present
+    times = array.array('I', (now - rng.randrange(86400 * 365) for _ in range(size)))
+
+    start = time.perf_counter()
+    SeenIndex.from_sorted(prefix, ids, times).close()
+    build_seconds = time.perf_counter() - start
+    del ids, times
+
+    rss_before = _rss()
+    start = time.perf_counter()
+    index = SeenIndex(prefix)
+    open_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    found = sum(1 for listing_id in probe_present if listing_id in index)
+    present_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    false_hits = sum(1 for listing_id in probe_absent if listing_id in index)
+    absent_seconds = time.perf_counter() - start
+    rss_after = _rss()
+    bloom_hits = sum(1 for listing_id in probe_absent if int(listing_id) in index.bloom)
+    stats = index.stats()
+    index.close()
+    disk_bytes = sum(os.path.getsize(path) for path in Path(workdir).iterdir())
+    for path in Path(workdir).iterdir():
+        path.unlink()
+    os.rmdir(workdir)
+    return {
+        'ids': size,
+        'build_seconds': round(build_seconds, 1),
+        'open_seconds': round(open_seconds, 3),
+        'present_lookups_per_second': round(len(probe_present) / present_seconds),
+        'absent_lookups_per_second': round(len(probe_absent) / absent_seconds),
+        'found': found == len(probe_present),
+        'false_positives': false_hits,
+        'bloom_false_positive_rate': round(bloom_hits / len(probe_absent), 4),
+        'resident_bytes': rss_after - rss_before,
+        'bloom_bytes': stats['bloom_bytes'],
+        'disk_bytes': disk_bytes,
+    }
+
+
+def set_baseline(size, seed=1):
+    """Resident memory of the same IDs held the old way, as a set of strings."""
+    rng = random.Random(seed)
+    rss_before = _rss()
+    ids = {str(listing_id) for listing_id in rng.sample(range(1000000000, 2000000000), size)}
+    resident = _rss() - rss_before
+    del ids
+    return resident
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != 'benchmark':
+        print("Usage: python seen_index.py benchmark [size ...]")
+        sys.exit(2)
+    sizes = [int(size) for size in sys.argv[2:]] or [1000000, 10000000]
+    for size in sizes:
+        result = benchmark(size)
+        print(f"{size:,} ids: built in {result['build_seconds']}s, opened in {result['open_seconds']}s")
+        print(f"  lookups: {result['present_lookups_per_second']:,}/s for seen IDs, "
+              f"{result['absent_lookups_per_second']:,}/s for new IDs "
+              f"(Bloom false positives {result['bloom_false_positive_rate']:.2%}, "
+              f"confirmed false positives {result['false_positives']})")
+        print(f"  memory: {result['resident_bytes'] / 1024 / 1024:.1f} MB resident after lookups "
+              f"(Bloom filter {result['bloom_bytes'] / 1024 / 1024:.1f} MB), "
+              f"{result['disk_bytes'] / 1024 / 1024:.1f} MB on disk")
+        if size <= 1000000:
+            print(f"  a set of ID strings would hold {set_baseline(size) / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
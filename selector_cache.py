@@ -0,0 +1,218 @@
+"""Learns which selector fallback works on each page layout and tries it first.
+
+    python selector_cache.py stats [stats_file]
+    python selector_cache.py clear [stats_file]
+
+Card fields are found by trying a list of strategies (XPaths, title
+heuristics, condition texts) in order, and over WebDriver each miss is a
+round-trip. SelectorCache keeps hit and miss counts per layout, field and
+strategy. The strategy that last matched is tried first; only when it misses
+are the others probed, best hit rate first. Strategies that keep missing on a
+layout are skipped, except right after the winner misses and on every
+REPROBE_EVERY-th lookup, when the whole list is tried again. The counts are
+saved to a JSON file so the order survives restarts.
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+DEFAULT_STATS_FILE = Path(__file__).parent / "selector_stats.json"
+# Layouts not seen for the longest are forgotten beyond this many
+MAX_LAYOUTS = 20
+# A strategy that misses this many times in a row is skipped...
+DEAD_AFTER = 5
+# ...except on every this many lookups of the field, which try every strategy
+REPROBE_EVERY = 100
+
+
+def hit_rate(hits, misses):
+    # Smoothed, so an untried strategy ranks above one that keeps missing
+    return (hits + 1) / (hits + misses + 2)
+
+
+class SelectorCache:
+    """Per-layout strategy order and hit counts. Thread-safe.
+
+    A layout is any string that changes when the page's markup does; the
+    scraper uses the listing cards' obfuscated class names. Strategy names
+    must be stable across runs, since they key the saved counts.
+    """
+
+    def __init__(self, path=None, max_layouts=MAX_LAYOUTS, log=logging.info, metrics=None):
+        self.path = Path(path) if path else None
+        self.max_layouts = max_layouts
+        self.log = log
+        self.metrics = metrics
+        self.lock = threading.Lock()
+        # layout -> {'used': timestamp, 'fields': {field -> counts}}
+        self.layouts = self._load()
+        self.dirty = False
+
+    def _load(self):
+        if self.path is None:
+            return {}
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            data = json.dumps(self.layouts, indent=1)
+            self.dirty = False
+        temp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with open(temp_path, 'w') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
+
+    def _field(self, layout, field):
+        entry = self.layouts.get(layout)
+        if entry is None:
+            entry = self.layouts[layout] = {'used': time.time(), 'fields': {}}
+            if len(self.layouts) > self.max_layouts:
+                oldest = min(self.layouts, key=lambda key: self.layouts[key]['used'])
+                del self.layouts[oldest]
+        entry['used'] = time.time()
+        return entry['fields'].setdefault(
+            field, {'winner': None, 'lookups': 0, 'hits': {}, 'misses': {}, 'streak': {}})
+
+    def order(self, layout, field, names, fallbacks=0, sticky=True):
+        """The strategies to try, in order, and the set of them to skip unless the winner misses.
+
+        The last `fallbacks` names are catch-alls: always tried, always last
+        and in the given order, so a loose match never takes the place of a
+        specific selector. The others are ranked by hit rate, ties keeping
+        their order; with `sticky`, the last one to match goes first and
+        those on a miss streak are skipped between reprobes.
+        """
+        specific, catch_all = names[:len(names) - fallbacks], names[len(names) - fallbacks:]
+        with self.lock:
+            stats = self._field(layout, field)
+            ranked = sorted(specific, key=lambda name: -hit_rate(stats['hits'].get(name, 0),
+                                                                 stats['misses'].get(name, 0)))
+            if not sticky:
+                return ranked + catch_all, set()
+            if stats['winner'] in ranked:
+                ranked.remove(stats['winner'])
+                ranked.insert(0, stats['winner'])
+            skip = set()
+            if stats['lookups'] % REPROBE_EVERY:
+                skip = {name for name in ranked
+                        if name != stats['winner'] and stats['streak'].get(name, 0) >= DEAD_AFTER}
+        return ranked + catch_all, skip
+
+    def record(self, layout, field, tried, hit, specific=True):
+        """Count a lookup: `tried` strategies in order, the last one matched if `hit`.
+
+        If it was a `specific` strategy, it becomes the one tried first.
+        """
+        misses = tried[:-1] if hit else tried
+        with self.lock:
+            stats = self._field(layout, field)
+            stats['lookups'] += 1
+            for name in misses:
+                stats['misses'][name] = stats['misses'].get(name, 0) + 1
+                stats['streak'][name] = stats['streak'].get(name, 0) + 1
+            previous = stats['winner']
+            if hit:
+                stats['hits'][tried[-1]] = stats['hits'].get(tried[-1], 0) + 1
+                stats['streak'].pop(tried[-1], None)
+                if specific:
+                    stats['winner'] = tried[-1]
+            self.dirty = True
+        if self.metrics is not None:
+            for name in misses:
+                self.metrics.increment('selector_misses', field=field, selector=name)
+            if hit:
+                self.metrics.increment('selector_hits', field=field, selector=tried[-1])
+        if hit and specific and previous is not None and previous in misses:
+            self.log(f"Selector for {field} changed on layout {layout!r}: {previous!r} stopped matching, "
+                     f"now using {tried[-1]!r}.")
+
+    def first(self, layout, field, strategies, fallbacks=0, sticky=True):
+        """Run (name, function) strategies and return the first non-None result.
+
+        Fields whose answer differs from card to card, such as the
+        condition, pass sticky=False to be tried by hit rate alone.
+        """
+        functions = dict(strategies)
+        names = [name for name, _ in strategies]
+        catch_all = set(names[len(names) - fallbacks:])
+        ordered, skip = self.order(layout, field, names, fallbacks, sticky)
+        with self.lock:
+            winner = self._field(layout, field)['winner'] if sticky else None
+        tried = []
+        for name in ordered:
+            if tried == [winner]:
+                # The winner just missed, maybe after a layout change: probe every strategy
+                skip = set()
+            if name in skip:
+                continue
+            tried.append(name)
+            result = functions[name]()
+            if result is not None:
+                self.record(layout, field, tried, True, sticky and name not in catch_all)
+                return result
+        self.record(layout, field, tried, False)
+        return None
+
+    def stats(self):
+        """{layout: {field: {'winner': name, 'selectors': {name: (hits, misses)}}}}"""
+        with self.lock:
+            return {layout: {field: {'winner': stats['winner'],
+                                     'selectors': {name: (stats['hits'].get(name, 0), stats['misses'].get(name, 0))
+                                                   for name in dict.fromkeys(list(stats['hits'])
+                                                                             + list(stats['misses']))}}
+                             for field, stats in entry['fields'].items()}
+                    for layout, entry in self.layouts.items()}
+
+    def clear(self):
+        with self.lock:
+            self.layouts.clear()
+            self.dirty = True
+        self.save()
+
+
+class FixedOrder:
+    """Stand-in for SelectorCache that always tries strategies in the given order."""
+
+    def first(self, layout, field, strategies, fallbacks=0, sticky=True):
+        for _, function in strategies:
+            result = function()
+            if result is not None:
+                return result
+        return None
+
+
+def main():
+    if len(sys.argv) not in (2, 3) or sys.argv[1] not in ('stats', 'clear'):
+        print("Usage: python selector_cache.py stats|clear [stats_file]")
+        sys.exit(2)
+    cache = SelectorCache(sys.argv[2] if len(sys.argv) == 3 else DEFAULT_STATS_FILE)
+    if sys.argv[1] == 'clear':
+        cache.clear()
+        print(f"Cleared {cache.path}")
+        return
+    report = cache.stats()
+    if not report:
+        print(f"No selector stats in {cache.path}")
+    for layout, fields in report.items():
+        print(f"Layout {layout!r}:")
+        for field, stats in fields.items():
+            print(f"  {field}:")
+            for name, (hits, misses) in stats['selectors'].items():
+                marker = '*' if name == stats['winner'] else ' '
+                print(f"   {marker} {hits:>7} hits {misses:>7} misses  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+import logging
+import queue
+import threading
+import time
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+# ...and photo captions longer than this
+MAX_CAPTION_LENGTH = 1024
+# sendMediaGroup takes at most this many photos
+MAX_ALBUM_SIZE = 10
+DIGEST_SEPARATOR = "\n\n"
+
+
+class TokenBucket:
+    """Allows `rate` sends per second on average, with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        # After a 429 the server tells us how long to stay quiet; drain the bucket for that long
+        with self.lock:
+            self.tokens = -seconds * self.rate
+            self.updated = time.monotonic()
+
+
+def retry_after_seconds(error):
+    """Return Telegram's retry_after for a 429 error, or None for any other error."""
+    if getattr(error, 'error_code', None) != 429:
+        return None
+    parameters = (getattr(error, 'result_json', None) or {}).get('parameters') or {}
+    return parameters.get('retry_after', 1)
+
+
+def send_photos(bot, chat_id, photos):
+    """Send (caption, image bytes) pairs: sendPhoto for one, sendMediaGroup for an album."""
+    if len(photos) == 1:
+        caption, image = photos[0]
+        bot.send_photo(chat_id, image, caption=caption)
+        return
+    from telebot.types import InputMediaPhoto
+    bot.send_media_group(chat_id, [InputMediaPhoto(image, caption=caption) for caption, image in photos])
+
+
+class Notification:
+    """A queued message and the photo to send with it, if any.
+
+    `image` is the image's bytes, or a Future that resolves to them (or to
+    None if the download failed). `key` identifies the message to the
+    dispatcher's `on_done` callback.
+    """
+    __slots__ = ('text', 'image', 'key')
+
+    def __init__(self, text, image=None, key=None):
+        self.text = text
+        self.image = image
+        self.key = key
+
+
+class TelegramDispatcher:
+    """Sends Telegram messages from a background thread.
+
+    The scrape loop calls enqueue() and carries on; the worker thread sends in
+    order, paced by a token bucket, retrying 429s after Telegram's retry_after
+    and other failures with exponential backoff. When `digest_threshold` or
+    more messages are waiting, up to `digest_size` of them go out as one
+    combined message.
+
+    With `send_album` set, messages that come with a photo are sent through
+    it instead, as a list of (caption, image bytes) pairs: one photo on its
+    own, or a whole digest's worth as albums of up to `album_size`.
+
+    `on_done` is called from the worker thread with the keys of the messages
+    in each send that succeeded. Messages that were given up on are not
+    reported, so their journal entries stay pending.
+    """
+
+    def __init__(self, send, rate=1.0, burst=3, digest_threshold=0, digest_size=10,
+                 max_retries=5, backoff=2.0, log=logging.info, send_album=None,
+                 album_size=MAX_ALBUM_SIZE, image_timeout=30, on_done=None):
+        self.send = send
+        self.on_done = on_done
+        self.send_album = send_album
+        self.album_size = min(album_size, MAX_ALBUM_SIZE)
+        self.image_timeout = image_timeout
+        self.bucket = TokenBucket(rate, burst)
+        self.digest_threshold = digest_threshold
+        self.digest_size = digest_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.log = log
+        self.queue = queue.Queue()
+        self.sent = 0
+        self.failed = 0
+        self._held = []
+        self.worker = threading.Thread(target=self._run, name="telegram-dispatcher", daemon=True)
+        self.worker.start()
+
+    def enqueue(self, message, image=None, key=None):
+        self.queue.put(Notification(message, image, key))
+
+    def pending(self):
+        return self.queue.qsize()
+
+    def flush(self, timeout=None):
+        """Block until every queued message has been sent or given up on."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def stop(self, timeout=None):
+        self.flush(timeout)
+        self.queue.put(None)
+        self.worker.join(timeout)
+
+    def _take(self, block):
+        # A message held back from the previous digest goes first, keeping order
+        if self._held:
+            return self._held.pop()
+        return self.queue.get() if block else self.queue.get_nowait()
+
+    def _next_batch(self):
+        first = self._take(block=True)
+        if first is None:
+            return None
+        batch = [first]
+        if self.digest_threshold and len(self._held) + self.queue.qsize() + 1 >= self.digest_threshold:
+            length = len(first.text)
+            while len(batch) < self.digest_size:
+                try:
+                    notification = self._take(block=False)
+                except queue.Empty:
+                    break
+                if (notification is None
+                        or length + len(DIGEST_SEPARATOR) + len(notification.text) > MAX_MESSAGE_LENGTH):
+                    self._held.append(notification)
+                    break
+                batch.append(notification)
+                length += len(DIGEST_SEPARATOR) + len(notification.text)
+        return batch
+
+    def _image(self, notification):
+        """The notification's photo as bytes, or None to send it as text."""
+        image = notification.image
+        if image is None or self.send_album is None:
+            return None
+        if hasattr(image, 'result'):
+            try:
+                image = image.result(timeout=self.image_timeout)
+            except Exception as e:
+                self.log(f"Photo not ready, sending the listing as text: {str(e)}")
+                return None
+        return image
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                self.queue.task_done()
+                return
+            photos = []
+            photo_keys = []
+            texts = []
+            text_keys = []
+            for notification in batch:
+                image = self._image(notification)
+                if image:
+                    photos.append((notification.text[:MAX_CAPTION_LENGTH], image))
+                    photo_keys.append(notification.key)
+                else:
+                    texts.append(notification.text)
+                    text_keys.append(notification.key)
+            for start in range(0, len(photos), self.album_size):
+                album = photos[start:start + self.album_size]
+                if self._send_with_retry(lambda album=album: self.send_album(album), len(album)):
+                    self._done(photo_keys[start:start + self.album_size])
+            if texts:
+                if len(texts) == 1:
+                    text = texts[0]
+                else:
+                    text = f"{len(texts)} new listings found!{DIGEST_SEPARATOR}" + DIGEST_SEPARATOR.join(texts)
+                if self._send_with_retry(lambda: self.send(text), len(texts)):
+                    self._done(text_keys)
+            for _ in batch:
+                self.queue.task_done()
+
+    def _done(self, keys):
+        keys = [key for key in keys if key is not None]
+        if keys and self.on_done is not None:
+            try:
+                self.on_done(keys)
+            except Exception as e:
+                self.log(f"Error recording sent Telegram messages: {str(e)}")
+
+    def _send_with_retry(self, deliver, count):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                deliver()
+                self.sent += count
+                return True
+            except Exception as e:
+                retry_after = retry_after_seconds(e)
+                if retry_after is not None:
+                    self.log(f"Telegram rate limit hit; retrying after {retry_after}s.")
+                    self.bucket.pause(retry_after)
+                    continue
+                if attempt == self.max_retries:
+                    break
+                delay = self.backoff ** attempt
+                self.log(f"Error sending Telegram message: {str(e)}. Retrying in {delay:.0f}s...")
+                time.sleep(delay)
+        self.failed += count
+        self.log(f"Giving up on Telegram message after {self.max_retries + 1} attempts.")
+        return False
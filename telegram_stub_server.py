@@ -0,0 +1,219 @@
+"""Local stand-in for the Telegram Bot API, for exercising notifications offline.
+
+Run it directly to push a burst of messages through TelegramDispatcher and
+report throughput, 429 retries and whether delivery order was preserved:
+
+    python telegram_stub_server.py --messages 40 --limit-per-second 5
+    python telegram_stub_server.py --messages 40 --digest-threshold 5 --photos
+"""
+import argparse
+import json
+import tempfile
+import threading
+import time
+import urllib.parse
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_multipart(content_type, body):
+    """Form fields as strings, and uploaded files as {field name: bytes} under '_files'."""
+    message = BytesParser(policy=default_policy).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    params = {'_files': {}}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        payload = part.get_payload(decode=True) or b''
+        if part.get_filename() is not None:
+            params['_files'][name] = payload
+        else:
+            params[name] = payload.decode()
+    return params
+
+
+class TelegramStubServer:
+    """Records every Bot API call and answers like Telegram.
+
+    With `limit_per_second` set, calls beyond that many in a rolling second
+    get a 429 with `retry_after`, the way Telegram rate-limits a chat.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, limit_per_second=None, retry_after=1):
+        self.calls = []
+        self.rejected = 0
+        self.limit_per_second = limit_per_second
+        self.retry_after = retry_after
+        self.lock = threading.Lock()
+        self._recent = []
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.thread = None
+
+    @property
+    def api_url(self):
+        """Value for telebot.apihelper.API_URL."""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot{{0}}/{{1}}"
+
+    def messages(self, method='sendMessage'):
+        with self.lock:
+            return [params for name, params in self.calls if name == method]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _allow(self):
+        if not self.limit_per_second:
+            return True
+        now = time.monotonic()
+        self._recent = [t for t in self._recent if now - t < 1]
+        if len(self._recent) >= self.limit_per_second:
+            return False
+        self._recent.append(now)
+        return True
+
+    def _record(self, method, params):
+        with self.lock:
+            if not self._allow():
+                self.rejected += 1
+                return 429, {'ok': False, 'error_code': 429,
+                             'description': f"Too Many Requests: retry after {self.retry_after}",
+                             'parameters': {'retry_after': self.retry_after}}
+            self.calls.append((method, params))
+            message_id = len(self.calls)
+        message = {'message_id': message_id, 'date': int(time.time()),
+                   'chat': {'id': int(params.get('chat_id', 0) or 0), 'type': 'private'}}
+        if method == 'sendMediaGroup':
+            # One message per photo in the album
+            media = json.loads(params.get('media', '[]'))
+            return 200, {'ok': True, 'result': [
+                dict(message, message_id=message_id * 100 + index, caption=item.get('caption', ''),
+                     photo=[{'file_id': f"photo{message_id}_{index}", 'file_unique_id': f"u{message_id}_{index}",
+                             'width': 1, 'height': 1}])
+                for index, item in enumerate(media)]}
+        if method == 'sendPhoto':
+            return 200, {'ok': True, 'result': dict(
+                message, caption=params.get('caption', ''),
+                photo=[{'file_id': f"photo{message_id}", 'file_unique_id': f"u{message_id}",
+                        'width': 1, 'height': 1}])}
+        return 200, {'ok': True, 'result': dict(message, text=params.get('text', ''))}
+
+    def photos_delivered(self):
+        """Number of photos sent, whether one at a time or in albums."""
+        return (len(self.messages('sendPhoto'))
+                + sum(len(json.loads(params.get('media', '[]'))) for params in self.messages('sendMediaGroup')))
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                self._handle()
+
+            def _handle(self):
+                parsed = urllib.parse.urlparse(self.path)
+                method = parsed.path.rstrip('/').split('/')[-1]
+                params = {key: values[-1] for key, values in urllib.parse.parse_qs(parsed.query).items()}
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                content_type = self.headers.get('Content-Type', '')
+                if body and content_type.startswith('application/x-www-form-urlencoded'):
+                    params.update({key: values[-1] for key, values in
+                                   urllib.parse.parse_qs(body.decode()).items()})
+                elif body and content_type.startswith('multipart/form-data'):
+                    params.update(parse_multipart(content_type, body))
+                elif body:
+                    params['_body'] = body
+                status, payload = stub._record(method, params)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def delivered_texts(stub):
+    """Every message text and photo caption the stub received, in order."""
+    texts = []
+    with stub.lock:
+        calls = list(stub.calls)
+    for method, params in calls:
+        if method == 'sendMessage':
+            texts.extend(params['text'].split('\n\n'))
+        elif method == 'sendPhoto':
+            texts.append(params.get('caption', ''))
+        elif method == 'sendMediaGroup':
+            texts.extend(item.get('caption', '') for item in json.loads(params['media']))
+    return texts
+
+
+def main():
+    import telebot
+    from telebot import apihelper
+    from telegram_dispatcher import TelegramDispatcher, send_photos
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--rate', type=float, default=20.0, help="dispatcher sends per second")
+    parser.add_argument('--burst', type=int, default=5)
+    parser.add_argument('--limit-per-second', type=int, default=10, help="stub 429 threshold")
+    parser.add_argument('--digest-threshold', type=int, default=0)
+    parser.add_argument('--photos', action='store_true',
+                        help="attach a photo from a local image stand-in to each message")
+    args = parser.parse_args()
+
+    stub = TelegramStubServer(limit_per_second=args.limit_per_second).start()
+    apihelper.API_URL = stub.api_url
+    bot = telebot.TeleBot("123:stub")
+    image_site = fetcher = None
+    if args.photos:
+        from carousell_stub_server import CarousellStubServer
+        from image_cache import ImageCache, ImageFetcher
+        image_site = CarousellStubServer().start()
+        fetcher = ImageFetcher(ImageCache(tempfile.mkdtemp(prefix="telegram-stub-images-")), log=print)
+    dispatcher = TelegramDispatcher(lambda text: bot.send_message("42", text),
+                                    rate=args.rate, burst=args.burst,
+                                    digest_threshold=args.digest_threshold, log=print,
+                                    send_album=lambda photos: send_photos(bot, "42", photos))
+
+    start = time.perf_counter()
+    for index in range(args.messages):
+        image = fetcher.prefetch(image_site.image_url(f"{index}.jpg")) if fetcher else None
+        dispatcher.enqueue(f"Listing {index}", image)
+    enqueue_seconds = time.perf_counter() - start
+    dispatcher.stop()
+    total_seconds = time.perf_counter() - start
+    stub.stop()
+
+    delivered = [text for text in delivered_texts(stub) if text.startswith('Listing ')]
+    expected = [f"Listing {index}" for index in range(args.messages)]
+    print(f"Enqueued {args.messages} messages in {enqueue_seconds * 1000:.1f} ms")
+    print(f"Delivered {len(delivered)} listings in {len(stub.calls)} API calls "
+          f"over {total_seconds:.2f}s ({len(delivered) / total_seconds:.1f} listings/s)")
+    if fetcher:
+        fetcher.close()
+        image_site.stop()
+        print(f"Photos: {stub.photos_delivered()} sent in {len(stub.messages('sendMediaGroup'))} albums "
+              f"and {len(stub.messages('sendPhoto'))} single photos; "
+              f"{fetcher.downloads} downloaded, {fetcher.failures} failed")
+    print(f"429 responses: {stub.rejected}, failed sends: {dispatcher.failed}")
+    print(f"Order preserved: {delivered == expected}")
+
+
+if __name__ == "__main__":
+    main()